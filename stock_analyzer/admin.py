@@ -1,6 +1,11 @@
 from django.contrib import admin
-from .models import CompanyTicker, StockDataframe
+from .models import CompanyTicker, StockDataframe, IngestJob, IntradayBlock, LatestQuote, Portfolio, Transaction
 
 # Register your models here.
 admin.site.register(CompanyTicker)
-admin.site.register(StockDataframe)
\ No newline at end of file
+admin.site.register(StockDataframe)
+admin.site.register(IngestJob)
+admin.site.register(IntradayBlock)
+admin.site.register(LatestQuote)
+admin.site.register(Portfolio)
+admin.site.register(Transaction)
\ No newline at end of file
@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class StockAnalyzerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'stock_analyzer'
+
+    def ready(self):
+        from .db import tune_sqlite
+        from .timing import install_query_timer
+        connection_created.connect(tune_sqlite, dispatch_uid='stock_analyzer.tune_sqlite')
+        connection_created.connect(install_query_timer, dispatch_uid='stock_analyzer.install_query_timer')
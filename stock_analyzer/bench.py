@@ -0,0 +1,405 @@
+"""Benchmarks for the data paths of the app, run with manage.py bench."""
+import multiprocessing
+import platform
+import threading
+import time
+import tracemalloc
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from importlib import import_module
+
+import django
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import OperationalError, connection, transaction
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from .ingest import run_pending
+from .models import CompanyTicker, IngestJob, PriceHistoryBlob, StockDataframe
+from .compare import compare_tickers
+from .screener import screen
+from .storage import load_history, load_price_matrix, load_rows
+from .views import build_series, get_stock_df
+
+BENCHMARKS = {}
+# Names manage.py bench runs when none are given, the others only run when named
+DEFAULT_BENCHMARKS = []
+# Tickers bench_concurrency commits, removed again even when a crashed run left them behind
+CONCURRENCY_SYMBOLS = ('benchr', 'benchw')
+
+
+def benchmark(name, default=True):
+    """Registers a benchmark function under name for the bench command, without default it only runs when named."""
+    def register(func):
+        BENCHMARKS[name] = func
+        if default:
+            DEFAULT_BENCHMARKS.append(name)
+        return func
+    return register
+
+def synthetic_history(periods=1260, seed=0, end='2024-10-04'):
+    """Builds a yfinance style daily history frame from a random walk, no network needed."""
+    rng = np.random.default_rng(seed)
+    index = pd.bdate_range(end=end, periods=periods, tz='America/New_York', name='Date')
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.015, periods)))
+    open_ = close * (1 + rng.normal(0, 0.005, periods))
+    spread = np.abs(rng.normal(0, 0.01, periods)) * close
+    return pd.DataFrame({
+        'Open': open_,
+        'High': np.maximum(open_, close) + spread,
+        'Low': np.minimum(open_, close) - spread,
+        'Close': close,
+        'Volume': rng.integers(1_000_000, 50_000_000, periods),
+        'Dividends': 0.0,
+        'Stock Splits': 0.0,
+    }, index=index)
+
+@contextmanager
+def scratch_ticker(symbol='bench'):
+    """Yields a throwaway CompanyTicker, everything written inside the block is rolled back."""
+    with transaction.atomic():
+        try:
+            yield CompanyTicker.objects.create(stock_ticker=symbol)
+        finally:
+            transaction.set_rollback(True)
+
+@contextmanager
+def scratch_tickers(count, rows=1260):
+    """Yields count throwaway CompanyTickers with rows bars of history each, rolled back afterwards."""
+    with transaction.atomic():
+        try:
+            tickers = []
+            for seed in range(count):
+                ticker = CompanyTicker.objects.create(stock_ticker=f'bench{seed}')
+                StockDataframe.objects.ingest_dataframe(ticker, synthetic_history(rows, seed=seed))
+                tickers.append(ticker)
+            yield tickers
+        finally:
+            transaction.set_rollback(True)
+
+def best_of(func, repeat):
+    """Runs func repeat times and returns the fastest wall time in seconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def peak_memory(func):
+    """Runs func once and returns the peak memory it allocated in KiB, as traced by tracemalloc."""
+    tracemalloc.start()
+    try:
+        func()
+        return round(tracemalloc.get_traced_memory()[1] / 1024)
+    finally:
+        tracemalloc.stop()
+
+@benchmark('ingest')
+def bench_ingest(rows=1260, repeat=3):
+    """Compares per row build_database saves against the bulk ingest_dataframe path."""
+    df = synthetic_history(rows)
+
+    def per_row():
+        with scratch_ticker() as ticker:
+            for x in range(len(df)):
+                StockDataframe().build_database(ticker.stock_ticker, df, x)
+
+    def bulk():
+        with scratch_ticker() as ticker:
+            StockDataframe.objects.ingest_dataframe(ticker, df)
+
+    per_row_time = best_of(per_row, repeat)
+    bulk_time = best_of(bulk, repeat)
+    return {
+        'rows': rows,
+        'build_database_rows_per_sec': round(rows / per_row_time),
+        'ingest_dataframe_rows_per_sec': round(rows / bulk_time),
+        'speedup': round(per_row_time / bulk_time, 1),
+    }
+
+@benchmark('storage')
+def bench_storage(repeat=5):
+    """Compares loading 5y and 20y histories from StockDataframe rows and from the packed blob."""
+    results = {}
+    for label, rows in (('5y', 1260), ('20y', 5040)):
+        df = synthetic_history(rows)
+        with scratch_ticker() as ticker:
+            StockDataframe.objects.ingest_dataframe(ticker, df)
+            PriceHistoryBlob.objects.merge_dataframe(ticker, df)
+            for backend in ('orm', 'blob'):
+                with override_settings(STOCK_PRICE_STORAGE=backend):
+                    load = lambda: load_history(ticker)
+                    results[f'{backend}_{label}_ms'] = round(best_of(load, repeat) * 1000, 2)
+                    results[f'{backend}_{label}_peak_kb'] = peak_memory(load)
+    return results
+
+@benchmark('load')
+def bench_load(rows=1260, repeat=5):
+    """Compares the old DataFrame(values()) load against the cursor based load_rows."""
+    df = synthetic_history(rows)
+    with scratch_ticker() as ticker:
+        StockDataframe.objects.ingest_dataframe(ticker, df)
+        values = lambda: pd.DataFrame(StockDataframe.objects.filter(stock_ticker_id=ticker.id).values())
+        close = lambda: load_rows(ticker, fields=['close'])
+        values_time, close_time = best_of(values, repeat), best_of(close, repeat)
+        return {
+            'rows': rows,
+            'values_ms': round(values_time * 1000, 2),
+            'values_peak_kb': peak_memory(values),
+            'load_rows_all_fields_ms': round(best_of(lambda: load_rows(ticker), repeat) * 1000, 2),
+            'load_rows_close_ms': round(close_time * 1000, 2),
+            'load_rows_close_peak_kb': peak_memory(close),
+            'speedup': round(values_time / close_time, 1),
+        }
+
+@benchmark('compare')
+def bench_compare(tickers=25, rows=1260, repeat=3):
+    """Compares aligning closes loaded per ticker against one load_price_matrix query, plus the whole comparison."""
+    with scratch_tickers(tickers, rows) as scratch:
+        per_ticker = lambda: pd.concat({ticker.stock_ticker: load_history(ticker, fields=['close']).close for ticker in scratch}, axis=1)
+        matrix = lambda: load_price_matrix(scratch)
+        per_ticker_time, matrix_time = best_of(per_ticker, repeat), best_of(matrix, repeat)
+        with override_settings(CHART_CACHE_ALIAS='default'):
+            compare_time = best_of(lambda: compare_tickers(scratch) and caches['default'].clear(), repeat)
+        return {
+            'tickers': tickers,
+            'per_ticker_ms': round(per_ticker_time * 1000, 2),
+            'price_matrix_ms': round(matrix_time * 1000, 2),
+            'compare_ms': round(compare_time * 1000, 2),
+            'speedup': round(per_ticker_time / matrix_time, 1),
+        }
+
+@benchmark('screener')
+def bench_screener(tickers=1000, rows=1260, repeat=3):
+    """Times a screen of every stored ticker with the metrics computed from scratch and served from the cache."""
+    expression = 'close > sma_200 and return_1y > 0'
+    with scratch_tickers(tickers, rows), override_settings(CHART_CACHE_ALIAS='default'):
+        cache = caches['default']
+        cold = best_of(lambda: cache.clear() or screen(expression, sort='-return_1y', limit=20), repeat)
+        warm = best_of(lambda: screen(expression, sort='-return_1y', limit=20), repeat)
+        return {
+            'tickers': tickers,
+            'rows': rows,
+            'cold_ms': round(cold * 1000, 2),
+            'cached_ms': round(warm * 1000, 2),
+        }
+
+@benchmark('concurrency', default=False)
+def bench_concurrency(readers=4, seconds=5, rows=5040):
+    """Times chart reads on reader threads while a separate process keeps bulk ingesting and deleting a history.
+
+    Only runs when named: it commits real CONCURRENCY_SYMBOLS rows to the configured database for
+    the duration. Compare runs with SQLITE_JOURNAL_MODE=delete and the default wal.
+    """
+    CompanyTicker.objects.filter(stock_ticker__in=CONCURRENCY_SYMBOLS).delete() # Left behind by a crashed run.
+    read_ticker = CompanyTicker.objects.create(stock_ticker='benchr')
+    StockDataframe.objects.ingest_dataframe(read_ticker, synthetic_history(1260))
+    stop = multiprocessing.get_context('fork').Event()
+    latencies, errors, updates = [], [], []
+
+    def update():
+        # A small write racing the ingest, like a job status or session save.
+        try:
+            while not stop.is_set():
+                start = time.perf_counter()
+                try:
+                    CompanyTicker.objects.filter(pk=read_ticker.pk).update(company_name=f'{start:.6f}'[-20:])
+                except OperationalError:
+                    errors.append(1)
+                updates.append(time.perf_counter() - start)
+                time.sleep(0.01)
+        finally:
+            connection.close()
+
+    def read():
+        try:
+            while not stop.is_set():
+                start = time.perf_counter()
+                try:
+                    load_history(read_ticker, fields=['close'])
+                except OperationalError:
+                    errors.append(1)
+                latencies.append(time.perf_counter() - start)
+        finally:
+            connection.close()
+
+    connection.close() # The writer process opens its own.
+    writer = multiprocessing.get_context('fork').Process(target=_keep_ingesting, args=(stop, rows))
+    threads = [threading.Thread(target=update)] + [threading.Thread(target=read) for _ in range(readers)]
+    try:
+        writer.start()
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+        writer.join()
+        CompanyTicker.objects.filter(stock_ticker__in=CONCURRENCY_SYMBOLS).delete()
+    latencies, updates = np.array(latencies) * 1000, np.array(updates) * 1000
+    return {
+        'database': _database_mode(),
+        'readers': readers,
+        'reads_per_sec': round(len(latencies) / seconds),
+        'read_p50_ms': round(float(np.percentile(latencies, 50)), 2) if len(latencies) else None,
+        'read_p99_ms': round(float(np.percentile(latencies, 99)), 2) if len(latencies) else None,
+        'read_max_ms': round(float(latencies.max()), 2) if len(latencies) else None,
+        'update_p50_ms': round(float(np.percentile(updates, 50)), 2) if len(updates) else None,
+        'update_max_ms': round(float(updates.max()), 2) if len(updates) else None,
+        'locked_errors': len(errors),
+    }
+
+@benchmark('paths')
+def bench_paths(scales=(1, 100, 1000), rows=1260, repeat=3):
+    """Times ingestion, the series builder and whole responses through the test client with 1, 100 and 1,000 stored tickers.
+
+    Every scale runs on its own scratch tickers, rolled back afterwards, and the chart cache is
+    cleared before each timed call so every run does the full work.
+    """
+    return {str(scale): _bench_paths_at(scale, rows, repeat) for scale in scales}
+
+def _bench_paths_at(scale, rows, repeat):
+    cache = caches['default']
+    ms = lambda func: round(best_of(lambda: cache.clear() or func(), repeat) * 1000, 2)
+    df = synthetic_history(min(rows, 250), seed=scale)
+
+    def per_row():
+        with scratch_ticker('benchrow'):
+            for x in range(len(df)):
+                StockDataframe().build_database('benchrow', df, x)
+
+    start = time.perf_counter()
+    with scratch_tickers(scale, rows) as tickers, override_settings(CHART_CACHE_ALIAS='default', CHART_WORKER_THREADS=0):
+        ingest_time = time.perf_counter() - start
+        symbol = tickers[-1].stock_ticker # The newest, so lookups can't lean on the first rows stored.
+        user = User.objects.get_or_create(username='bench')[0]
+        user.tickers.add(*tickers)
+        client = Client()
+        client.force_login(user)
+        results = {
+            'tickers': scale,
+            'rows': rows,
+            'ingest_dataframe_rows_per_sec': round(scale * rows / ingest_time),
+            'build_database_rows_per_sec': round(len(df) / best_of(per_row, repeat)),
+            'get_stock_df_ms': ms(lambda: get_stock_df(symbol)),
+            'build_series_ms': ms(lambda: build_series(tickers[-1])),
+            'build_series_split_ms': ms(lambda: build_series(tickers[-1], period='year')),
+        }
+        pages = {
+            'hub': reverse('hub'),
+            'five_year': reverse('five_year', args=[symbol]),
+            'five_year_split': reverse('five_year_split', args=[symbol]),
+            'series': reverse('series', args=[symbol]),
+            'series_split': reverse('series', args=[symbol]) + '?period=year',
+        }
+        for name, url in pages.items():
+            results[f'view_{name}_ms'] = ms(lambda: _get_ok(client, url))
+        return results
+
+def _get_ok(client, url):
+    response = client.get(url)
+    if response.status_code != 200:
+        raise RuntimeError(f"{url} answered {response.status_code}")
+    return response
+
+def _keep_ingesting(stop, rows):
+    df = synthetic_history(rows, seed=1)
+    try:
+        while not stop.is_set():
+            ticker = CompanyTicker.objects.create(stock_ticker='benchw')
+            StockDataframe.objects.ingest_dataframe(ticker, df)
+            ticker.delete()
+    finally:
+        connection.close()
+
+def environment():
+    """The database and library versions a benchmark run used, stored with its JSON results."""
+    return {
+        'database': _database_mode(),
+        'python': platform.python_version(),
+        'django': django.__version__,
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'price_storage': settings.STOCK_PRICE_STORAGE,
+    }
+
+def _database_mode():
+    if connection.vendor != 'sqlite':
+        return connection.vendor
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode')
+        return f'sqlite {cursor.fetchone()[0]}'
+
+@benchmark('fetch')
+def bench_fetch(tickers=8, latency=0.25):
+    """Runs queued ingest jobs against a fetcher with simulated network latency, one at a time and fanned out."""
+    def slow_fetcher(stock_ticker):
+        time.sleep(latency)
+        return synthetic_history(250)
+
+    results = {'tickers': tickers, 'latency_ms': round(latency * 1000)}
+    for label, concurrency in (('serial', 1), ('concurrent', settings.INGEST_FETCH_CONCURRENCY)):
+        with transaction.atomic():
+            for i in range(tickers):
+                IngestJob.objects.create(stock_ticker=f'bench{i}')
+            with override_settings(INGEST_FETCH_CONCURRENCY=concurrency):
+                start = time.perf_counter()
+                run_pending(slow_fetcher)
+                results[f'{label}_ms'] = round((time.perf_counter() - start) * 1000)
+            transaction.set_rollback(True)
+    results['speedup'] = round(results['serial_ms'] / results['concurrent_ms'], 1)
+    return results
+
+def load_test(base_url, paths, concurrency=16, requests=400, session_key=None):
+    """Sends requests GETs spread over paths from concurrency threads to a running server.
+
+    Returns throughput and latency percentiles, for comparing the same app served by a WSGI and an ASGI server.
+    """
+    headers = {'Accept-Encoding': 'gzip'}
+    if session_key:
+        headers['Cookie'] = f'{settings.SESSION_COOKIE_NAME}={session_key}'
+    urls = [base_url.rstrip('/') + paths[i % len(paths)] for i in range(requests)]
+
+    def get(url):
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=60) as response:
+                response.read()
+                ok = response.status == 200
+        except (OSError, urllib.error.HTTPError):
+            ok = False
+        return time.perf_counter() - start, ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(get, urls))
+    elapsed = time.perf_counter() - start
+    latencies = np.array([latency for latency, _ in results]) * 1000
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        'requests_per_sec': round(requests / elapsed, 1),
+        'p50_ms': round(float(np.percentile(latencies, 50)), 1),
+        'p95_ms': round(float(np.percentile(latencies, 95)), 1),
+        'errors': sum(not ok for _, ok in results),
+    }
+
+def login_session(username):
+    """Creates a logged in session for an existing user without their password, returns its key."""
+    user = User.objects.get(username=username)
+    session = import_module(settings.SESSION_ENGINE).SessionStore()
+    session[SESSION_KEY] = str(user.pk)
+    session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+    session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    session.create()
+    return session.session_key
@@ -0,0 +1,216 @@
+"""Streams price history between CSV/Parquet files and the database, for the import_prices and export_prices commands.
+
+Files are long format, one bar per line: ticker, date and the PRICE_FIELDS columns (yfinance
+style names like 'Stock Splits' are accepted too). Both directions work in chunks of rows so
+memory stays bounded by the chunk size, not the file size. Imports hand every chunk's rows to
+worker processes by ticker, so one ticker is always written by the same worker, and each
+ticker's rows are upserted in executemany batches inside a transaction.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from pathlib import Path
+import time
+import zlib
+
+from django.conf import settings
+from django.db import connection, transaction
+import pandas as pd
+
+from .columnar import PRICE_FIELDS
+from .models import HISTORY_COLUMNS, CompanyTicker, PriceHistoryBlob, StockDataframe, normalize_symbol
+from .rollups import update_rollups
+from .storage import load_rows
+
+EXPORT_COLUMNS = ('ticker', 'date', *PRICE_FIELDS)
+# StockDataframe field -> yfinance column ingest_dataframe reads
+FIELD_COLUMNS = {field: column for column, field in HISTORY_COLUMNS.items()}
+FORMATS = {'.csv': 'csv', '.gz': 'csv', '.parquet': 'parquet', '.pq': 'parquet'}
+CHUNK_ROWS = 100_000
+# Chunks queued per worker before reading more of the file
+MAX_PENDING = 2
+
+
+def file_format(path, format=None):
+    """'csv' or 'parquet', given or from the file's extension."""
+    format = format or FORMATS.get(Path(path).suffix.lower())
+    if format not in ('csv', 'parquet'):
+        raise ValueError(f"Can't tell the format of {path}, pass csv or parquet.")
+    return format
+
+def parquet():
+    """pyarrow.parquet, only imported when a Parquet file is read or written."""
+    try:
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Parquet files need pyarrow, install it with pip install pyarrow.")
+    return pyarrow.parquet
+
+def read_chunks(path, format=None, chunk_rows=CHUNK_ROWS):
+    """Yields the file's bars as frames of up to chunk_rows rows with normalized columns and UTC dates."""
+    if file_format(path, format) == 'csv':
+        chunks = pd.read_csv(path, chunksize=chunk_rows)
+    else:
+        chunks = (batch.to_pandas() for batch in parquet().ParquetFile(path).iter_batches(batch_size=chunk_rows))
+    for df in chunks:
+        df.columns = df.columns.str.strip().str.lower().str.replace(' ', '_')
+        missing = {'ticker', 'date', 'close'} - set(df.columns)
+        if missing:
+            raise ValueError(f"{path} has no {', '.join(sorted(missing))} column.")
+        df['ticker'] = df.ticker.map(normalize_symbol)
+        df['date'] = pd.to_datetime(df.date, utc=True, format='ISO8601')
+        yield df[[column for column in EXPORT_COLUMNS if column in df.columns]]
+
+def import_frame(df, batch_size=500):
+    """Upserts a chunk's bars ticker by ticker, returns {symbol: (rows, earliest date)}."""
+    imported = {}
+    for symbol, bars in df.groupby('ticker', sort=False):
+        ticker, _ = CompanyTicker.objects.get_or_create_symbol(symbol)
+        bars = bars.drop(columns='ticker').set_index('date').sort_index()
+        imported[symbol] = (upsert_bars(ticker, bars, batch_size), bars.index[0])
+    return imported
+
+def upsert_bars(ticker, bars, batch_size=500):
+    """Writes a CompanyTicker's bars (a date indexed frame of PRICE_FIELDS) in one transaction, returns the row count.
+
+    Does what ingest_dataframe(upsert=True) does, but sends plain tuples to executemany instead
+    of building and compiling a model instance per row, which costs far more than the write
+    at import sizes and would be done while holding SQLite's write lock.
+    """
+    fields = [field for field in PRICE_FIELDS if field in bars.columns]
+    values = bars[fields].astype(object).where(bars[fields].notna(), None).to_numpy().tolist()
+    dates = [connection.ops.adapt_datetimefield_value(date) for date in bars.index.to_pydatetime()]
+    rows = [(ticker.id, date, *row) for date, row in zip(dates, values)]
+    sql = _upsert_sql(fields)
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), batch_size):
+                cursor.executemany(sql, rows[start:start + batch_size])
+        if settings.STOCK_PRICE_STORAGE == 'blob':
+            PriceHistoryBlob.objects.merge_dataframe(ticker, bars.rename(columns=FIELD_COLUMNS))
+        CompanyTicker.objects.bump_version(ticker.pk, bars.index[0].to_pydatetime())
+    return len(rows)
+
+def _upsert_sql(fields):
+    """INSERT of one StockDataframe row that updates fields of the row already stored for its (ticker, date)."""
+    quote = connection.ops.quote_name
+    columns = ['stock_ticker_id', 'date', *fields]
+    return (
+        f"INSERT INTO {quote(StockDataframe._meta.db_table)} ({', '.join(map(quote, columns))}) "
+        f"VALUES ({', '.join(['%s'] * len(columns))}) "
+        f"ON CONFLICT ({quote('stock_ticker_id')}, {quote('date')}) "
+        f"DO UPDATE SET {', '.join(f'{quote(field)} = excluded.{quote(field)}' for field in fields)}"
+    )
+
+def finish_import(earliest):
+    """Updates the rollups of every {symbol: earliest imported date}.
+
+    The rows were committed chunk by chunk before, so the data version is bumped again in the
+    rollups' transaction and charts cached from the old rollups in between aren't served.
+    """
+    for symbol, since in earliest.items():
+        ticker = CompanyTicker.objects.get_by_symbol(symbol)
+        with transaction.atomic():
+            update_rollups(ticker, since=since)
+            CompanyTicker.objects.bump_version(ticker.pk, since)
+
+def import_prices(path, format=None, chunk_rows=CHUNK_ROWS, batch_size=500, workers=0, progress=None):
+    """Imports a CSV or Parquet file of bars, returns rows, tickers, seconds and rows_per_sec.
+
+    With workers > 0 tickers are spread over that many forked processes, 0 imports in this
+    process (and its transaction). progress is called with the rows read so far after every chunk.
+    """
+    start = time.perf_counter()
+    earliest, rows, read = {}, 0, 0
+
+    def collect(imported):
+        nonlocal rows
+        for symbol, (count, since) in imported.items():
+            rows += count
+            earliest[symbol] = min(since, earliest.get(symbol, since))
+
+    if workers <= 0:
+        for df in read_chunks(path, format, chunk_rows):
+            collect(import_frame(df, batch_size))
+            read += len(df)
+            if progress:
+                progress(read)
+        finish_import(earliest)
+    else:
+        connection.close() # Forked workers must not share it.
+        context = multiprocessing.get_context('fork')
+        pools = [ProcessPoolExecutor(max_workers=1, mp_context=context) for _ in range(workers)]
+        pending = [[] for _ in pools]
+        try:
+            for df in read_chunks(path, format, chunk_rows):
+                parts = df.ticker.map(lambda symbol: zlib.crc32(symbol.encode()) % workers)
+                for worker, part in df.groupby(parts):
+                    if len(pending[worker]) >= MAX_PENDING:
+                        collect(pending[worker].pop(0).result())
+                    pending[worker].append(pools[worker].submit(import_frame, part, batch_size))
+                read += len(df)
+                if progress:
+                    progress(read)
+            for futures in pending:
+                for future in futures:
+                    collect(future.result())
+            by_worker = [{} for _ in pools]
+            for symbol, since in earliest.items():
+                by_worker[zlib.crc32(symbol.encode()) % workers][symbol] = since
+            for future in [pool.submit(finish_import, part) for pool, part in zip(pools, by_worker)]:
+                future.result()
+        finally:
+            for pool in pools:
+                pool.shutdown(cancel_futures=True)
+    seconds = time.perf_counter() - start
+    return {'rows': rows, 'tickers': len(earliest), 'seconds': round(seconds, 2), 'rows_per_sec': round(rows / seconds) if seconds else rows}
+
+def export_prices(path, stock_tickers=None, format=None, chunk_rows=CHUNK_ROWS, progress=None):
+    """Writes the stored bars of the given tickers (default all) to a CSV or Parquet file, returns rows, tickers, seconds and rows_per_sec.
+
+    Tickers are read one at a time and written whenever chunk_rows bars have been collected,
+    progress is called with the rows written so far after every write.
+    """
+    format = file_format(path, format)
+    start = time.perf_counter()
+    tickers = CompanyTicker.objects.order_by('stock_ticker')
+    if stock_tickers:
+        tickers = tickers.filter(stock_ticker__in=[normalize_symbol(t) for t in stock_tickers])
+    writer = None
+    buffered, rows, count = [], 0, 0
+
+    def flush():
+        nonlocal writer
+        df = pd.concat(buffered)
+        df['volume'] = df.volume.astype('Int64')
+        if format == 'csv':
+            df.to_csv(path, mode='w' if writer is None else 'a', header=writer is None, index=False)
+            writer = True
+        else:
+            import pyarrow
+            table = pyarrow.Table.from_pandas(df, preserve_index=False)
+            writer = writer or parquet().ParquetWriter(path, table.schema)
+            writer.write_table(table)
+        buffered.clear()
+
+    if format == 'parquet':
+        parquet() # Fail before reading anything.
+    try:
+        for ticker in tickers.iterator():
+            df = load_rows(ticker).reset_index()
+            if df.empty:
+                continue
+            df.insert(0, 'ticker', ticker.stock_ticker)
+            buffered.append(df[list(EXPORT_COLUMNS)])
+            rows += len(df)
+            count += 1
+            if sum(len(part) for part in buffered) >= chunk_rows:
+                flush()
+                if progress:
+                    progress(rows)
+        if buffered:
+            flush()
+    finally:
+        if format == 'parquet' and writer is not None:
+            writer.close()
+    seconds = time.perf_counter() - start
+    return {'rows': rows, 'tickers': count, 'seconds': round(seconds, 2), 'rows_per_sec': round(rows / seconds) if seconds else rows}
@@ -0,0 +1,40 @@
+"""Caches rendered charts per ticker, chart type and the ticker's data version.
+
+Ingestion bumps CompanyTicker.data_version, so a refresh makes the old entries unreachable and
+the size bounded cache backend evicts them.
+"""
+from collections import Counter
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import caches
+
+_stats = Counter()
+_stats_lock = Lock()
+
+
+def cached_chart(ticker, kind, build, *params):
+    """Returns the cached chart for the CompanyTicker, calling build() to render it on a miss.
+
+    params are any other inputs of the chart (date range, fields) and become part of the key.
+    """
+    cache = caches[settings.CHART_CACHE_ALIAS]
+    key = ':'.join(['chart', ticker.stock_ticker, kind, *map(_key_part, params)])
+    chart = cache.get(key, version=ticker.data_version)
+    with _stats_lock:
+        _stats['hits' if chart is not None else 'misses'] += 1
+    if chart is None:
+        chart = build()
+        cache.set(key, chart, version=ticker.data_version)
+    return chart
+
+def chart_cache_stats():
+    """Returns this process's chart cache hit and miss counts."""
+    with _stats_lock:
+        hits, misses = _stats['hits'], _stats['misses']
+    return {'hits': hits, 'misses': misses, 'hit_rate': hits / (hits + misses) if hits + misses else 0.0}
+
+def _key_part(value):
+    if value is None:
+        return ''
+    return value.isoformat() if hasattr(value, 'isoformat') else str(value)
@@ -0,0 +1,54 @@
+"""Packs daily price history into one flat array of fixed size records per ticker."""
+import numpy as np
+
+from .lazy import LazyModule
+
+pd = LazyModule('pandas')
+
+# One record per bar, dates are UTC nanoseconds so the array sorts and searches by date.
+PRICE_DTYPE = np.dtype([
+    ('date', '<i8'),
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('volume', '<i8'),
+    ('dividends', '<f8'),
+    ('stock_splits', '<f8'),
+])
+PRICE_FIELDS = PRICE_DTYPE.names[1:]
+
+
+def frame_to_records(df, columns):
+    """Converts a history frame to a date sorted record array, columns maps frame column -> field."""
+    records = np.zeros(len(df), dtype=PRICE_DTYPE)
+    records['date'] = pd.DatetimeIndex(df.index).tz_convert('UTC').as_unit('ns').asi8
+    for column, field in columns.items():
+        if column in df.columns:
+            values = df[column].to_numpy(dtype='float64', na_value=np.nan)
+            records[field] = np.nan_to_num(values) if field == 'volume' else values
+    return np.sort(records, order='date')
+
+def merge_records(old, new):
+    """Combines two record arrays, bars in new replace bars in old with the same date."""
+    combined = np.concatenate([new, old])
+    _, first = np.unique(combined['date'], return_index=True) # Sorted by date, new wins on ties.
+    return combined[first]
+
+def unpack(data, start=None, end=None):
+    """Returns a read only view of the records in data with start <= date < end, without copying."""
+    records = np.frombuffer(data, dtype=PRICE_DTYPE)
+    lo = 0 if start is None else np.searchsorted(records['date'], _nanoseconds(start))
+    hi = len(records) if end is None else np.searchsorted(records['date'], _nanoseconds(end))
+    return records[lo:hi]
+
+def records_to_frame(records, fields=PRICE_FIELDS):
+    """Builds a date indexed DataFrame of typed float/int columns from records."""
+    index = pd.DatetimeIndex(records['date'].astype('datetime64[ns]'), name='date').tz_localize('UTC')
+    return pd.DataFrame({field: records[field] for field in fields}, index=index)
+
+def _nanoseconds(value):
+    timestamp = pd.Timestamp(value)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.tz_localize('UTC')
+    return timestamp.as_unit('ns').value
@@ -0,0 +1,64 @@
+"""Compares many tickers' closes loaded with one query and aligned on date."""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+import numpy as np
+
+from .indicators import TRADING_DAYS
+from .lazy import LazyModule
+from .storage import load_price_matrix
+from .timing import stage
+
+pd = LazyModule('pandas')
+
+# ?normalize= values -> label
+NORMALIZATIONS = {'rebase': 'Rebased to 100', 'return': '% return'}
+
+
+def normalize_closes(closes, how='rebase'):
+    """Scales every column by its first close, to 100 ('rebase') or to the % change since then ('return')."""
+    rebased = closes / closes.bfill().iloc[0] * 100
+    return rebased if how == 'rebase' else rebased - 100
+
+def performance_table(closes):
+    """Per symbol total and annualized return, annualized volatility, max drawdown and return relative to the group's mean."""
+    first, last = closes.bfill().iloc[0], closes.ffill().iloc[-1]
+    total = last / first - 1
+    years = closes.notna().sum() / TRADING_DAYS
+    log_returns = np.log(closes).diff()
+    table = pd.DataFrame({
+        'total_return': total,
+        'annual_return': (1 + total) ** (1 / years.where(years > 0)) - 1,
+        'volatility': log_returns.std() * np.sqrt(TRADING_DAYS),
+        'max_drawdown': (closes / closes.cummax() - 1).min(),
+    })
+    table['relative_return'] = table.total_return - table.total_return.mean()
+    return table
+
+def compare_tickers(tickers, start=None, end=None, how='rebase'):
+    """Returns {'series': normalized closes, 'correlation': matrix of daily returns, 'performance': table} for the CompanyTickers.
+
+    Cached with every ticker's data version, so a refresh of any of them computes a new one.
+    """
+    tickers = sorted(tickers, key=lambda ticker: ticker.stock_ticker)
+    cache = caches[settings.CHART_CACHE_ALIAS]
+    state = ','.join(f'{ticker.stock_ticker}.{ticker.data_version}' for ticker in tickers)
+    key = ':'.join([
+        'compare', how, '' if start is None else start.isoformat(), '' if end is None else end.isoformat(),
+        hashlib.md5(state.encode()).hexdigest(), # Stays under memcached's key length with many tickers.
+    ])
+    comparison = cache.get(key)
+    if comparison is None:
+        with stage('load'):
+            closes = load_price_matrix(tickers, start, end)['close']
+        with stage('compute'):
+            closes.columns = closes.columns.str.upper()
+            aligned = closes.ffill(limit_area='inside') # Bridge dates only some tickers traded.
+            comparison = {
+                'series': normalize_closes(aligned, how),
+                'correlation': closes.pct_change(fill_method=None).corr(),
+                'performance': performance_table(closes),
+            }
+        cache.set(key, comparison)
+    return comparison
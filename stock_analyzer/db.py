@@ -0,0 +1,11 @@
+"""Per connection database tuning."""
+from django.conf import settings
+
+
+def tune_sqlite(sender, connection, **kwargs):
+    """connection_created receiver, applies settings.SQLITE_PRAGMAS to new SQLite connections."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {pragma} = {value}')
@@ -0,0 +1,75 @@
+"""Reduces long price series to about as many points as the chart can show."""
+import numpy as np
+
+from .lazy import LazyModule
+
+pd = LazyModule('pandas')
+
+METHODS = ('lttb', 'ohlc')
+MIN_POINTS = 50
+MAX_POINTS = 4000
+# Widths are rounded up to a multiple of this, so similar screens share cached series
+WIDTH_STEP = 100
+
+
+def target_points(width):
+    """Points worth sending for a chart width in pixels, about one per pixel within sane bounds."""
+    return int(np.clip(-(-width // WIDTH_STEP) * WIDTH_STEP, MIN_POINTS, MAX_POINTS))
+
+def downsample(df, points, method='lttb'):
+    """Returns df reduced to at most points rows, unchanged if it is already small enough.
+
+    lttb keeps the rows Largest-Triangle-Three-Buckets picks on close (or the first column), for line charts.
+    ohlc aggregates the bars into equal time buckets, for candles.
+    """
+    if points is None or len(df) <= points:
+        return df
+    if method == 'ohlc':
+        return ohlc_buckets(df, points)
+    line = (df['close'] if 'close' in df.columns else df.iloc[:, 0]).dropna()
+    keep = lttb(line.index.asi8.astype('float64'), line.to_numpy(dtype='float64'), points)
+    return df.loc[line.index[keep]]
+
+def lttb(x, y, threshold):
+    """Returns the indices of the threshold points Largest-Triangle-Three-Buckets keeps.
+
+    Only the walk over buckets is a Python loop, each bucket's triangle areas are one numpy op.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    # threshold - 2 buckets between the always kept first and last points.
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    keep = np.empty(threshold, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_hi = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[hi:next_hi].mean(), y[hi:next_hi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+def ohlc_buckets(df, points):
+    """Aggregates bars into points equal width time buckets: first open, max high, min low, last close, summed volume."""
+    ns = df.index.asi8
+    width = -(-(int(ns[-1]) - int(ns[0]) + 1) // points)
+    buckets = (ns - ns[0]) // width
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(ns)] - 1
+    columns = {}
+    for field in df.columns:
+        values = df[field].to_numpy()
+        if field == 'open':
+            columns[field] = values[starts]
+        elif field == 'close':
+            columns[field] = values[ends]
+        elif field == 'high':
+            columns[field] = np.fmax.reduceat(values, starts)
+        elif field == 'low':
+            columns[field] = np.fmin.reduceat(values, starts)
+        else:
+            columns[field] = np.add.reduceat(np.nan_to_num(values), starts)
+    return pd.DataFrame(columns, index=df.index[starts])
@@ -1,10 +1,61 @@
 from django import forms
-from .models import CompanyTicker
+from .compare import NORMALIZATIONS
+from .models import CompanyTicker, Transaction
+from .screener import MAX_EXPRESSION, METRICS, parse_filter
 
 
 class TickerInputForm(forms.Form):
     stock_ticker = forms.CharField(max_length=6)
 
 class TickerCompareForm(forms.Form):
-    ticker1 = forms.ModelChoiceField(CompanyTicker.objects.all())
-    ticker2 = forms.ModelChoiceField(CompanyTicker.objects.all())
+    tickers = forms.ModelMultipleChoiceField(CompanyTicker.objects.all(), widget=forms.CheckboxSelectMultiple)
+    normalize = forms.ChoiceField(choices=NORMALIZATIONS.items(), initial='rebase')
+
+    def __init__(self, user, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['tickers'].queryset = CompanyTicker.objects.filter(users=user)
+
+    def clean_tickers(self):
+        tickers = self.cleaned_data['tickers']
+        if len(tickers) < 2:
+            raise forms.ValidationError("Pick at least two tickers to compare.")
+        return tickers
+
+class TransactionForm(forms.ModelForm):
+    """Buy or sell of one of the user's tickers, a negative quantity sells."""
+
+    class Meta:
+        model = Transaction
+        fields = ['stock_ticker', 'date', 'quantity', 'price']
+        widgets = {'date': forms.DateInput(attrs={'type': 'date'})}
+
+    def __init__(self, user, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['stock_ticker'].queryset = CompanyTicker.objects.filter(users=user)
+
+    def clean_quantity(self):
+        quantity = self.cleaned_data['quantity']
+        if quantity == 0:
+            raise forms.ValidationError("Quantity can't be zero.")
+        return quantity
+
+    def clean_price(self):
+        price = self.cleaned_data['price']
+        if price <= 0:
+            raise forms.ValidationError("Price must be positive.")
+        return price
+
+class ScreenerForm(forms.Form):
+    """Filter expression over the screener METRICS, e.g. close > sma_200 and return_1y > 0.2."""
+    filter = forms.CharField(max_length=MAX_EXPRESSION, required=False, widget=forms.TextInput(attrs={'size': 60, 'placeholder': 'close > sma_200 and return_1y > 0.2'}))
+    sort = forms.ChoiceField(choices=[('', 'Symbol')] + [(f'{order}{metric}', f'{metric} {label}') for metric in METRICS for order, label in (('-', 'high first'), ('', 'low first'))], required=False)
+    limit = forms.IntegerField(min_value=1, required=False)
+
+    def clean_filter(self):
+        expression = self.cleaned_data['filter']
+        if expression.strip():
+            try:
+                parse_filter(expression)
+            except ValueError as exc:
+                raise forms.ValidationError(str(exc))
+        return expression
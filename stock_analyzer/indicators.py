@@ -0,0 +1,134 @@
+"""Technical indicators computed vectorized over stored price history.
+
+Every indicator takes a mapping of price fields, either one ticker's date indexed frame or
+wide date x symbol frames from load_price_matrix for a batch, and returns a dict of named
+outputs of the same shape. Specs name an indicator and its params, e.g. 'sma:50' or 'macd:12:26:9'.
+"""
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+import numpy as np
+
+from .lazy import LazyModule
+from .storage import load_history
+
+pd = LazyModule('pandas')
+
+TRADING_DAYS = 252
+# Params that may be fractional, every other one is a window or period in bars
+FRACTIONAL_PARAMS = {'width'}
+
+
+def sma(prices, window=20):
+    return {'sma': prices['close'].rolling(window).mean()}
+
+def ema(prices, span=20):
+    return {'ema': prices['close'].ewm(span=span, adjust=False).mean()}
+
+def rsi(prices, period=14):
+    """Wilder's relative strength index."""
+    delta = prices['close'].diff()
+    gain = delta.clip(lower=0).ewm(alpha=1 / period, adjust=False).mean()
+    loss = (-delta.clip(upper=0)).ewm(alpha=1 / period, adjust=False).mean()
+    return {'rsi': 100 - 100 / (1 + gain / loss)}
+
+def macd(prices, fast=12, slow=26, signal=9):
+    close = prices['close']
+    line = close.ewm(span=fast, adjust=False).mean() - close.ewm(span=slow, adjust=False).mean()
+    signal_line = line.ewm(span=signal, adjust=False).mean()
+    return {'macd': line, 'signal': signal_line, 'hist': line - signal_line}
+
+def bollinger(prices, window=20, width=2):
+    rolling = prices['close'].rolling(window)
+    mid, std = rolling.mean(), rolling.std(ddof=0)
+    return {'mid': mid, 'upper': mid + width * std, 'lower': mid - width * std}
+
+def atr(prices, period=14):
+    """Wilder's average true range."""
+    previous = prices['close'].shift()
+    true_range = np.fmax(prices['high'] - prices['low'], np.fmax((prices['high'] - previous).abs(), (prices['low'] - previous).abs()))
+    return {'atr': true_range.ewm(alpha=1 / period, adjust=False).mean()}
+
+def returns(prices):
+    return {'returns': prices['close'].pct_change(fill_method=None)}
+
+def log_returns(prices):
+    return {'log_returns': np.log(prices['close']).diff()}
+
+def volatility(prices, window=21):
+    """Rolling standard deviation of daily log returns, annualized."""
+    return {'volatility': np.log(prices['close']).diff().rolling(window).std() * np.sqrt(TRADING_DAYS)}
+
+
+# func, price fields it reads, chart axis ('price' overlays the close, 'secondary' gets its own
+# scale) and how many earlier bars a new bar's value depends on. For recursive (ewm) indicators
+# that is where the seed's weight drops to about e^-20: ten spans, or twenty Wilder periods.
+Indicator = namedtuple('Indicator', 'func fields axis lookback')
+
+INDICATORS = {
+    'sma': Indicator(sma, ('close',), 'price', lambda window=20: window),
+    'ema': Indicator(ema, ('close',), 'price', lambda span=20: 10 * span),
+    'bollinger': Indicator(bollinger, ('close',), 'price', lambda window=20, width=2: window),
+    'rsi': Indicator(rsi, ('close',), 'secondary', lambda period=14: 20 * period),
+    'macd': Indicator(macd, ('close',), 'secondary', lambda fast=12, slow=26, signal=9: 10 * (slow + signal)),
+    'atr': Indicator(atr, ('high', 'low', 'close'), 'secondary', lambda period=14: 20 * period),
+    'returns': Indicator(returns, ('close',), 'secondary', lambda: 1),
+    'log_returns': Indicator(log_returns, ('close',), 'secondary', lambda: 1),
+    'volatility': Indicator(volatility, ('close',), 'secondary', lambda window=21: window + 1),
+}
+
+
+def parse_spec(spec):
+    """Splits 'macd:12:26:9' into ('macd', (12, 26, 9)), raises ValueError for unknown indicators or invalid params."""
+    name, *params = str(spec).split(':')
+    if name not in INDICATORS:
+        raise ValueError(f"Unknown indicator {name!r}")
+    try:
+        params = tuple(int(param) if param.isdigit() else float(param) for param in params)
+    except ValueError:
+        raise ValueError(f"Invalid params in {spec!r}") from None
+    lookback = INDICATORS[name].lookback.__code__
+    if len(params) > lookback.co_argcount:
+        raise ValueError(f"Too many params in {spec!r}")
+    for param, value in zip(lookback.co_varnames, params):
+        if not 0 < value < float('inf') or param not in FRACTIONAL_PARAMS and not isinstance(value, int):
+            raise ValueError(f"{param} must be a positive {'number' if param in FRACTIONAL_PARAMS else 'integer'} in {spec!r}")
+    return name, params
+
+def compute(prices, spec):
+    """Computes the indicator for a single frame or a mapping of wide frames."""
+    name, params = parse_spec(spec)
+    return INDICATORS[name].func(prices, *params)
+
+def ticker_indicator(ticker, spec):
+    """Returns the indicator over the CompanyTicker's whole history as a frame with one column per output.
+
+    Results are cached with the data version they were computed for. When the one write since
+    only added or changed bars from the previous result's last date on, only that tail plus the
+    indicator's lookback is loaded and recomputed, any other change recomputes everything.
+    """
+    name, params = parse_spec(spec)
+    indicator = INDICATORS[name]
+    cache = caches[settings.CHART_CACHE_ALIAS]
+    key = f'indicator:{ticker.stock_ticker}:{spec}'
+    cached = cache.get(key)
+    if cached is not None and cached[0] == ticker.data_version:
+        return cached[1]
+    lookback = indicator.lookback(*params)
+    previous = cached[1] if cached is not None else None
+    appended = (
+        previous is not None and len(previous) > lookback + 1
+        and cached[0] + 1 == ticker.data_version # Versions further apart may hide an older change.
+        and ticker.changed_from is not None and ticker.changed_from >= previous.index[-1]
+    )
+    if appended:
+        # The last stored bar is recomputed too, it may have been corrected by the refresh upsert.
+        tail = load_history(ticker, start=previous.index[-(lookback + 1)], fields=indicator.fields)
+        fresh = pd.DataFrame(compute(tail, spec))
+        keep_from = tail.index[min(lookback, len(tail) - 1)]
+        result = pd.concat([previous[previous.index < keep_from], fresh[fresh.index >= keep_from]])
+    else:
+        result = pd.DataFrame(compute(load_history(ticker, fields=indicator.fields), spec))
+    cache.set(key, (ticker.data_version, result))
+    return result
@@ -0,0 +1,175 @@
+"""Background fetch and store of ticker price history, backed by the IngestJob table."""
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import partial
+import logging
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from .lazy import LazyModule
+from .models import CompanyTicker, IngestJob, StockDataframe, normalize_symbol
+from .providers import exchange_time, get_history
+from .rollups import update_rollups
+from .workers import gather_blocking
+
+pd = LazyModule('pandas')
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def fetch_history(stock_ticker):
+    """Default fetcher, five years of daily bars for a ticker from the configured provider."""
+    return get_history([stock_ticker]).get(stock_ticker, pd.DataFrame())
+
+def enqueue(stock_ticker, user=None):
+    """Returns the active job for the ticker, creating one only if none is pending or running.
+
+    Starts the in-process worker unless the job is being run, a pending job left behind by a
+    restarted process is picked up this way, like a stalled running one.
+    """
+    job, created = IngestJob.objects.get_or_create(
+        stock_ticker=normalize_symbol(stock_ticker), status__in=IngestJob.ACTIVE,
+    )
+    if user is not None:
+        job.users.add(user)
+    if settings.INGEST_WORKER_THREADS > 0 and (job.status == IngestJob.PENDING or job.updated < stalled_before()):
+        transaction.on_commit(start_worker)
+    return job
+
+def start_worker():
+    """Drains the queue on the in-process thread pool."""
+    ingest_executor().submit(_run_pending_in_thread)
+
+def warm_later(tickers):
+    """Warms the CompanyTickers' charts on the in-process thread pool once the current transaction commits."""
+    ids = [ticker.pk for ticker in tickers]
+    if ids and settings.INGEST_WORKER_THREADS > 0:
+        transaction.on_commit(partial(ingest_executor().submit, _warm_in_thread, ids))
+
+def ingest_executor():
+    """The process wide pool for ingestion and warming, created on first use."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.INGEST_WORKER_THREADS, thread_name_prefix='ingest')
+    return _executor
+
+def _run_pending_in_thread():
+    try:
+        run_pending()
+    finally:
+        connection.close()
+
+def _warm_in_thread(ids):
+    from .warm import warm_tickers # warm imports the views, which import this module.
+    try:
+        warm_tickers(CompanyTicker.objects.filter(pk__in=ids))
+    finally:
+        connection.close()
+
+def stalled_before():
+    """Running jobs last updated before this are taken to be abandoned, see settings.INGEST_JOB_TIMEOUT."""
+    return timezone.now() - timedelta(seconds=settings.INGEST_JOB_TIMEOUT)
+
+def claim_next_job():
+    """Marks the oldest pending or stalled running job as running and returns it, None if the queue is empty."""
+    claimable = Q(status=IngestJob.PENDING) | Q(status=IngestJob.RUNNING, updated__lt=stalled_before())
+    for job in IngestJob.objects.filter(claimable).order_by('created')[:10]:
+        # The conditional update only succeeds for one worker per job.
+        now = timezone.now()
+        if IngestJob.objects.filter(pk=job.pk, status=job.status, updated=job.updated).update(status=IngestJob.RUNNING, updated=now):
+            job.status, job.updated = IngestJob.RUNNING, now
+            return job
+    return None
+
+def run_job(job, fetcher=None):
+    """Fetches and stores the job's ticker and adds it to every user who asked for it."""
+    fetcher = fetcher or fetch_history
+    try:
+        df = fetcher(job.stock_ticker)
+        if len(df) == 0:
+            raise ValueError(f"No price history found for {job.stock_ticker.upper()}")
+        with transaction.atomic():
+            ticker, created = CompanyTicker.objects.get_or_create_symbol(job.stock_ticker)
+            if created:
+                job.rows = StockDataframe.objects.ingest_dataframe(ticker, df)
+                update_rollups(ticker)
+                warm_later([ticker])
+            ticker.users.add(*job.users.all())
+            job.status = IngestJob.DONE
+            job.save()
+    except Exception as exc:
+        job.status = IngestJob.FAILED
+        job.error = str(exc)[:200]
+        job.save()
+    return job
+
+def claim_jobs(limit):
+    """Claims up to limit pending jobs, oldest first."""
+    jobs = []
+    while len(jobs) < limit and (job := claim_next_job()) is not None:
+        jobs.append(job)
+    return jobs
+
+def run_pending(fetcher=None):
+    """Runs queued jobs until none are left, returns how many were run.
+
+    Up to settings.INGEST_FETCH_CONCURRENCY claimed jobs fetch their histories at once,
+    storing them stays one job at a time.
+    """
+    fetcher = fetcher or fetch_history
+    count = 0
+    while jobs := claim_jobs(max(settings.INGEST_FETCH_CONCURRENCY, 1)):
+        frames = gather_blocking([(fetcher, job.stock_ticker) for job in jobs], len(jobs))
+        for job, fetched in zip(jobs, frames):
+            run_job(job, partial(_fetched, fetched))
+        count += len(jobs)
+    return count
+
+def _fetched(result, stock_ticker):
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+def refresh_prices(stock_tickers=None, fetcher=None):
+    """Appends bars newer than the last stored date for each ticker, returns rows written per ticker.
+
+    Tickers sharing a last stored date are fetched in one batch call, up to
+    settings.INGEST_FETCH_CONCURRENCY batch calls run at once. The last stored bar is
+    fetched again so a partial day gets corrected by the upsert. A failed batch is logged and
+    left out, the others are still stored and warmed.
+    """
+    fetcher = fetcher or get_history
+    tickers = CompanyTicker.objects.annotate(last_date=Max('stockdataframe__date'))
+    if stock_tickers:
+        tickers = tickers.filter(stock_ticker__in=[normalize_symbol(t) for t in stock_tickers])
+    batches = defaultdict(list)
+    for ticker in tickers:
+        if ticker.last_date is not None:
+            batches[ticker.last_date.date()].append(ticker)
+    # Batches are fetched concurrently, then stored one after another.
+    calls = [(fetcher, [ticker.stock_ticker for ticker in batch], start) for start, batch in batches.items()]
+    results = gather_blocking(calls, settings.INGEST_FETCH_CONCURRENCY)
+    written, refreshed = {}, []
+    for batch, frames in zip(batches.values(), results):
+        if isinstance(frames, Exception):
+            logger.warning("Fetching daily bars of %s failed: %s", ', '.join(str(ticker) for ticker in batch), frames)
+            continue
+        for ticker in batch:
+            df = frames.get(ticker.stock_ticker)
+            if df is None:
+                continue
+            df = exchange_time(df) # Naive daily bars can't be compared with the stored UTC dates.
+            df = df[df.index >= ticker.last_date]
+            # One commit, a chart cached under the new data version can't read the old rollups.
+            with transaction.atomic():
+                written[ticker.stock_ticker] = StockDataframe.objects.ingest_dataframe(ticker, df, upsert=True)
+                update_rollups(ticker, since=ticker.last_date)
+            refreshed.append(ticker)
+    warm_later(refreshed)
+    return written
@@ -0,0 +1,160 @@
+"""Intraday bars kept per ticker, interval and month in IntradayBlock rows.
+
+Reads only load the blocks of the months a range covers. compact_intraday applies
+settings.INTRADAY_RETENTION: bars older than their interval's retention are aggregated into
+the next coarser interval and dropped, so 1m bars become 5m ones, 5m become 1h, and 1h bars
+past theirs are dropped as the daily rows cover that history.
+"""
+from collections import defaultdict
+from datetime import timedelta
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+import numpy as np
+
+from .columnar import PRICE_DTYPE, PRICE_FIELDS, frame_to_records, records_to_frame, unpack
+from .lazy import LazyModule
+from .models import CompanyTicker, IntradayBlock, normalize_symbol
+from .providers import get_history
+from .workers import gather_blocking
+
+pd = LazyModule('pandas')
+
+logger = logging.getLogger(__name__)
+
+# Finest first
+INTRADAY_INTERVALS = (IntradayBlock.MINUTE, IntradayBlock.FIVE_MINUTES, IntradayBlock.HOUR)
+# Interval -> pandas resample rule of its bars
+RESAMPLE_RULES = {'1m': '1min', '5m': '5min', '1h': '1h'}
+# Interval -> the one its bars are compacted into, None drops them
+COARSER = {'1m': '5m', '5m': '1h', '1h': None}
+# Longest requested span an automatically picked interval is used for, daily bars beyond
+AUTO_SPANS = (('1m', timedelta(days=1)), ('5m', timedelta(days=7)), ('1h', timedelta(days=60)))
+BAR_AGGREGATES = {
+    'open': 'first',
+    'high': 'max',
+    'low': 'min',
+    'close': 'last',
+    'volume': 'sum',
+    'dividends': 'sum',
+    'stock_splits': 'max',
+}
+
+
+def load_intraday(ticker, interval, start=None, end=None, fields=PRICE_FIELDS):
+    """Returns the CompanyTicker's interval bars with start <= date < end as a date indexed frame of fields."""
+    blocks = _blocks_in_range(IntradayBlock.objects.filter(stock_ticker=ticker, interval=interval), start, end)
+    parts = [unpack(data, start, end) for data in blocks.order_by('month').values_list('data', flat=True)]
+    records = np.concatenate(parts) if parts else np.zeros(0, dtype=PRICE_DTYPE)
+    return records_to_frame(records, fields)
+
+def store_intraday(ticker, interval, df):
+    """Merges a yfinance history frame of interval bars into the CompanyTicker's blocks, returns the bar count."""
+    if len(df) == 0:
+        return 0
+    with transaction.atomic():
+        IntradayBlock.objects.merge_dataframe(ticker, interval, df)
+        CompanyTicker.objects.bump_version(ticker.pk, df.index.min().to_pydatetime())
+    return len(df)
+
+def resample_records(records, interval):
+    """Aggregates packed bars into interval bars, periods without a trade are left out."""
+    df = records_to_frame(records).resample(RESAMPLE_RULES[interval]).agg(BAR_AGGREGATES)
+    df = df[df.close.notna()]
+    return frame_to_records(df, {field: field for field in PRICE_FIELDS})
+
+def compact_intraday(tickers=None, now=None):
+    """Applies settings.INTRADAY_RETENTION to the CompanyTickers' blocks (all tickers by default).
+
+    Cutoffs fall on midnight UTC so every coarser bar built is complete. Bars already stored in
+    the coarser interval are kept. Returns the number of bars compacted per interval.
+    """
+    now = now or timezone.now()
+    compacted = defaultdict(int)
+    touched = {} # ticker id -> date of its oldest bar compacted
+    for interval in INTRADAY_INTERVALS: # Finest first, 1m bars folded into 5m can move on to 1h in the same run.
+        cutoff = pd.Timestamp(now - timedelta(days=settings.INTRADAY_RETENTION[interval])).tz_convert('UTC').normalize()
+        blocks = IntradayBlock.objects.filter(interval=interval, month__lte=cutoff.date()).select_related('stock_ticker')
+        if tickers is not None:
+            blocks = blocks.filter(stock_ticker__in=tickers)
+        for block in list(blocks.order_by('stock_ticker', 'month')):
+            records = unpack(block.data)
+            old = records[records['date'] < cutoff.value]
+            if not len(old):
+                continue
+            with transaction.atomic():
+                if COARSER[interval] is not None:
+                    IntradayBlock.objects.merge_records(block.stock_ticker, COARSER[interval], resample_records(old, COARSER[interval]), replace=False)
+                kept = records[len(old):]
+                if len(kept):
+                    block.data = kept.tobytes()
+                    block.rows = len(kept)
+                    block.save()
+                else:
+                    block.delete()
+            compacted[interval] += len(old)
+            oldest = pd.Timestamp(old['date'][0], tz='UTC').to_pydatetime()
+            touched[block.stock_ticker_id] = min(oldest, touched.get(block.stock_ticker_id, oldest))
+    for ticker_id, oldest in touched.items():
+        CompanyTicker.objects.bump_version(ticker_id, oldest)
+    return dict(compacted)
+
+def refresh_intraday(stock_tickers=None, intervals=INTRADAY_INTERVALS, fetcher=None):
+    """Fetches intraday bars newer than the last stored one per ticker and interval, returns bars written per (ticker, interval).
+
+    Without stored bars the provider's longest span for the interval is fetched. Tickers sharing
+    an interval and last stored bar are fetched in one batch call, up to
+    settings.INGEST_FETCH_CONCURRENCY batch calls run at once and storing them is one at a time.
+    A failed batch is logged and left out, the others are still stored.
+    """
+    fetcher = fetcher or get_history
+    tickers = CompanyTicker.objects.all()
+    if stock_tickers:
+        tickers = tickers.filter(stock_ticker__in=[normalize_symbol(t) for t in stock_tickers])
+    batches = defaultdict(list)
+    for ticker in tickers:
+        for interval in intervals:
+            batches[interval, last_bar(ticker, interval)].append(ticker)
+    calls = [(fetcher, [ticker.stock_ticker for ticker in batch], start, None, interval) for (interval, start), batch in batches.items()]
+    results = gather_blocking(calls, settings.INGEST_FETCH_CONCURRENCY)
+    written = {}
+    for ((interval, start), batch), frames in zip(batches.items(), results):
+        if isinstance(frames, Exception):
+            logger.warning("Fetching %s bars of %s failed: %s", interval, ', '.join(str(ticker) for ticker in batch), frames)
+            continue
+        for ticker in batch:
+            df = frames.get(ticker.stock_ticker)
+            if df is not None:
+                written[ticker.stock_ticker, interval] = store_intraday(ticker, interval, df)
+    return written
+
+def last_bar(ticker, interval):
+    """Date of the CompanyTicker's newest stored interval bar, None without any."""
+    data = IntradayBlock.objects.filter(stock_ticker=ticker, interval=interval).order_by('-month').values_list('data', flat=True).first()
+    records = unpack(data) if data is not None else ()
+    return pd.Timestamp(records['date'][-1], tz='UTC').to_pydatetime() if len(records) else None
+
+def choose_interval(ticker, start=None, end=None, now=None):
+    """Picks the finest interval for the span start-end that fits AUTO_SPANS and has bars stored, else '1d'."""
+    if start is None:
+        return '1d'
+    span = (end or now or timezone.now()) - start
+    for interval, longest in AUTO_SPANS:
+        if span <= longest and _blocks_in_range(IntradayBlock.objects.filter(stock_ticker=ticker, interval=interval), start, end).exists():
+            return interval
+    return '1d'
+
+def _blocks_in_range(blocks, start, end):
+    """Only the blocks of months overlapping [start, end)."""
+    if start is not None:
+        blocks = blocks.filter(month__gte=_month(start))
+    if end is not None:
+        blocks = blocks.filter(month__lte=_month(end))
+    return blocks
+
+def _month(value):
+    timestamp = pd.Timestamp(value)
+    timestamp = timestamp.tz_localize('UTC') if timestamp.tzinfo is None else timestamp.tz_convert('UTC')
+    return timestamp.date().replace(day=1)
@@ -0,0 +1,24 @@
+"""Modules imported on first use instead of at import time.
+
+pandas takes about half a second to import. Modules only use it inside functions, so they
+bind `pd = LazyModule('pandas')` and processes and requests that never touch price data
+(login, signup, the admin, management commands that don't load bars) never import it.
+"""
+import importlib
+
+
+class LazyModule:
+    """Stands in for the module name, importing it the first time one of its attributes is read."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            # import_module holds the import lock, threads racing here all get the same module.
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+    def __repr__(self):
+        return f'<LazyModule {self._name!r}>'
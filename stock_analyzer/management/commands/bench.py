@@ -0,0 +1,55 @@
+import inspect
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from stock_analyzer.bench import BENCHMARKS, DEFAULT_BENCHMARKS, environment
+
+
+def int_list(value):
+    try:
+        return [int(item) for item in value.split(',')]
+    except ValueError:
+        raise CommandError(f"Expected comma separated numbers, got {value!r}")
+
+
+class Command(BaseCommand):
+    help = "Runs the data path benchmarks against synthetic price history."
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help=f"Benchmarks to run out of {', '.join(BENCHMARKS)}, default {', '.join(DEFAULT_BENCHMARKS)}")
+        parser.add_argument('--rows', type=int, help="Rows of daily history per ticker.")
+        parser.add_argument('--tickers', type=int, help="Stored tickers for the compare and screener benchmarks.")
+        parser.add_argument('--repeat', type=int, help="Runs per measurement, the best one is kept.")
+        parser.add_argument('--scales', type=int_list, help="Stored ticker counts for the paths benchmark, e.g. 1,100,1000.")
+        parser.add_argument('--json', metavar='PATH', help="Also writes the results with the environment as JSON to PATH, - for stdout only.")
+
+    def handle(self, *args, **options):
+        names = options['names'] or DEFAULT_BENCHMARKS
+        unknown = [name for name in names if name not in BENCHMARKS]
+        if unknown:
+            raise CommandError(f"Unknown benchmark(s): {', '.join(unknown)}")
+        results = {}
+        for name in names:
+            func = BENCHMARKS[name]
+            params = inspect.signature(func).parameters
+            kwargs = {key: value for key, value in options.items() if key in params and value is not None}
+            results[name] = result = func(**kwargs)
+            if options['json'] != '-':
+                self.write_result(name, result)
+        if options['json']:
+            report = json.dumps({'created': timezone.now().isoformat(), **environment(), 'results': results}, indent=2)
+            if options['json'] == '-':
+                self.stdout.write(report)
+            else:
+                with open(options['json'], 'w') as f:
+                    f.write(report + '\n')
+
+    def write_result(self, name, result):
+        """One line per benchmark, or per scale for results keyed by scale."""
+        if all(isinstance(value, dict) for value in result.values()):
+            for key, value in result.items():
+                self.write_result(f"{name}[{key}]", value)
+            return
+        self.stdout.write(f"{name}: " + ", ".join(f"{key}={value}" for key, value in result.items()))
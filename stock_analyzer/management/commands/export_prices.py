@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from stock_analyzer.bulk import CHUNK_ROWS, export_prices
+
+
+class Command(BaseCommand):
+    help = "Exports stored bars to a long format CSV or Parquet file that import_prices reads back."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to write, .csv, .csv.gz or .parquet.")
+        parser.add_argument('tickers', nargs='*', help="Tickers to export, default all stored tickers.")
+        parser.add_argument('--format', choices=['csv', 'parquet'], help="Overrides the format taken from the extension.")
+        parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS, help="Rows collected before each write.")
+
+    def handle(self, *args, **options):
+        try:
+            stats = export_prices(
+                options['path'], options['tickers'], options['format'], options['chunk_rows'],
+                progress=lambda rows: self.stdout.write(f"{rows} rows written"),
+            )
+        except (ImportError, OSError, ValueError) as exc:
+            raise CommandError(exc)
+        self.stdout.write(f"Exported {stats['rows']} rows for {stats['tickers']} tickers in {stats['seconds']}s ({stats['rows_per_sec']} rows/s).")
@@ -0,0 +1,26 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from stock_analyzer.bulk import CHUNK_ROWS, import_prices
+
+
+class Command(BaseCommand):
+    help = "Imports bars from a long format CSV or Parquet file (ticker, date, open, high, low, close, volume, ...)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, .csv, .csv.gz or .parquet.")
+        parser.add_argument('--format', choices=['csv', 'parquet'], help="Overrides the format taken from the extension.")
+        parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS, help="Rows read from the file at a time.")
+        parser.add_argument('--batch-size', type=int, default=500, help="Rows per bulk insert.")
+        parser.add_argument('--workers', type=int, default=min(os.cpu_count() or 1, 4), help="Worker processes, 0 imports in this process.")
+
+    def handle(self, *args, **options):
+        try:
+            stats = import_prices(
+                options['path'], options['format'], options['chunk_rows'], options['batch_size'], options['workers'],
+                progress=lambda rows: self.stdout.write(f"{rows} rows read"),
+            )
+        except (ImportError, OSError, ValueError) as exc:
+            raise CommandError(exc)
+        self.stdout.write(f"Imported {stats['rows']} rows for {stats['tickers']} tickers in {stats['seconds']}s ({stats['rows_per_sec']} rows/s).")
@@ -0,0 +1,25 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from stock_analyzer.bench import load_test, login_session
+
+
+class Command(BaseCommand):
+    help = "Load tests a running server, e.g. the same paths under gunicorn (WSGI) and uvicorn (ASGI)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help="Paths to request in turn, e.g. /tickers/amd/series.json")
+        parser.add_argument('--base', default='http://127.0.0.1:8000', help="Server URL.")
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--requests', type=int, default=400)
+        parser.add_argument('--user', help="Existing username to send requests as, a session is created for it.")
+
+    def handle(self, *args, **options):
+        session_key = None
+        if options['user']:
+            try:
+                session_key = login_session(options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"No user {options['user']!r}")
+        result = load_test(options['base'], options['paths'], options['concurrency'], options['requests'], session_key)
+        self.stdout.write(", ".join(f"{key}={value}" for key, value in result.items()))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from stock_analyzer.models import CompanyTicker, HISTORY_COLUMNS, PriceHistoryBlob, normalize_symbol
+from stock_analyzer.storage import load_rows
+
+
+class Command(BaseCommand):
+    help = "Builds the packed PriceHistoryBlob copy of every ticker's stored history."
+
+    def add_arguments(self, parser):
+        parser.add_argument('tickers', nargs='*', help="Tickers to pack, default all stored tickers.")
+
+    def handle(self, *args, **options):
+        tickers = CompanyTicker.objects.all()
+        if options['tickers']:
+            tickers = tickers.filter(stock_ticker__in=[normalize_symbol(t) for t in options['tickers']])
+        columns = {field: column for column, field in HISTORY_COLUMNS.items()}
+        for ticker in tickers:
+            df = load_rows(ticker)
+            if len(df) == 0:
+                continue
+            df = df.rename(columns=columns)
+            with transaction.atomic():
+                blob = PriceHistoryBlob.objects.merge_dataframe(ticker, df)
+            self.stdout.write(f"{ticker}: {blob.rows} rows, {len(blob.data)} bytes")
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from stock_analyzer.models import CompanyTicker, normalize_symbol
+from stock_analyzer.rollups import check_rollups, rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the weekly/monthly rollups and yearly stats from the daily rows, or checks them with --check."
+
+    def add_arguments(self, parser):
+        parser.add_argument('tickers', nargs='*', help="Tickers to rebuild, default all stored tickers.")
+        parser.add_argument('--check', action='store_true', help="Only compare the stored rollups with the daily rows.")
+
+    def handle(self, *args, **options):
+        tickers = CompanyTicker.objects.all()
+        if options['tickers']:
+            tickers = tickers.filter(stock_ticker__in=[normalize_symbol(t) for t in options['tickers']])
+        problems = []
+        for ticker in tickers:
+            if options['check']:
+                problems += check_rollups(ticker)
+            else:
+                rebuild_rollups(ticker)
+                self.stdout.write(f"{ticker}: rebuilt")
+        for problem in problems:
+            self.stderr.write(problem)
+        if problems:
+            raise CommandError(f"{len(problems)} rollup(s) do not match the daily rows.")
+        if options['check']:
+            self.stdout.write("Rollups match the daily rows.")
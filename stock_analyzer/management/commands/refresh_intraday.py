@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from stock_analyzer.intraday import INTRADAY_INTERVALS, compact_intraday, refresh_intraday
+
+
+class Command(BaseCommand):
+    help = "Fetches intraday bars newer than the last stored ones, then compacts bars past their retention."
+
+    def add_arguments(self, parser):
+        parser.add_argument('tickers', nargs='*', help="Tickers to refresh, default all stored tickers.")
+        parser.add_argument('--intervals', default=','.join(INTRADAY_INTERVALS), help="Comma separated intervals to fetch.")
+        parser.add_argument('--no-compact', action='store_true', help="Skip applying INTRADAY_RETENTION.")
+
+    def handle(self, *args, **options):
+        intervals = options['intervals'].split(',')
+        unknown = [interval for interval in intervals if interval not in INTRADAY_INTERVALS]
+        if unknown:
+            raise CommandError(f"Unknown interval(s): {', '.join(unknown)}")
+        written = refresh_intraday(options['tickers'], intervals)
+        for (stock_ticker, interval), bars in sorted(written.items()):
+            self.stdout.write(f"{stock_ticker.upper()} {interval}: {bars} bars")
+        if not options['no_compact']:
+            for interval, bars in compact_intraday().items():
+                self.stdout.write(f"Compacted {bars} {interval} bars")
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from stock_analyzer.ingest import refresh_prices
+
+
+class Command(BaseCommand):
+    help = "Fetches and stores only the bars newer than each ticker's last stored date."
+
+    def add_arguments(self, parser):
+        parser.add_argument('tickers', nargs='*', help="Tickers to refresh, default all stored tickers.")
+
+    def handle(self, *args, **options):
+        written = refresh_prices(options['tickers'])
+        for stock_ticker, rows in sorted(written.items()):
+            self.stdout.write(f"{stock_ticker.upper()}: {rows} rows")
+        self.stdout.write(f"Refreshed {len(written)} tickers, {sum(written.values())} rows.")
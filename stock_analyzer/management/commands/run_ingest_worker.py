@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from stock_analyzer.ingest import claim_next_job, run_job
+
+
+class Command(BaseCommand):
+    help = "Processes queued ticker ingestion jobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Exit when the queue is empty instead of polling.")
+        parser.add_argument('--poll', type=float, default=2.0, help="Seconds to wait between polls of an empty queue.")
+
+    def handle(self, *args, **options):
+        while True:
+            job = claim_next_job()
+            if job is None:
+                if options['once']:
+                    return
+                time.sleep(options['poll'])
+                continue
+            run_job(job)
+            self.stdout.write(f"{job.stock_ticker.upper()}: {job.status} ({job.rows} rows) {job.error}".rstrip())
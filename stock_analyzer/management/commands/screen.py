@@ -0,0 +1,34 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from stock_analyzer.screener import METRICS, screen
+
+
+class Command(BaseCommand):
+    help = "Screens stored tickers with a filter expression, e.g. \"close > sma_200 and return_1y > 0.2\"."
+
+    def add_arguments(self, parser):
+        parser.add_argument('filter', nargs='?', default='', help=f"Expression over the metrics: {', '.join(METRICS)}")
+        parser.add_argument('--sort', help="Metric to sort by, prefixed with - for highest first.")
+        parser.add_argument('--limit', type=int, help="Rows to show.")
+        parser.add_argument('--user', help="Only screen this user's tickers.")
+        parser.add_argument('--json', action='store_true', help="Prints the rows as JSON.")
+
+    def handle(self, *args, **options):
+        if options['sort'] and options['sort'].lstrip('-') not in METRICS:
+            raise CommandError(f"Unknown metric to sort by: {options['sort']}")
+        symbols = None
+        if options['user']:
+            try:
+                symbols = list(User.objects.get(username=options['user']).tickers.values_list('stock_ticker', flat=True))
+            except User.DoesNotExist:
+                raise CommandError(f"No user named {options['user']}")
+        try:
+            table = screen(options['filter'], options['sort'], options['limit'], symbols)
+        except ValueError as exc:
+            raise CommandError(exc)
+        table.index = table.index.str.upper()
+        if options['json']:
+            self.stdout.write(table.reset_index().to_json(orient='records', indent=2))
+        else:
+            self.stdout.write(table.round(4).to_string() if len(table) else "No tickers match.")
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from stock_analyzer.models import CompanyTicker, normalize_symbol
+from stock_analyzer.warm import warm_tickers
+
+
+class Command(BaseCommand):
+    help = "Precomputes the chart series, screener table and portfolio valuations pages ask for first, e.g. after a deploy."
+
+    def add_arguments(self, parser):
+        parser.add_argument('tickers', nargs='*', help="Tickers to warm, default every ticker a user follows.")
+        parser.add_argument('--widths', nargs='+', type=int, help="Chart widths in pixels to warm the five year series for, default CHART_WARM_WIDTHS.")
+
+    def handle(self, *args, **options):
+        tickers = None
+        if options['tickers']:
+            tickers = CompanyTicker.objects.filter(stock_ticker__in=[normalize_symbol(t) for t in options['tickers']])
+        result = warm_tickers(tickers, options['widths'])
+        self.stdout.write(
+            f"Warmed {result['series']} series of {result['tickers']} tickers and "
+            f"{result['portfolios']} portfolios in {result['seconds']}s"
+        )
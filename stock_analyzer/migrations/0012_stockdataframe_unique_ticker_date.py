@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def remove_duplicate_bars(apps, schema_editor):
+    """Keeps the first stored row of every (stock_ticker, date) pair."""
+    StockDataframe = apps.get_model('stock_analyzer', 'StockDataframe')
+    keep = StockDataframe.objects.values('stock_ticker', 'date').annotate(keep_id=Min('id')).values('keep_id')
+    StockDataframe.objects.exclude(id__in=keep).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock_analyzer', '0011_ingestjob'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_bars, migrations.RunPython.noop),
+        migrations.AlterModelOptions(
+            name='stockdataframe',
+            options={'ordering': ['date']},
+        ),
+        migrations.AlterField(
+            model_name='stockdataframe',
+            name='stock_ticker',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='stock_analyzer.companyticker'),
+        ),
+        migrations.AddConstraint(
+            model_name='stockdataframe',
+            constraint=models.UniqueConstraint(fields=('stock_ticker', 'date'), name='unique_stock_ticker_date'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock_analyzer', '0012_stockdataframe_unique_ticker_date'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceHistoryBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.BinaryField()),
+                ('rows', models.IntegerField(default=0)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('stock_ticker', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='price_blob', to='stock_analyzer.companyticker')),
+            ],
+        ),
+    ]
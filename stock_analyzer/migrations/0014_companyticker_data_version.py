@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock_analyzer', '0013_pricehistoryblob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='companyticker',
+            name='data_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
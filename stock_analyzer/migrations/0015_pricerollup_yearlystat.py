@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock_analyzer', '0014_companyticker_data_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('W', 'Week'), ('M', 'Month')], max_length=1)),
+                ('start', models.DateField()),
+                ('open', models.FloatField(null=True)),
+                ('high', models.FloatField(null=True)),
+                ('low', models.FloatField(null=True)),
+                ('close', models.FloatField(null=True)),
+                ('volume', models.BigIntegerField(default=0)),
+                ('stock_ticker', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='stock_analyzer.companyticker')),
+            ],
+            options={
+                'ordering': ['start'],
+                'constraints': [models.UniqueConstraint(fields=('stock_ticker', 'period', 'start'), name='unique_rollup_period')],
+            },
+        ),
+        migrations.CreateModel(
+            name='YearlyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.IntegerField()),
+                ('open', models.FloatField(null=True)),
+                ('high', models.FloatField(null=True)),
+                ('low', models.FloatField(null=True)),
+                ('close', models.FloatField(null=True)),
+                ('max_close', models.FloatField(null=True)),
+                ('annual_return', models.FloatField(null=True)),
+                ('stock_ticker', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='stock_analyzer.companyticker')),
+            ],
+            options={
+                'ordering': ['year'],
+                'constraints': [models.UniqueConstraint(fields=('stock_ticker', 'year'), name='unique_yearly_stat')],
+            },
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:47
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def merge_duplicate_tickers(apps, schema_editor):
+    """Lowercases every symbol and folds tickers sharing one into the first stored of them.
+
+    Users, price rows for dates the kept ticker lacks, transactions and holdings move over.
+    Packed histories and rollups of the duplicates are dropped, pack_prices and
+    rebuild_rollups recreate them for the kept ticker.
+    """
+    CompanyTicker = apps.get_model('stock_analyzer', 'CompanyTicker')
+    StockDataframe = apps.get_model('stock_analyzer', 'StockDataframe')
+    Transaction = apps.get_model('stock_analyzer', 'Transaction')
+    Holding = apps.get_model('stock_analyzer', 'Holding')
+    groups = defaultdict(list)
+    for ticker in CompanyTicker.objects.order_by('id'):
+        groups[ticker.stock_ticker.strip().lower()].append(ticker)
+    for symbol, (keep, *duplicates) in groups.items():
+        for duplicate in duplicates:
+            keep.users.add(*duplicate.users.all())
+            dates = StockDataframe.objects.filter(stock_ticker=keep).values('date')
+            StockDataframe.objects.filter(stock_ticker=duplicate).exclude(date__in=dates).update(stock_ticker=keep)
+            Transaction.objects.filter(stock_ticker=duplicate).update(stock_ticker=keep)
+            for holding in Holding.objects.filter(stock_ticker=duplicate):
+                kept, created = Holding.objects.get_or_create(portfolio=holding.portfolio, stock_ticker=keep)
+                kept.quantity += holding.quantity
+                kept.cost_basis += holding.cost_basis
+                kept.realized_pnl += holding.realized_pnl
+                kept.save()
+            duplicate.delete()
+        if duplicates or keep.stock_ticker != symbol:
+            keep.stock_ticker = symbol
+            keep.data_version += 1
+            keep.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock_analyzer', '0016_portfolio_transaction_holding'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_tickers, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='companyticker',
+            name='stock_ticker',
+            field=models.CharField(max_length=8, unique=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock_analyzer', '0017_companyticker_unique_symbol'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IntradayBlock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('interval', models.CharField(choices=[('1m', '1 minute'), ('5m', '5 minutes'), ('1h', '1 hour')], max_length=2)),
+                ('month', models.DateField()),
+                ('data', models.BinaryField()),
+                ('rows', models.IntegerField(default=0)),
+                ('updated', models.DateTimeField(auto_now=True)),
+                ('stock_ticker', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='stock_analyzer.companyticker')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('stock_ticker', 'interval', 'month'), name='unique_intraday_block')],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock_analyzer', '0018_intradayblock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LatestQuote',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateTimeField()),
+                ('close', models.FloatField()),
+                ('day_change', models.FloatField(null=True)),
+                ('year_change', models.FloatField(null=True)),
+                ('sparkline', models.JSONField(default=list)),
+                ('stock_ticker', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='quote', to='stock_analyzer.companyticker')),
+            ],
+        ),
+    ]
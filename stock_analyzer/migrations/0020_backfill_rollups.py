@@ -0,0 +1,45 @@
+from django.db import migrations, models
+
+
+def daily_bars(StockDataframe, ticker, fields):
+    """The ticker's stored bars as a UTC date indexed float frame of fields, like storage.load_rows."""
+    import pandas as pd # Loading the migrations, e.g. for runserver's check, mustn't import it.
+    rows = StockDataframe.objects.filter(stock_ticker=ticker).order_by('date').values_list('date', *fields)
+    df = pd.DataFrame(list(rows), columns=['date', *fields])
+    df.index = pd.DatetimeIndex(pd.to_datetime(df.pop('date'), utc=True), name='date')
+    return df.astype('float64')
+
+def backfill_rollups(apps, schema_editor):
+    """Aggregates the rollups of tickers stored before update_rollups kept them.
+
+    The data version is bumped so charts cached with the empty rollups aren't served.
+    """
+    from stock_analyzer.rollups import OHLCV, STAT_FIELDS, compute_rollups
+    CompanyTicker = apps.get_model('stock_analyzer', 'CompanyTicker')
+    StockDataframe = apps.get_model('stock_analyzer', 'StockDataframe')
+    PriceRollup = apps.get_model('stock_analyzer', 'PriceRollup')
+    YearlyStat = apps.get_model('stock_analyzer', 'YearlyStat')
+    stored = YearlyStat.objects.values('stock_ticker')
+    for ticker in CompanyTicker.objects.exclude(pk__in=stored).filter(stockdataframe__isnull=False).distinct():
+        df = daily_bars(StockDataframe, ticker, OHLCV)
+        rollups, yearly = compute_rollups(None, df) # Unsaved rows of the current models, copied into the historical ones.
+        PriceRollup.objects.bulk_create([
+            PriceRollup(stock_ticker=ticker, period=row.period, start=row.start, **{field: getattr(row, field) for field in OHLCV})
+            for row in rollups
+        ], batch_size=500, ignore_conflicts=True)
+        YearlyStat.objects.bulk_create([
+            YearlyStat(stock_ticker=ticker, year=row.year, **{field: getattr(row, field) for field in STAT_FIELDS})
+            for row in yearly
+        ], batch_size=500, ignore_conflicts=True)
+        CompanyTicker.objects.filter(pk=ticker.pk).update(data_version=models.F('data_version') + 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock_analyzer', '0019_latestquote'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
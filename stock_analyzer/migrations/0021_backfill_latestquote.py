@@ -0,0 +1,44 @@
+from datetime import timedelta
+
+from django.db import migrations
+from django.db.models import Max
+
+
+def daily_closes(connection, StockDataframe, ticker, since):
+    """The ticker's stored closes from since on as a UTC date indexed float frame, like storage.load_rows.
+
+    Rows are read from the cursor as storage does, the ORM's Decimals would round the sparkline differently.
+    """
+    import pandas as pd # Loading the migrations, e.g. for runserver's check, mustn't import it.
+    stocks = StockDataframe.objects.filter(stock_ticker=ticker, date__gte=since).order_by('date').values_list('date', 'close')
+    sql, params = stocks.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    df = pd.DataFrame(rows, columns=['date', 'close'])
+    df.index = pd.DatetimeIndex(pd.to_datetime(df.pop('date'), utc=True), name='date')
+    return df.astype('float64')
+
+def backfill_quotes(apps, schema_editor):
+    """Computes the hub quote of tickers stored before update_rollups kept one."""
+    from stock_analyzer.rollups import QUOTE_DAYS, QUOTE_FIELDS, compute_quote
+    CompanyTicker = apps.get_model('stock_analyzer', 'CompanyTicker')
+    StockDataframe = apps.get_model('stock_analyzer', 'StockDataframe')
+    LatestQuote = apps.get_model('stock_analyzer', 'LatestQuote')
+    tickers = CompanyTicker.objects.filter(quote__isnull=True).annotate(last_date=Max('stockdataframe__date'))
+    for ticker in tickers.filter(last_date__isnull=False):
+        df = daily_closes(schema_editor.connection, StockDataframe, ticker, ticker.last_date - timedelta(days=QUOTE_DAYS))
+        quote = compute_quote(None, df) # An unsaved LatestQuote of the current model, copied into the historical one.
+        if quote is not None:
+            LatestQuote.objects.create(stock_ticker=ticker, **{field: getattr(quote, field) for field in QUOTE_FIELDS})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock_analyzer', '0020_backfill_rollups'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_quotes, migrations.RunPython.noop),
+    ]
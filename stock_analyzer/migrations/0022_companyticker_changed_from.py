@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock_analyzer', '0021_backfill_latestquote'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='companyticker',
+            name='changed_from',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
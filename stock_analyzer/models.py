@@ -1,24 +1,140 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
 from django.contrib.auth.models import User
-import pandas as pd
-import yfinance as yf
+import numpy as np
+
+from .columnar import frame_to_records, merge_records, unpack
+
+# yfinance history column -> StockDataframe field
+HISTORY_COLUMNS = {
+    'Open': 'open',
+    'High': 'high',
+    'Low': 'low',
+    'Close': 'close',
+    'Volume': 'volume',
+    'Dividends': 'dividends',
+    'Stock Splits': 'stock_splits',
+}
+
+def normalize_symbol(symbol):
+    """Tickers are stored stripped and lowercase, whatever case users type them in."""
+    return str(symbol).strip().lower()
+
+class CompanyTickerManager(models.Manager):
+    """Registry lookups by symbol, backed by the unique stock_ticker index and an in-process symbol -> id cache.
+
+    Ids are only cached once the transaction that read or created them has committed and are
+    dropped whenever a ticker is saved or deleted, so lookups never see a rolled back row.
+    """
+    MAX_CACHED = 10000
+
+    def symbol_id(self, symbol):
+        """Returns the id of the stored ticker for symbol, None if there is none."""
+        symbol = normalize_symbol(symbol)
+        ticker_id = _symbol_ids.get(symbol)
+        if ticker_id is None:
+            ticker_id = self.filter(stock_ticker=symbol).values_list('id', flat=True).first()
+            if ticker_id is not None:
+                self._remember(symbol, ticker_id)
+        return ticker_id
+
+    def has_symbol(self, symbol):
+        """Whether symbol is stored, by the cache first, so a ticker another process just deleted can still count."""
+        return self.symbol_id(symbol) is not None
+
+    def get_by_symbol(self, symbol):
+        """Returns the CompanyTicker for symbol, raises CompanyTicker.DoesNotExist if it isn't stored."""
+        symbol = normalize_symbol(symbol)
+        ticker_id = self.symbol_id(symbol)
+        ticker = None if ticker_id is None else self.filter(pk=ticker_id, stock_ticker=symbol).first()
+        if ticker is None and ticker_id is not None:
+            forget_symbol(symbol) # Deleted or renamed by another process since it was cached.
+            ticker = self.filter(stock_ticker=symbol).first()
+        if ticker is None:
+            raise self.model.DoesNotExist(f"No stored ticker {symbol.upper()}")
+        return ticker
+
+    def bump_version(self, ticker_id, changed_from):
+        """Bumps the ticker's data_version after its bars from changed_from on were written or dropped."""
+        return self.filter(pk=ticker_id).update(data_version=models.F('data_version') + 1, changed_from=changed_from)
+
+    def get_or_create_symbol(self, symbol, **defaults):
+        """get_or_create on the normalized symbol, safe against concurrent creates through the unique index."""
+        ticker, created = self.get_or_create(stock_ticker=normalize_symbol(symbol), defaults=defaults)
+        self._remember(ticker.stock_ticker, ticker.pk)
+        return ticker, created
+
+    def _remember(self, symbol, ticker_id):
+        def remember():
+            if len(_symbol_ids) >= self.MAX_CACHED:
+                _symbol_ids.clear()
+            _symbol_ids[symbol] = ticker_id
+        transaction.on_commit(remember, using=self.db)
+
+# normalized symbol -> CompanyTicker id, filled by CompanyTickerManager lookups
+_symbol_ids = {}
+
+def forget_symbol(symbol=None):
+    """Drops symbol from the registry cache, every symbol without one."""
+    if symbol is None:
+        _symbol_ids.clear()
+    else:
+        _symbol_ids.pop(normalize_symbol(symbol), None)
 
 class CompanyTicker(models.Model):
     """Models the company ticker and name and adds a key to the user."""
     users = models.ManyToManyField(User, related_name='tickers')
     company_name = models.CharField(max_length=20, blank=True, default='')
-    stock_ticker = models.CharField(max_length=8, blank=True, default='')
+    stock_ticker = models.CharField(max_length=8, unique=True)
+    data_version = models.PositiveIntegerField(default=0) # Bumped whenever price rows change, keys cached charts.
+    changed_from = models.DateTimeField(null=True, blank=True) # Earliest bar date the last data_version bump changed.
+
+    objects = CompanyTickerManager()
     
     def __str__(self):
         return self.stock_ticker.upper()
 
-    def add_user(self, stock_ticker, user):
-        ct = CompanyTicker.objects.get(stock_ticker=stock_ticker)
-        ct.users.add(user)
+    def save(self, *args, **kwargs):
+        self.stock_ticker = normalize_symbol(self.stock_ticker)
+        super().save(*args, **kwargs)
+
+    def add_user(self, user):
+        self.users.add(user)
+
+class StockDataframeManager(models.Manager):
+    """Bulk ingestion of price history frames."""
+
+    def ingest_dataframe(self, ticker, df, batch_size=500, upsert=False):
+        """Writes every row of a yfinance history frame for ticker in batches, returns the row count.
+
+        With upsert, rows already stored for one of the frame's dates are updated instead of duplicated.
+        """
+        if not isinstance(ticker, CompanyTicker):
+            ticker = CompanyTicker.objects.get_by_symbol(ticker)
+        if len(df) == 0:
+            return 0
+        columns = [column for column in HISTORY_COLUMNS if column in df.columns]
+        values = df[columns].astype(object).where(df[columns].notna(), None)
+        fields = [HISTORY_COLUMNS[column] for column in columns]
+        dates = df.index.to_pydatetime()
+        rows = [
+            self.model(stock_ticker=ticker, date=date, **dict(zip(fields, row)))
+            for date, row in zip(dates, values.to_numpy().tolist())
+        ]
+        upsert_options = {}
+        if upsert:
+            upsert_options = {'update_conflicts': True, 'unique_fields': ['stock_ticker', 'date'], 'update_fields': fields}
+        with transaction.atomic():
+            self.bulk_create(rows, batch_size=batch_size, **upsert_options)
+            if settings.STOCK_PRICE_STORAGE == 'blob':
+                PriceHistoryBlob.objects.merge_dataframe(ticker, df)
+            CompanyTicker.objects.bump_version(ticker.pk, min(dates))
+        return len(rows)
 
 class StockDataframe(models.Model):
     """Models the information for one day of a stock performance."""
-    stock_ticker = models.ForeignKey(CompanyTicker, on_delete=models.CASCADE)
+    stock_ticker = models.ForeignKey(CompanyTicker, on_delete=models.CASCADE, db_index=False) # Covered by the (stock_ticker, date) index.
     date = models.DateTimeField(blank=True, null=True)
     open = models.DecimalField(max_digits=20, decimal_places=6, blank=True, null=True)
     high = models.DecimalField(max_digits=20, decimal_places=6, blank=True, null=True)
@@ -27,13 +143,23 @@ class StockDataframe(models.Model):
     volume = models.IntegerField(blank=True, null=True)
     dividends = models.FloatField(max_length=6, blank=True, null=True)
     stock_splits = models.FloatField(max_length=6, blank=True, null=True)
+
+    objects = StockDataframeManager()
+
+    class Meta:
+        ordering = ['date']
+        constraints = [
+            models.UniqueConstraint(fields=['stock_ticker', 'date'], name='unique_stock_ticker_date'),
+        ]
     
     def __str__(self):
         return f"{self.stock_ticker} DF {self.date}"
     
     def build_database(self, stock_ticker, df, row):
         """Adds the information for stock performance per row of a df and saves."""
-        self.stock_ticker = CompanyTicker.objects.get(stock_ticker=stock_ticker) # Possibly change this to objects.name(form.cleaned_data['stock_ticker'])
+        self.stock_ticker_id = CompanyTicker.objects.symbol_id(stock_ticker) # Cached after the first row.
+        if self.stock_ticker_id is None:
+            raise CompanyTicker.DoesNotExist(f"No stored ticker {stock_ticker}")
         self.date = df.index[row]
         self.open = df.Open.iloc[row]
         self.high = df.High.iloc[row]
@@ -45,4 +171,271 @@ class StockDataframe(models.Model):
         self.save()
         return 
 
-#PortfolioModel - Stock ticker, initial invest., current value, gain/loss
\ No newline at end of file
+class PriceHistoryBlobManager(models.Manager):
+    """Keeps the packed copy of a ticker's history in step with ingestion."""
+
+    def merge_dataframe(self, ticker, df):
+        """Merges a yfinance history frame into the ticker's packed history."""
+        blob, _ = self.select_for_update().get_or_create(stock_ticker=ticker, defaults={'data': b''})
+        records = merge_records(unpack(blob.data), frame_to_records(df, HISTORY_COLUMNS))
+        blob.data = records.tobytes()
+        blob.rows = len(records)
+        blob.save()
+        return blob
+
+class PriceHistoryBlob(models.Model):
+    """Stores a ticker's whole daily history as one packed array, see columnar.PRICE_DTYPE.
+
+    Read by get_stock_df when settings.STOCK_PRICE_STORAGE is 'blob', StockDataframe stays the source of truth.
+    """
+    stock_ticker = models.OneToOneField(CompanyTicker, on_delete=models.CASCADE, related_name='price_blob')
+    data = models.BinaryField()
+    rows = models.IntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    objects = PriceHistoryBlobManager()
+
+    def __str__(self):
+        return f"{self.stock_ticker} packed history ({self.rows} rows)"
+
+class IntradayBlockManager(models.Manager):
+    """Writes intraday bars into their ticker, interval and month blocks."""
+
+    def merge_records(self, ticker, interval, records, replace=True):
+        """Merges packed records into the blocks of the months they fall in, returns the blocks written.
+
+        With replace=False bars already stored for a date are kept instead of overwritten.
+        """
+        months = records['date'].astype('datetime64[ns]').astype('datetime64[M]')
+        blocks = []
+        for month in np.unique(months):
+            new = records[months == month]
+            block, _ = self.select_for_update().get_or_create(
+                stock_ticker=ticker, interval=interval, month=month.astype(object), defaults={'data': b''},
+            )
+            old = unpack(block.data)
+            merged = merge_records(old, new) if replace else merge_records(new, old)
+            block.data = merged.tobytes()
+            block.rows = len(merged)
+            block.save()
+            blocks.append(block)
+        return blocks
+
+    def merge_dataframe(self, ticker, interval, df):
+        """Merges a yfinance history frame of interval bars into the ticker's blocks."""
+        return self.merge_records(ticker, interval, frame_to_records(df, HISTORY_COLUMNS))
+
+class IntradayBlock(models.Model):
+    """Stores one month of a ticker's 1m, 5m or 1h bars as a packed array, see columnar.PRICE_DTYPE.
+
+    Splitting by month keeps every row small and lets range reads load only the months they
+    cover, the retention rules in intraday.compact_intraday fold old blocks into coarser ones.
+    """
+    MINUTE = '1m'
+    FIVE_MINUTES = '5m'
+    HOUR = '1h'
+    INTERVAL_CHOICES = [
+        (MINUTE, '1 minute'),
+        (FIVE_MINUTES, '5 minutes'),
+        (HOUR, '1 hour'),
+    ]
+
+    stock_ticker = models.ForeignKey(CompanyTicker, on_delete=models.CASCADE, db_index=False)
+    interval = models.CharField(max_length=2, choices=INTERVAL_CHOICES)
+    month = models.DateField() # First day of the month (UTC) the bars fall in.
+    data = models.BinaryField()
+    rows = models.IntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    objects = IntradayBlockManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['stock_ticker', 'interval', 'month'], name='unique_intraday_block'),
+        ]
+
+    def __str__(self):
+        return f"{self.stock_ticker} {self.interval} {self.month:%Y-%m} ({self.rows} rows)"
+
+class PriceRollup(models.Model):
+    """Models one weekly or monthly OHLCV bar aggregated from the daily StockDataframe rows."""
+    WEEK = 'W'
+    MONTH = 'M'
+    PERIOD_CHOICES = [
+        (WEEK, 'Week'),
+        (MONTH, 'Month'),
+    ]
+
+    stock_ticker = models.ForeignKey(CompanyTicker, on_delete=models.CASCADE, db_index=False)
+    period = models.CharField(max_length=1, choices=PERIOD_CHOICES)
+    start = models.DateField() # First day of the week (Monday) or month.
+    open = models.FloatField(null=True)
+    high = models.FloatField(null=True)
+    low = models.FloatField(null=True)
+    close = models.FloatField(null=True)
+    volume = models.BigIntegerField(default=0)
+
+    class Meta:
+        ordering = ['start']
+        constraints = [
+            models.UniqueConstraint(fields=['stock_ticker', 'period', 'start'], name='unique_rollup_period'),
+        ]
+
+    def __str__(self):
+        return f"{self.stock_ticker} {self.get_period_display()} {self.start}"
+
+class YearlyStat(models.Model):
+    """Models one calendar year of a stock: OHLC, top close and return over the prior year's close."""
+    stock_ticker = models.ForeignKey(CompanyTicker, on_delete=models.CASCADE, db_index=False)
+    year = models.IntegerField()
+    open = models.FloatField(null=True)
+    high = models.FloatField(null=True)
+    low = models.FloatField(null=True)
+    close = models.FloatField(null=True)
+    max_close = models.FloatField(null=True)
+    annual_return = models.FloatField(null=True) # None for the first stored year.
+
+    class Meta:
+        ordering = ['year']
+        constraints = [
+            models.UniqueConstraint(fields=['stock_ticker', 'year'], name='unique_yearly_stat'),
+        ]
+
+    def __str__(self):
+        return f"{self.stock_ticker} {self.year}"
+
+class LatestQuote(models.Model):
+    """Models a stock's last daily close, its day and one year change and a year's sparkline, kept by update_rollups for the hub."""
+    SPARKLINE_WIDTH = 120
+    SPARKLINE_HEIGHT = 30
+
+    stock_ticker = models.OneToOneField(CompanyTicker, on_delete=models.CASCADE, related_name='quote')
+    date = models.DateTimeField()
+    close = models.FloatField()
+    day_change = models.FloatField(null=True) # Percent over the previous close, None for the first bar.
+    year_change = models.FloatField(null=True) # Percent over the close a year of trading days before, None with less history.
+    sparkline = models.JSONField(default=list) # The last year's closes downsampled to a few dozen points.
+
+    def __str__(self):
+        return f"{self.stock_ticker} quote {self.date}"
+
+    @property
+    def sparkline_points(self):
+        """The sparkline as SVG polyline points, scaled to SPARKLINE_WIDTH x SPARKLINE_HEIGHT."""
+        if len(self.sparkline) < 2:
+            return ''
+        low, high = min(self.sparkline), max(self.sparkline)
+        step = self.SPARKLINE_WIDTH / (len(self.sparkline) - 1)
+        scale = self.SPARKLINE_HEIGHT / ((high - low) or 1)
+        return ' '.join(f'{i * step:.1f},{self.SPARKLINE_HEIGHT - (close - low) * scale:.1f}' for i, close in enumerate(self.sparkline))
+
+class IngestJob(models.Model):
+    """Queues a background fetch and store of one ticker's price history."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+    ACTIVE = [PENDING, RUNNING]
+
+    stock_ticker = models.CharField(max_length=8)
+    status = models.CharField(max_length=8, choices=STATUS_CHOICES, default=PENDING)
+    users = models.ManyToManyField(User, related_name='ingest_jobs')
+    rows = models.IntegerField(default=0)
+    error = models.CharField(max_length=200, blank=True, default='')
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            # Only one pending or running job per ticker, concurrent requests share it.
+            models.UniqueConstraint(
+                fields=['stock_ticker'],
+                condition=models.Q(status__in=['pending', 'running']),
+                name='unique_active_ingest_job',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.stock_ticker.upper()} {self.status}"
+
+class Portfolio(models.Model):
+    """Models a user's portfolio, its holdings are kept in step with its transactions."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='portfolio')
+    version = models.PositiveIntegerField(default=0) # Bumped whenever a transaction is recorded, keys cached valuations.
+
+    def __str__(self):
+        return f"{self.user} portfolio"
+
+class TransactionManager(models.Manager):
+    """Records trades and updates the Holding they change."""
+
+    def record(self, portfolio, stock_ticker, date, quantity, price):
+        """Saves a trade, positive quantity buys and negative sells, and recomputes that ticker's Holding."""
+        with transaction.atomic():
+            trade = self.create(portfolio=portfolio, stock_ticker=stock_ticker, date=date, quantity=quantity, price=price)
+            trades = self.filter(portfolio=portfolio, stock_ticker=stock_ticker).values_list('quantity', 'price')
+            shares = cost_basis = realized_pnl = 0.0
+            # Average cost: buys add to the cost basis, sells take out their share of it and realize the rest.
+            for quantity, price in trades:
+                if quantity >= 0:
+                    cost_basis += quantity * price
+                else:
+                    sold_cost = cost_basis * min(-quantity / shares, 1.0) if shares > 0 else 0.0
+                    realized_pnl += -quantity * price - sold_cost
+                    cost_basis -= sold_cost
+                shares += quantity
+            Holding.objects.update_or_create(
+                portfolio=portfolio, stock_ticker=stock_ticker,
+                defaults={'quantity': shares, 'cost_basis': cost_basis, 'realized_pnl': realized_pnl},
+            )
+            Portfolio.objects.filter(pk=portfolio.pk).update(version=models.F('version') + 1)
+        return trade
+
+class Transaction(models.Model):
+    """Models one buy or sell of a stock in a portfolio."""
+    portfolio = models.ForeignKey(Portfolio, on_delete=models.CASCADE, related_name='transactions', db_index=False) # Covered by the (portfolio, date) index.
+    stock_ticker = models.ForeignKey(CompanyTicker, on_delete=models.CASCADE)
+    date = models.DateField()
+    quantity = models.FloatField() # Negative for a sell.
+    price = models.FloatField()
+
+    objects = TransactionManager()
+
+    class Meta:
+        ordering = ['date', 'id']
+        indexes = [
+            models.Index(fields=['portfolio', 'date'], name='transaction_portfolio_date'),
+        ]
+
+    def __str__(self):
+        return f"{self.stock_ticker} {self.quantity:g} @ {self.price:g} on {self.date}"
+
+class Holding(models.Model):
+    """Models the current position in one stock, derived from the portfolio's transactions."""
+    portfolio = models.ForeignKey(Portfolio, on_delete=models.CASCADE, related_name='holdings', db_index=False)
+    stock_ticker = models.ForeignKey(CompanyTicker, on_delete=models.CASCADE)
+    quantity = models.FloatField(default=0)
+    cost_basis = models.FloatField(default=0) # Average cost of the shares still held.
+    realized_pnl = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['portfolio', 'stock_ticker'], name='unique_holding'),
+        ]
+
+    def __str__(self):
+        return f"{self.stock_ticker} {self.quantity:g}"
+
+
+def _forget_ticker(sender, instance, **kwargs):
+    forget_symbol(instance.stock_ticker)
+
+# Saves may rename a ticker and deletes free its symbol, either way the cached id is stale.
+post_save.connect(_forget_ticker, sender=CompanyTicker)
+post_delete.connect(_forget_ticker, sender=CompanyTicker)
@@ -0,0 +1,102 @@
+"""Values a Portfolio's holdings and builds its daily equity curve from stored closes.
+
+All holdings' closes come from one load_price_matrix query and the trades are laid onto that
+date x symbol grid, so the cost does not grow with a query per holding. Valuations are cached
+with the portfolio's version and its tickers' data versions, a trade or a price refresh
+computes a new one.
+"""
+from datetime import datetime, time, timezone
+
+from django.conf import settings
+from django.core.cache import caches
+import numpy as np
+
+from .lazy import LazyModule
+from .storage import load_price_matrix
+from .timing import stage
+
+pd = LazyModule('pandas')
+
+HOLDING_FIELDS = ('quantity', 'cost_basis', 'price', 'value', 'unrealized_pnl', 'realized_pnl')
+TOTAL_FIELDS = ('cost_basis', 'value', 'unrealized_pnl', 'realized_pnl')
+CURVE_FIELDS = ('value', 'invested', 'pnl')
+
+
+def empty_valuation():
+    """The valuation of a portfolio without holdings, built without pandas so the hub of a user who never traded doesn't import it."""
+    return {'holdings': [], 'totals': dict.fromkeys(TOTAL_FIELDS, 0.0), 'curve': None}
+
+
+def value_portfolio(portfolio):
+    """Returns {'holdings': [...], 'totals': {...}, 'curve': frame} for the Portfolio.
+
+    Holdings are valued at their last stored close. The curve has the portfolio's market value,
+    net cash invested and their difference (total P&L) on every trading day since the first trade.
+    Without holdings it is empty_valuation(), whose curve is None.
+    """
+    holdings = list(portfolio.holdings.select_related('stock_ticker').order_by('stock_ticker__stock_ticker'))
+    if not holdings:
+        return empty_valuation()
+    tickers = [holding.stock_ticker for holding in holdings]
+    state = (portfolio.version, tuple((ticker.id, ticker.data_version) for ticker in tickers))
+    cache = caches[settings.CHART_CACHE_ALIAS]
+    key = f'portfolio:{portfolio.pk}'
+    cached = cache.get(key)
+    if cached is not None and cached[0] == state:
+        return cached[1]
+    trades = list(portfolio.transactions.values_list('stock_ticker_id', 'date', 'quantity', 'price'))
+    start = datetime.combine(min(trade[1] for trade in trades), time(), timezone.utc) if trades else None
+    with stage('load'):
+        closes = load_price_matrix(tickers, start=start)['close'].ffill()
+    with stage('valuation'):
+        valuation = {
+            'holdings': holding_values(holdings, closes),
+            'curve': equity_curve(tickers, trades, closes),
+        }
+    valuation['totals'] = {
+        field: float(np.nansum([holding[field] for holding in valuation['holdings']]))
+        for field in TOTAL_FIELDS
+    }
+    cache.set(key, (state, valuation))
+    return valuation
+
+def holding_values(holdings, closes):
+    """Values the Holdings at the last close in closes, a forward filled date x symbol frame."""
+    symbols = [holding.stock_ticker.stock_ticker for holding in holdings]
+    last = closes.iloc[-1].reindex(symbols).to_numpy() if len(closes) else np.full(len(symbols), np.nan)
+    quantity = np.array([holding.quantity for holding in holdings], dtype='float64')
+    cost_basis = np.array([holding.cost_basis for holding in holdings], dtype='float64')
+    value = quantity * last
+    columns = {
+        'quantity': quantity,
+        'cost_basis': cost_basis,
+        'price': last,
+        'value': value,
+        'unrealized_pnl': value - cost_basis,
+        'realized_pnl': np.array([holding.realized_pnl for holding in holdings], dtype='float64'),
+    }
+    return [
+        {'stock_ticker': symbol, **{field: columns[field][i] for field in HOLDING_FIELDS}}
+        for i, symbol in enumerate(symbols)
+    ]
+
+def equity_curve(tickers, trades, closes):
+    """Daily market value, net invested cash and total P&L from (ticker id, date, quantity, price) trades.
+
+    A trade counts from the first trading day on or after its date, or the last one if it is newer.
+    """
+    if not trades or closes.empty:
+        return pd.DataFrame({field: [] for field in CURVE_FIELDS}, index=pd.DatetimeIndex([], name='date', tz='UTC'))
+    ticker_ids, dates, quantities, prices = zip(*trades)
+    columns = {ticker.id: column for column, ticker in enumerate(tickers)}
+    days = closes.index.tz_convert(None).normalize()
+    rows = np.minimum(np.searchsorted(days, pd.to_datetime(list(dates))), len(days) - 1)
+    cols = np.array([columns[ticker_id] for ticker_id in ticker_ids], dtype=int)
+    quantities = np.array(quantities, dtype='float64')
+    traded = np.zeros(closes.shape)
+    np.add.at(traded, (rows, cols), quantities)
+    cash = np.zeros(len(days))
+    np.add.at(cash, rows, quantities * np.array(prices, dtype='float64'))
+    value = (traded.cumsum(axis=0) * np.nan_to_num(closes.to_numpy())).sum(axis=1)
+    invested = cash.cumsum()
+    return pd.DataFrame({'value': value, 'invested': invested, 'pnl': value - invested}, index=closes.index)
@@ -0,0 +1,104 @@
+"""Market data providers, the one selected by settings.STOCK_DATA_PROVIDER serves get_history."""
+from pathlib import Path
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .lazy import LazyModule
+
+pd = LazyModule('pandas')
+
+# Exchange time of daily bars that come without a timezone
+EXCHANGE_TZ = 'America/New_York'
+
+
+def get_history(symbols, start=None, end=None, interval='1d'):
+    """Returns history frames of interval bars keyed by lowercase symbol, fetched in one provider call.
+
+    Without a start the provider's default span for the interval is returned (five years of
+    daily bars). Symbols the provider has no data for are left out.
+    """
+    symbols = [str(symbol).lower() for symbol in symbols]
+    if not symbols:
+        return {}
+    return get_provider().get_history(symbols, start, end, interval)
+
+def get_provider():
+    """Returns the configured provider instance."""
+    return import_string(settings.STOCK_DATA_PROVIDER)()
+
+def exchange_time(df):
+    """Returns df with a UTC index, a naive index (yfinance's daily bars) is read as EXCHANGE_TZ time."""
+    index = pd.DatetimeIndex(df.index)
+    if index.tz is None:
+        index = index.tz_localize(EXCHANGE_TZ)
+    return df.set_axis(index.tz_convert('UTC').rename(df.index.name))
+
+def _utc(value):
+    timestamp = pd.Timestamp(value)
+    return timestamp.tz_localize('UTC') if timestamp.tzinfo is None else timestamp
+
+
+class BaseProvider:
+    """Fetches yfinance style frames (Open, High, Low, Close, Volume, Dividends, Stock Splits)."""
+
+    def get_history(self, symbols, start=None, end=None, interval='1d'):
+        raise NotImplementedError
+
+
+class YahooProvider(BaseProvider):
+    """Yahoo Finance through yfinance, all symbols go through one download call.
+
+    download returns daily bars without a timezone, they are read as New York time like
+    Ticker.history returned them, so a trading day always gets the same stored date.
+    """
+    # Interval -> span fetched without a start, the longest Yahoo serves for intraday bars
+    periods = {'1d': '5y', '1h': '730d', '5m': '60d', '1m': '7d'}
+
+    def get_history(self, symbols, start=None, end=None, interval='1d'):
+        import yfinance as yf
+        span = {'start': start, 'end': end} if start else {'period': self.periods[interval]}
+        df = yf.download(
+            symbols, interval=interval, group_by='ticker', actions=True,
+            auto_adjust=True, progress=False, **span,
+        )
+        fetched = set(df.columns.get_level_values(0))
+        return {
+            symbol: exchange_time(df[symbol.upper()].dropna(how='all'))
+            for symbol in symbols
+            if symbol.upper() in fetched
+        }
+
+
+class FixtureProvider(BaseProvider):
+    """Reads <symbol>.parquet or <symbol>.csv files from settings.STOCK_FIXTURE_DIR, works offline.
+
+    Intraday bars come from <symbol>.<interval>.parquet or .csv, e.g. amd.5m.csv.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = Path(directory or settings.STOCK_FIXTURE_DIR)
+
+    def read(self, symbol):
+        parquet = self.directory / f'{symbol}.parquet'
+        if parquet.exists():
+            return pd.read_parquet(parquet)
+        csv = self.directory / f'{symbol}.csv'
+        if csv.exists():
+            df = pd.read_csv(csv, index_col=0)
+            df.index = pd.to_datetime(df.index, utc=True)
+            return df
+        return None
+
+    def get_history(self, symbols, start=None, end=None, interval='1d'):
+        frames = {}
+        for symbol in symbols:
+            df = self.read(symbol if interval == '1d' else f'{symbol}.{interval}')
+            if df is None:
+                continue
+            if start is not None:
+                df = df[df.index >= _utc(start)]
+            if end is not None:
+                df = df[df.index < _utc(end)]
+            frames[symbol] = df
+        return frames
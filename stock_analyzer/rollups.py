@@ -0,0 +1,173 @@
+"""Weekly/monthly bars, per year stats and the latest quote aggregated from the daily rows, kept in PriceRollup, YearlyStat and LatestQuote.
+
+Ingestion and refresh call update_rollups with the first new bar's date, which only reloads
+from the start of the year before it (or a year of trading days, if that's further back) so
+the cost does not grow with the stored history. A ticker stored before rollups were kept has
+none yet, its first update aggregates the whole history instead.
+"""
+from datetime import datetime, timedelta, timezone
+
+from django.db import transaction
+import numpy as np
+
+from .downsample import downsample
+from .indicators import TRADING_DAYS
+from .lazy import LazyModule
+from .models import LatestQuote, PriceRollup, YearlyStat
+from .storage import load_rows
+
+pd = LazyModule('pandas')
+
+OHLCV = ('open', 'high', 'low', 'close', 'volume')
+# PriceRollup.period -> pandas period frequency
+ROLLUP_FREQUENCIES = {PriceRollup.WEEK: 'W', PriceRollup.MONTH: 'M'}
+BAR_AGGREGATES = {
+    'open': ('open', 'first'),
+    'high': ('high', 'max'),
+    'low': ('low', 'min'),
+    'close': ('close', 'last'),
+    'volume': ('volume', 'sum'),
+}
+STAT_FIELDS = ('open', 'high', 'low', 'close', 'max_close', 'annual_return')
+QUOTE_FIELDS = ('date', 'close', 'day_change', 'year_change', 'sparkline')
+# Calendar days of closes a quote needs, a year of trading days plus holidays
+QUOTE_DAYS = 380
+SPARKLINE_POINTS = 60
+
+
+def aggregate_bars(df, frequency):
+    """Aggregates daily OHLCV bars into bars per calendar period, indexed by the period's first day."""
+    periods = df.index.tz_localize(None).to_period(frequency)
+    bars = df.groupby(periods).agg(**BAR_AGGREGATES)
+    bars.index = bars.index.start_time.date
+    return bars
+
+def yearly_stats(df):
+    """Per calendar year OHLC, top close and return over the previous year's close."""
+    stats = df.groupby(df.index.year).agg(**{field: BAR_AGGREGATES[field] for field in OHLCV[:4]}, max_close=('close', 'max'))
+    stats['annual_return'] = stats.close / stats.close.shift() - 1
+    return stats
+
+def compute_rollups(ticker, df, since=None):
+    """Builds unsaved PriceRollup and YearlyStat rows from daily bars loaded from the start of the year before since."""
+    load_start = None if since is None else _year_start(since.year - 1)
+    rollups = []
+    for period, frequency in ROLLUP_FREQUENCIES.items():
+        bars = aggregate_bars(df, frequency)
+        if load_start is not None:
+            bars = bars[bars.index >= load_start.date()] # A week starting earlier is missing its first days.
+        rollups += [
+            PriceRollup(stock_ticker=ticker, period=period, start=start, **_clean(values))
+            for start, values in zip(bars.index, bars.to_dict('records'))
+        ]
+    stats = yearly_stats(df)
+    if load_start is not None:
+        stats = stats[stats.index > load_start.year] # Its return needs the year before, which wasn't loaded.
+    yearly = [
+        YearlyStat(stock_ticker=ticker, year=year, **_clean(values))
+        for year, values in zip(stats.index, stats.to_dict('records'))
+    ]
+    return rollups, yearly
+
+def compute_quote(ticker, df):
+    """Builds an unsaved LatestQuote from daily bars covering at least the year before the newest one, None without closes."""
+    closes = df.close.dropna()
+    if closes.empty:
+        return None
+    sparkline = downsample(closes.iloc[-TRADING_DAYS - 1:].to_frame(), SPARKLINE_POINTS).close
+    return LatestQuote(
+        stock_ticker=ticker,
+        date=closes.index[-1].to_pydatetime(),
+        close=float(closes.iloc[-1]),
+        day_change=_change(closes, 1),
+        year_change=_change(closes, TRADING_DAYS),
+        sparkline=[round(float(close), 4) for close in sparkline],
+    )
+
+def update_rollups(ticker, since=None):
+    """Recomputes the CompanyTicker's rollups touched by bars on or after since, all of them without since, and its quote."""
+    if since is not None and not YearlyStat.objects.filter(stock_ticker=ticker).exists():
+        since = None # Partial years on top of the missing history would look complete.
+    load_start = None if since is None else min(_year_start(since.year - 1), since - timedelta(days=QUOTE_DAYS))
+    df = load_rows(ticker, start=load_start, fields=OHLCV)
+    if df.empty:
+        return
+    rollups, yearly = compute_rollups(ticker, df, since)
+    quote = compute_quote(ticker, df)
+    with transaction.atomic():
+        PriceRollup.objects.bulk_create(
+            rollups, batch_size=500, update_conflicts=True,
+            unique_fields=['stock_ticker', 'period', 'start'], update_fields=list(OHLCV),
+        )
+        YearlyStat.objects.bulk_create(
+            yearly, batch_size=500, update_conflicts=True,
+            unique_fields=['stock_ticker', 'year'], update_fields=list(STAT_FIELDS),
+        )
+        if quote is not None:
+            LatestQuote.objects.bulk_create(
+                [quote], update_conflicts=True, unique_fields=['stock_ticker'], update_fields=list(QUOTE_FIELDS),
+            )
+
+def rebuild_rollups(ticker):
+    """Drops and recomputes all of the CompanyTicker's rollups from the daily rows."""
+    with transaction.atomic():
+        PriceRollup.objects.filter(stock_ticker=ticker).delete()
+        YearlyStat.objects.filter(stock_ticker=ticker).delete()
+        update_rollups(ticker)
+
+def check_rollups(ticker):
+    """Compares the stored rollups and quote with a fresh aggregation of the daily rows, returns a list of mismatches."""
+    df = load_rows(ticker, fields=OHLCV)
+    rollups, yearly = compute_rollups(ticker, df)
+    problems = []
+    checks = [
+        (rollups, PriceRollup.objects.filter(stock_ticker=ticker), ('period', 'start'), OHLCV),
+        (yearly, YearlyStat.objects.filter(stock_ticker=ticker), ('year',), STAT_FIELDS),
+    ]
+    for expected, stored, key_fields, fields in checks:
+        stored = {tuple(row[:len(key_fields)]): row[len(key_fields):] for row in stored.values_list(*key_fields, *fields)}
+        for row in expected:
+            key = tuple(getattr(row, field) for field in key_fields)
+            values = stored.pop(key, None)
+            if values is None:
+                problems.append(f"{ticker} {key}: missing")
+            elif not np.allclose(_floats(getattr(row, field) for field in fields), _floats(values), equal_nan=True):
+                problems.append(f"{ticker} {key}: differs from the daily rows")
+        problems += [f"{ticker} {key}: no daily rows" for key in stored]
+    quote = compute_quote(ticker, df) if not df.empty else None
+    stored = LatestQuote.objects.filter(stock_ticker=ticker).first()
+    if quote is not None and (stored is None or stored.date != quote.date or stored.sparkline != quote.sparkline):
+        problems.append(f"{ticker} quote: differs from the daily rows")
+    return problems
+
+def load_rollup(ticker, period, start=None, end=None, fields=OHLCV):
+    """Loads the CompanyTicker's weekly or monthly bars as a frame indexed by the bar's first day (UTC)."""
+    rollups = PriceRollup.objects.filter(stock_ticker=ticker, period=period)
+    if start is not None:
+        rollups = rollups.filter(start__gte=start.date() if hasattr(start, 'date') else start)
+    if end is not None:
+        rollups = rollups.filter(start__lt=end.date() if hasattr(end, 'date') else end)
+    rows = list(rollups.order_by('start').values_list('start', *fields))
+    columns = list(zip(*rows)) or [()] * (len(fields) + 1)
+    index = pd.DatetimeIndex(pd.to_datetime(list(columns[0])).tz_localize('UTC'), name='date')
+    return pd.DataFrame({
+        field: np.array(column, dtype='float64')
+        for field, column in zip(fields, columns[1:])
+    }, index=index)
+
+def _change(closes, bars):
+    """Percent change of the last close over the one bars before it, None without that many."""
+    return None if len(closes) <= bars else round(float(closes.iloc[-1] / closes.iloc[-bars - 1] - 1) * 100, 4)
+
+def _year_start(year):
+    return datetime(year, 1, 1, tzinfo=timezone.utc)
+
+def _clean(values):
+    """NaN aggregates become None (or 0 volume) for the database."""
+    return {
+        field: (0 if field == 'volume' else None) if pd.isna(value) else (int(value) if field == 'volume' else float(value))
+        for field, value in values.items()
+    }
+
+def _floats(values):
+    return np.array([np.nan if value is None else value for value in values], dtype='float64')
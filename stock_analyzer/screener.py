@@ -0,0 +1,175 @@
+"""Screens stored tickers with filter expressions over per ticker metrics, e.g. 'close > sma_200 and return_1y > 0.2'.
+
+The metrics of every ticker come from one load_price_matrix read of the last WINDOW_DAYS of
+closes and volumes, computed column-wise over the wide date x symbol frames. The table is cached with every
+ticker's data version, so it is computed once per price refresh, i.e. once per trading day.
+Filters are parsed with ast and only metric names, numbers, arithmetic, comparisons and
+and/or/not are accepted, nothing is ever eval'd.
+"""
+import ast
+from datetime import timedelta
+import hashlib
+import operator
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Max
+import numpy as np
+
+from .indicators import TRADING_DAYS, rsi
+from .lazy import LazyModule
+from .models import CompanyTicker, StockDataframe
+from .storage import load_price_matrix
+
+pd = LazyModule('pandas')
+
+# Metric -> description, returns are fractions (0.2 is 20%)
+METRICS = {
+    'close': "Last close",
+    'sma_50': "50 day simple moving average of the close",
+    'sma_200': "200 day simple moving average of the close",
+    'return_1m': "Return over 21 trading days",
+    'return_3m': "Return over 63 trading days",
+    'return_6m': "Return over 126 trading days",
+    'return_1y': "Return over 252 trading days",
+    'high_52w': "Highest close of the last 252 trading days",
+    'low_52w': "Lowest close of the last 252 trading days",
+    'from_high': "Last close relative to high_52w, 0 at the high",
+    'volatility': "Annualized volatility of the last year's daily log returns",
+    'rsi_14': "14 day Wilder RSI",
+    'avg_volume': "Average volume of the last 20 trading days",
+}
+# Return metric -> lookback in trading days
+RETURN_WINDOWS = {'return_1m': 21, 'return_3m': 63, 'return_6m': 126, 'return_1y': TRADING_DAYS}
+# Calendar days of bars loaded before the newest stored one, a year of trading days plus room for the RSI to settle
+WINDOW_DAYS = 400
+MAX_EXPRESSION = 500
+
+OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+}
+
+
+def metrics_table(closes, volumes):
+    """Computes METRICS for every column of wide date x symbol close and volume frames, one row per symbol."""
+    filled = closes.ffill()
+    last = filled.iloc[-1] if len(filled) else pd.Series(np.nan, index=closes.columns)
+    year = filled.iloc[-TRADING_DAYS:]
+    table = pd.DataFrame({
+        'close': last,
+        'sma_50': closes.iloc[-50:].mean(),
+        'sma_200': closes.iloc[-200:].mean(),
+        **{name: last / filled.iloc[-window - 1] - 1 if len(filled) > window else np.nan for name, window in RETURN_WINDOWS.items()},
+        'high_52w': year.max(),
+        'low_52w': year.min(),
+    }, index=closes.columns)
+    table['from_high'] = table.close / table.high_52w - 1
+    table['volatility'] = np.log(closes.iloc[-TRADING_DAYS - 1:]).diff().std() * np.sqrt(TRADING_DAYS)
+    table['rsi_14'] = rsi({'close': filled})['rsi'].iloc[-1] if len(filled) else np.nan
+    table['avg_volume'] = volumes.iloc[-20:].mean()
+    table.index.name = 'symbol'
+    return table
+
+def screener_metrics():
+    """METRICS for every stored ticker, cached until any ticker's data version changes."""
+    tickers = list(CompanyTicker.objects.only('id', 'stock_ticker', 'data_version').order_by('stock_ticker'))
+    state = ','.join(f'{ticker.id}.{ticker.data_version}' for ticker in tickers)
+    cache = caches[settings.CHART_CACHE_ALIAS]
+    key = f'screener:{hashlib.md5(state.encode()).hexdigest()}'
+    table = cache.get(key)
+    if table is None:
+        latest = StockDataframe.objects.aggregate(latest=Max('date'))['latest']
+        start = None if latest is None else latest - timedelta(days=WINDOW_DAYS)
+        prices = load_price_matrix(tickers, start=start, fields=('close', 'volume'))
+        table = metrics_table(prices['close'], prices['volume'])
+        cache.set(key, table)
+    return table
+
+def parse_filter(expression):
+    """Parses a filter expression, raises ValueError naming the first thing that isn't allowed."""
+    if len(expression) > MAX_EXPRESSION:
+        raise ValueError(f"Filters are limited to {MAX_EXPRESSION} characters.")
+    try:
+        tree = ast.parse(expression, mode='eval')
+    except SyntaxError:
+        raise ValueError("The filter isn't a valid expression.")
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and node.id not in METRICS:
+            raise ValueError(f"Unknown metric {node.id!r}.")
+        if isinstance(node, ast.Constant) and (isinstance(node.value, bool) or not isinstance(node.value, (int, float))):
+            raise ValueError(f"Only numbers can be compared, not {node.value!r}.")
+        if not isinstance(node, (
+            ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not, ast.USub, ast.UAdd,
+            ast.Compare, ast.BinOp, ast.Name, ast.Load, ast.Constant, *OPERATORS,
+        )):
+            raise ValueError(f"{type(node).__name__} isn't allowed in filters.")
+    if not _is_condition(tree.body):
+        raise ValueError("The filter has to be a comparison, like close > sma_200.")
+    try:
+        # Arithmetic on constants runs in Python and can fail, e.g. close > 1/0.
+        _evaluate(tree.body, pd.DataFrame(columns=list(METRICS), dtype='float64'))
+    except ArithmeticError:
+        raise ValueError("The filter can't be computed, check it for a division by zero.")
+    return tree
+
+def evaluate(tree, table):
+    """Evaluates a parsed filter over the metrics table, returns a boolean mask of its rows."""
+    return _evaluate(tree.body, table)
+
+def screen(expression='', sort=None, limit=None, symbols=None):
+    """Rows of the metrics table matching expression, limited to symbols, sorted by a metric ('-metric' descending).
+
+    Missing metrics never match a comparison and sort last.
+    """
+    table = screener_metrics()
+    if symbols is not None:
+        table = table[table.index.isin(symbols)]
+    if expression.strip():
+        table = table[evaluate(parse_filter(expression), table).to_numpy(dtype=bool)]
+    if sort:
+        table = table.sort_values(sort.lstrip('-'), ascending=not sort.startswith('-'), na_position='last', kind='stable')
+    return table.head(limit) if limit else table
+
+def _is_condition(node):
+    if isinstance(node, ast.BoolOp):
+        return all(_is_condition(value) for value in node.values)
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        return _is_condition(node.operand)
+    return isinstance(node, ast.Compare)
+
+def _evaluate(node, table):
+    if isinstance(node, ast.Name):
+        return table[node.id]
+    if isinstance(node, ast.Constant):
+        return node.value
+    if isinstance(node, ast.BinOp):
+        return OPERATORS[type(node.op)](_evaluate(node.left, table), _evaluate(node.right, table))
+    if isinstance(node, ast.UnaryOp):
+        operand = _evaluate(node.operand, table)
+        if isinstance(node.op, ast.Not):
+            return ~operand
+        return -operand if isinstance(node.op, ast.USub) else operand
+    if isinstance(node, ast.BoolOp):
+        masks = [_evaluate(value, table) for value in node.values]
+        combine = operator.and_ if isinstance(node.op, ast.And) else operator.or_
+        mask = masks[0]
+        for other in masks[1:]:
+            mask = combine(mask, other)
+        return mask
+    # Chained comparisons, a < b < c is a < b and b < c.
+    left = _evaluate(node.left, table)
+    mask = pd.Series(True, index=table.index)
+    for op, comparator in zip(node.ops, node.comparators):
+        right = _evaluate(comparator, table)
+        mask &= OPERATORS[type(op)](left, right)
+        left = right
+    return mask
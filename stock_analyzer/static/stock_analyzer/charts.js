@@ -0,0 +1,78 @@
+// Draws every .chart element on the page from the columnar JSON at its data-series-url.
+
+// Indicators on the price scale share the close axis, the others get a second axis on the right.
+function drawLine(element, series) {
+    const traces = [{x: series.dates, y: series.close, type: 'scatter', mode: 'lines', name: 'close'}];
+    const layout = {
+        title: {text: element.dataset.title},
+        xaxis: {title: {text: 'date'}},
+        yaxis: {title: {text: 'close'}},
+    };
+    Object.entries(series.indicators || {}).forEach(([spec, indicator]) => {
+        const yaxis = indicator.axis === 'price' ? 'y' : 'y2';
+        if (yaxis === 'y2') {
+            layout.yaxis2 = {overlaying: 'y', side: 'right'};
+        }
+        Object.entries(indicator.outputs).forEach(([output, values]) => {
+            traces.push({x: series.dates, y: values, type: 'scatter', mode: 'lines', name: `${spec} ${output}`, yaxis: yaxis});
+        });
+    });
+    Plotly.newPlot(element, traces, layout);
+}
+
+// One figure with a panel per calendar period, all sharing a y range from 0 to the highest close.
+const splitColumns = {year: 1, quarter: 2, month: 3, week: 4};
+
+function drawSplit(element, series) {
+    const columns = splitColumns[series.period] || 1;
+    const rows = Math.ceil(series.groups.length / columns);
+    const layout = {
+        grid: {rows: rows, columns: columns, pattern: 'independent'},
+        height: 425 * rows,
+        width: 750 * columns,
+        showlegend: false,
+        annotations: [],
+    };
+    const traces = series.groups.map((group, i) => {
+        const axis = i === 0 ? '' : i + 1;
+        layout[`yaxis${axis}`] = {range: [0, series.top]};
+        layout.annotations.push({
+            text: `${group.label} ${element.dataset.title}`,
+            xref: `x${axis} domain`, yref: `y${axis} domain`,
+            x: 0.5, y: 1.1, showarrow: false,
+        });
+        return {x: group.dates, y: group.close, type: 'scatter', mode: 'lines', name: group.label, xaxis: `x${axis}`, yaxis: `y${axis}`};
+    });
+    Plotly.newPlot(element, traces, layout);
+}
+
+// Portfolio market value against the cash put in, the gap between them is the total P&L.
+function drawEquity(element, series) {
+    const traces = ['value', 'invested'].map(field => ({x: series.dates, y: series[field], type: 'scatter', mode: 'lines', name: field}));
+    Plotly.newPlot(element, traces, {title: {text: element.dataset.title}, xaxis: {title: {text: 'date'}}});
+}
+
+// Every compared ticker's normalized closes overlaid on one axis, each symbol is a column of the series.
+function drawCompare(element, series) {
+    const symbols = Object.keys(series).filter(key => key !== 'dates' && key !== 'normalize');
+    const traces = symbols.map(symbol => ({x: series.dates, y: series[symbol], type: 'scatter', mode: 'lines', name: symbol}));
+    Plotly.newPlot(element, traces, {title: {text: element.dataset.title}, xaxis: {title: {text: 'date'}}});
+}
+
+const drawers = {line: drawLine, split: drawSplit, equity: drawEquity, compare: drawCompare};
+
+// Line charts ask for about one point per pixel of their width, the server downsamples.
+function seriesUrl(element) {
+    if (element.dataset.kind !== 'line') {
+        return element.dataset.seriesUrl;
+    }
+    const url = new URL(element.dataset.seriesUrl, window.location.href);
+    url.searchParams.set('width', element.clientWidth || window.innerWidth);
+    return url;
+}
+
+document.querySelectorAll('.chart').forEach(element => {
+    fetch(seriesUrl(element))
+        .then(response => response.json())
+        .then(series => drawers[element.dataset.kind](element, series));
+});
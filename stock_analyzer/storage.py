@@ -0,0 +1,83 @@
+"""Loads stored price history into DataFrames from the backend chosen by settings.STOCK_PRICE_STORAGE."""
+from django.conf import settings
+from django.db import connection
+import numpy as np
+
+from .columnar import PRICE_FIELDS, records_to_frame, unpack
+from .lazy import LazyModule
+from .models import PriceHistoryBlob, StockDataframe
+
+pd = LazyModule('pandas')
+
+
+def load_history(ticker, start=None, end=None, fields=PRICE_FIELDS):
+    """Returns the CompanyTicker's bars with start <= date < end as a date indexed frame of fields."""
+    if settings.STOCK_PRICE_STORAGE == 'blob':
+        data = PriceHistoryBlob.objects.filter(stock_ticker=ticker).values_list('data', flat=True).first()
+        if data is not None:
+            return records_to_frame(unpack(data, start, end), fields)
+    return load_rows(ticker, start, end, fields)
+
+def load_rows(ticker, start=None, end=None, fields=PRICE_FIELDS):
+    """Loads bars from the StockDataframe table.
+
+    The ORM only builds the SQL, rows come straight from the cursor so no model instances,
+    dicts or Decimals are created before the typed numpy columns.
+    """
+    stocks = _date_range(StockDataframe.objects.filter(stock_ticker_id=ticker.id), start, end) # Range scan on the (stock_ticker, date) index.
+    columns = _fetch_columns(stocks.order_by('date'), ['date', *fields])
+    return pd.DataFrame({
+        field: np.array(column, dtype='float64')
+        for field, column in zip(fields, columns[1:])
+    }, index=_date_index(columns[0]))
+
+def load_price_matrix(tickers, start=None, end=None, fields=('close',)):
+    """Loads many CompanyTickers' bars with one query into wide date x symbol frames, one per field.
+
+    Dates any ticker is missing are NaN for it.
+    """
+    tickers = list(tickers)
+    if settings.STOCK_PRICE_STORAGE == 'blob':
+        blobs = dict(PriceHistoryBlob.objects.filter(stock_ticker__in=tickers).values_list('stock_ticker_id', 'data'))
+        if len(blobs) == len(tickers):
+            records = [unpack(blobs[ticker.id], start, end) for ticker in tickers]
+            positions = np.repeat(np.arange(len(tickers)), [len(part) for part in records])
+            records = np.concatenate(records) if records else unpack(b'')
+            dates = pd.DatetimeIndex(records['date'].astype('datetime64[ns]'), name='date').tz_localize('UTC')
+            return _wide(tickers, positions, dates, {field: records[field] for field in fields})
+    if not tickers:
+        return {field: pd.DataFrame(index=_date_index([])) for field in fields}
+    stocks = _date_range(StockDataframe.objects.filter(stock_ticker__in=tickers), start, end)
+    columns = _fetch_columns(stocks.order_by('stock_ticker', 'date'), ['stock_ticker_id', 'date', *fields]) # Index order, no sort step.
+    ids = {ticker.id: position for position, ticker in enumerate(tickers)}
+    positions = np.array([ids[ticker_id] for ticker_id in columns[0]], dtype=int)
+    return _wide(tickers, positions, _date_index(columns[1]), dict(zip(fields, columns[2:])))
+
+def _wide(tickers, positions, dates, columns):
+    """Scatters long (ticker position, date, values) columns into date x symbol frames."""
+    date_codes, dates = pd.factorize(dates, sort=True)
+    symbols = [ticker.stock_ticker for ticker in tickers]
+    matrices = {}
+    for field, column in columns.items():
+        matrix = np.full((len(dates), len(tickers)), np.nan)
+        matrix[date_codes, positions] = np.asarray(column, dtype='float64')
+        matrices[field] = pd.DataFrame(matrix, index=dates.rename('date'), columns=symbols)
+    return matrices
+
+def _date_range(stocks, start, end):
+    if start is not None:
+        stocks = stocks.filter(date__gte=start)
+    if end is not None:
+        stocks = stocks.filter(date__lt=end)
+    return stocks
+
+def _fetch_columns(stocks, fields):
+    """Runs the queryset's SQL for fields on a plain cursor and returns one tuple per field."""
+    sql, params = stocks.values_list(*fields).query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    return list(zip(*rows)) or [()] * len(fields)
+
+def _date_index(dates):
+    return pd.DatetimeIndex(pd.to_datetime(list(dates), utc=True, format='ISO8601'), name='date')
@@ -1,3 +1,743 @@
-from django.test import TestCase
+from datetime import date, datetime, timedelta, timezone
+import importlib
+import importlib.util
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import pandas as pd
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .bench import BENCHMARKS, DEFAULT_BENCHMARKS, synthetic_history
+from .bulk import export_prices, import_prices
+from .chart_cache import cached_chart, chart_cache_stats
+from .compare import compare_tickers
+from .downsample import downsample
+from .indicators import compute, parse_spec, ticker_indicator
+from .intraday import compact_intraday, load_intraday, refresh_intraday, store_intraday
+from .ingest import claim_next_job, enqueue, refresh_prices, run_pending
+from .models import CompanyTicker, IngestJob, IntradayBlock, LatestQuote, Portfolio, PriceHistoryBlob, PriceRollup, StockDataframe, Transaction, YearlyStat, forget_symbol
+from .portfolio import value_portfolio
+from .providers import FixtureProvider, YahooProvider, get_history
+from .screener import parse_filter, screen
+from .rollups import check_rollups, update_rollups
+from .storage import load_history, load_rows
+
+
+def stub_fetcher(stock_ticker):
+    return synthetic_history(20)
+
+def empty_fetcher(stock_ticker):
+    return synthetic_history(0)
+
+
+@override_settings(INGEST_WORKER_THREADS=0, CHART_WORKER_THREADS=0)
+class IngestJobTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.bob = User.objects.create_user('bob', password='pw')
+
+    def test_concurrent_requests_share_one_job(self):
+        first = enqueue('AMD', self.alice)
+        second = enqueue('amd', self.bob)
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(IngestJob.objects.count(), 1)
+
+    def test_run_pending_stores_rows_for_every_requester(self):
+        enqueue('amd', self.alice)
+        enqueue('amd', self.bob)
+        self.assertEqual(run_pending(stub_fetcher), 1)
+        job = IngestJob.objects.get()
+        self.assertEqual((job.status, job.rows), (IngestJob.DONE, 20))
+        ticker = CompanyTicker.objects.get(stock_ticker='amd')
+        self.assertEqual(StockDataframe.objects.filter(stock_ticker=ticker).count(), 20)
+        self.assertEqual(set(ticker.users.all()), {self.alice, self.bob})
+
+    def test_finished_job_allows_a_new_one(self):
+        enqueue('amd', self.alice)
+        run_pending(empty_fetcher)
+        self.assertEqual(IngestJob.objects.get().status, IngestJob.FAILED)
+        enqueue('amd', self.alice)
+        self.assertEqual(IngestJob.objects.filter(status=IngestJob.PENDING).count(), 1)
+
+    def test_stalled_running_job_is_reclaimed(self):
+        enqueue('amd', self.alice)
+        self.assertEqual(claim_next_job().status, IngestJob.RUNNING)
+        self.assertEqual(run_pending(stub_fetcher), 0) # Still running elsewhere.
+        IngestJob.objects.update(updated=datetime.now(timezone.utc) - timedelta(hours=1))
+        self.assertEqual(run_pending(stub_fetcher), 1)
+        self.assertEqual(IngestJob.objects.get().status, IngestJob.DONE)
+
+    @override_settings(INGEST_WORKER_THREADS=1)
+    def test_leftover_pending_job_starts_the_worker(self):
+        IngestJob.objects.create(stock_ticker='amd')
+        with self.captureOnCommitCallbacks() as callbacks:
+            job = enqueue('amd', self.alice)
+        self.assertEqual(job.status, IngestJob.PENDING)
+        self.assertEqual(len(callbacks), 1)
+
+    @override_settings(INGEST_FETCH_CONCURRENCY=2)
+    def test_queued_jobs_fetch_concurrently(self):
+        both_fetching = threading.Barrier(2, timeout=5) # Breaks unless two fetches overlap.
+
+        def fetcher(stock_ticker):
+            both_fetching.wait()
+            return synthetic_history(20)
+        enqueue('amd', self.alice)
+        enqueue('msft', self.alice)
+        self.assertEqual(run_pending(fetcher), 2)
+        self.assertEqual(set(IngestJob.objects.values_list('status', flat=True)), {IngestJob.DONE})
+
+    def test_get_stock_view_returns_before_fetching(self):
+        self.client.login(username='alice', password='pw')
+        response = self.client.post(reverse('get_stock'), {'stock_ticker': 'amd'})
+        self.assertRedirects(response, reverse('hub'))
+        self.assertEqual(IngestJob.objects.get().status, IngestJob.PENDING)
+        self.assertContains(self.client.get(reverse('hub')), 'AMD: Pending')
+
+
+class RefreshPricesTests(TestCase):
+    def setUp(self):
+        for symbol in ['amd', 'msft']:
+            ticker = CompanyTicker.objects.create(stock_ticker=symbol)
+            StockDataframe.objects.ingest_dataframe(ticker, synthetic_history(20, end='2024-10-04'))
+        self.calls = []
+
+    def batch_fetcher(self, stock_tickers, start):
+        self.calls.append((sorted(stock_tickers), start))
+        return {symbol: synthetic_history(6, seed=1, end='2024-10-11') for symbol in stock_tickers}
+
+    def test_only_new_bars_are_fetched_and_appended(self):
+        written = refresh_prices(fetcher=self.batch_fetcher)
+        self.assertEqual(self.calls, [(['amd', 'msft'], date(2024, 10, 4))])
+        self.assertEqual(written, {'amd': 6, 'msft': 6})
+        self.assertEqual(StockDataframe.objects.filter(stock_ticker__stock_ticker='amd').count(), 25)
+
+    def test_naive_daily_bars_update_the_stored_days(self):
+        naive = lambda stock_tickers, start: {symbol: synthetic_history(6, seed=1, end='2024-10-11').tz_localize(None) for symbol in stock_tickers}
+        written = refresh_prices(['amd'], fetcher=naive)
+        self.assertEqual(written, {'amd': 6})
+        self.assertEqual(StockDataframe.objects.filter(stock_ticker__stock_ticker='amd').count(), 25)
+
+    def test_refresh_keeps_rollups_consistent(self):
+        ticker = CompanyTicker.objects.create(stock_ticker='nvda')
+        StockDataframe.objects.ingest_dataframe(ticker, synthetic_history(600, end='2024-10-04'))
+        update_rollups(ticker)
+        refresh_prices(['nvda'], fetcher=self.batch_fetcher)
+        self.assertEqual(check_rollups(ticker), [])
+        self.assertEqual(YearlyStat.objects.filter(stock_ticker=ticker).count(), 3)
+        self.assertTrue(PriceRollup.objects.filter(stock_ticker=ticker, period=PriceRollup.WEEK, start=date(2024, 10, 7)).exists())
+
+    def test_failed_batch_does_not_stop_the_others(self):
+        StockDataframe.objects.filter(stock_ticker__stock_ticker='msft', date__gte=datetime(2024, 10, 4, tzinfo=timezone.utc)).delete()
+
+        def fetcher(stock_tickers, start):
+            if stock_tickers == ['amd']:
+                raise OSError('rate limited')
+            return self.batch_fetcher(stock_tickers, start)
+
+        with self.assertLogs('stock_analyzer.ingest', 'WARNING') as logs:
+            written = refresh_prices(fetcher=fetcher)
+        self.assertEqual(written, {'msft': 6})
+        self.assertIn('AMD', logs.output[0])
+
+    def test_rows_and_version_commit_with_the_rollups(self):
+        ticker = CompanyTicker.objects.get_by_symbol('amd')
+        with mock.patch('stock_analyzer.ingest.update_rollups', side_effect=RuntimeError), self.assertRaises(RuntimeError):
+            refresh_prices(['amd'], fetcher=self.batch_fetcher)
+        self.assertEqual(StockDataframe.objects.filter(stock_ticker=ticker).count(), 20)
+        self.assertEqual(CompanyTicker.objects.get(pk=ticker.pk).data_version, ticker.data_version)
+
+    def test_refresh_backfills_tickers_stored_without_rollups(self):
+        ticker = CompanyTicker.objects.create(stock_ticker='nvda')
+        StockDataframe.objects.ingest_dataframe(ticker, synthetic_history(600, end='2024-10-04'))
+        refresh_prices(['nvda'], fetcher=self.batch_fetcher)
+        self.assertEqual(check_rollups(ticker), [])
+        self.assertEqual(YearlyStat.objects.filter(stock_ticker=ticker).count(), 3)
+        self.assertTrue(LatestQuote.objects.filter(stock_ticker=ticker).exists())
+
+
+class BackfillMigrationTests(TestCase):
+    def setUp(self):
+        self.ticker = CompanyTicker.objects.create(stock_ticker='nvda')
+        StockDataframe.objects.ingest_dataframe(self.ticker, synthetic_history(600, end='2024-10-04'))
+
+    def migrate(self, name):
+        importlib.import_module(f'stock_analyzer.migrations.{name}').Migration.operations[0].code(apps, connection.schema_editor())
+
+    def test_tickers_stored_without_rollups_get_them(self):
+        self.migrate('0020_backfill_rollups')
+        self.assertEqual([problem for problem in check_rollups(self.ticker) if 'quote' not in problem], [])
+        self.assertEqual(YearlyStat.objects.filter(stock_ticker=self.ticker).count(), 3)
+        self.assertGreater(CompanyTicker.objects.get(pk=self.ticker.pk).data_version, self.ticker.data_version)
+
+    def test_tickers_stored_without_a_quote_get_one(self):
+        self.migrate('0021_backfill_latestquote')
+        self.assertEqual([problem for problem in check_rollups(self.ticker) if 'quote' in problem], [])
+        self.assertIsNotNone(LatestQuote.objects.get(stock_ticker=self.ticker).year_change)
+
+
+class FixtureProviderTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        synthetic_history(30, end='2024-10-04').to_csv(f'{self.directory.name}/amd.csv')
+
+    def test_reads_csv_and_filters_range(self):
+        frames = FixtureProvider(self.directory.name).get_history(['amd', 'msft'], start=date(2024, 10, 1))
+        self.assertEqual(list(frames), ['amd'])
+        self.assertEqual(len(frames['amd']), 4)
+
+    @override_settings(INGEST_WORKER_THREADS=0, STOCK_DATA_PROVIDER='stock_analyzer.providers.FixtureProvider')
+    def test_ingestion_runs_offline_from_settings(self):
+        with self.settings(STOCK_FIXTURE_DIR=self.directory.name):
+            self.assertEqual(len(get_history(['AMD'])['amd']), 30)
+            enqueue('amd')
+            run_pending()
+        self.assertEqual(StockDataframe.objects.count(), 30)
+
+
+class YahooProviderTests(TestCase):
+    def download(self, symbols, **kwargs):
+        return pd.concat({symbol.upper(): synthetic_history(5, end='2024-10-04').tz_localize(None) for symbol in symbols}, axis=1)
+
+    def test_reingested_days_update_the_stored_rows(self):
+        ticker = CompanyTicker.objects.create(stock_ticker='amd')
+        StockDataframe.objects.ingest_dataframe(ticker, synthetic_history(5, end='2024-10-04'))
+        with mock.patch('yfinance.download', self.download):
+            df = YahooProvider().get_history(['amd'], start=date(2024, 9, 30))['amd']
+        self.assertEqual(str(df.index.tz), 'UTC')
+        StockDataframe.objects.ingest_dataframe(ticker, df, upsert=True)
+        self.assertEqual(StockDataframe.objects.filter(stock_ticker=ticker).count(), 5)
+
+
+@override_settings(STOCK_PRICE_STORAGE='blob')
+class PriceHistoryBlobTests(TestCase):
+    def test_blob_matches_rows_after_incremental_ingest(self):
+        ticker = CompanyTicker.objects.create(stock_ticker='amd')
+        StockDataframe.objects.ingest_dataframe(ticker, synthetic_history(20, end='2024-10-04'))
+        StockDataframe.objects.ingest_dataframe(ticker, synthetic_history(6, seed=1, end='2024-10-11'), upsert=True)
+        self.assertEqual(PriceHistoryBlob.objects.get().rows, 25)
+        start = datetime(2024, 10, 1, tzinfo=timezone.utc)
+        packed = load_history(ticker, start=start)
+        with self.settings(STOCK_PRICE_STORAGE='orm'):
+            rows = load_history(ticker, start=start)
+        self.assertEqual(list(packed.index), list(rows.index))
+        self.assertEqual(list(packed.close.round(6)), list(rows.close.round(6)))
+
+
+class ChartCacheTests(TestCase):
+    def test_ingest_invalidates_cached_chart(self):
+        ticker = CompanyTicker.objects.create(stock_ticker='amd')
+        builds = []
+        build = lambda: builds.append(1) or f'chart {len(builds)}'
+        self.assertEqual(cached_chart(ticker, 'five_year', build), 'chart 1')
+        self.assertEqual(cached_chart(ticker, 'five_year', build), 'chart 1')
+        StockDataframe.objects.ingest_dataframe(ticker, synthetic_history(5))
+        ticker.refresh_from_db()
+        self.assertEqual(cached_chart(ticker, 'five_year', build), 'chart 2')
+
+
+@override_settings(CHART_WORKER_THREADS=0)
+class SeriesViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='pw')
+        self.client.force_login(self.user)
+        ticker = CompanyTicker.objects.create(stock_ticker='amd')
+        StockDataframe.objects.ingest_dataframe(ticker, synthetic_history(30, end='2024-10-04'))
+
+    def test_returns_requested_columns(self):
+        response = self.client.get(reverse('series', args=['AMD']), {'start': '2024-10-01', 'fields': 'close,volume'})
+        series = response.json()
+        self.assertEqual(series['dates'], ['2024-10-01', '2024-10-02', '2024-10-03', '2024-10-04'])
+        self.assertEqual(len(series['close']), 4)
+        self.assertIsInstance(series['volume'][0], int)
+
+    def test_period_groups_share_top_close(self):
+        series = self.client.get(reverse('series', args=['amd']), {'period': 'month'}).json()
+        self.assertEqual([group['label'] for group in series['groups']], ['2024-08', '2024-09', '2024-10'])
+        self.assertEqual(series['top'], max(close for group in series['groups'] for close in group['close']))
+
+    def test_unchanged_data_is_not_sent_again(self):
+        url = reverse('series', args=['amd'])
+        etag = self.client.get(url).headers['ETag']
+        self.assertEqual(self.client.get(url, headers={'if-none-match': etag}).status_code, 304)
+
+
+class DownsampleTests(TestCase):
+    def test_lttb_keeps_endpoints_and_point_count(self):
+        df = synthetic_history(1260)[['Close']].rename(columns={'Close': 'close'})
+        sampled = downsample(df, 200)
+        self.assertEqual(len(sampled), 200)
+        self.assertEqual((sampled.index[0], sampled.index[-1]), (df.index[0], df.index[-1]))
+
+    def test_ohlc_buckets_aggregate_every_bar(self):
+        df = synthetic_history(1260).rename(columns=str.lower)[['open', 'high', 'low', 'close', 'volume']]
+        buckets = downsample(df, 100, 'ohlc')
+        self.assertLessEqual(len(buckets), 100)
+        self.assertEqual(buckets.volume.sum(), df.volume.sum())
+        self.assertEqual((buckets.high.max(), buckets.low.min()), (df.high.max(), df.low.min()))
+        self.assertEqual((buckets.open.iloc[0], buckets.close.iloc[-1]), (df.open.iloc[0], df.close.iloc[-1]))
+
+
+class IndicatorTests(TestCase):
+    def test_incremental_tail_matches_full_recompute(self):
+        ticker = CompanyTicker.objects.create(stock_ticker='amd')
+        StockDataframe.objects.ingest_dataframe(ticker, synthetic_history(800, end='2024-10-04'))
+        for spec in ['sma:20', 'macd:12:26:9', 'atr:14']:
+            ticker_indicator(ticker, spec)
+        StockDataframe.objects.ingest_dataframe(ticker, synthetic_history(6, seed=1, end='2024-10-11'), upsert=True)
+        ticker.refresh_from_db()
+        history = load_history(ticker)
+        for spec in ['sma:20', 'macd:12:26:9', 'atr:14']:
+            incremental = ticker_indicator(ticker, spec)
+            full = pd.DataFrame(compute(history, spec))
+            self.assertEqual(len(incremental), 805)
+            pd.testing.assert_frame_equal(incremental, full, check_freq=False)
+
+    def test_rewritten_history_is_recomputed_in_full(self):
+        ticker = CompanyTicker.objects.create(stock_ticker='amd')
+        StockDataframe.objects.ingest_dataframe(ticker, synthetic_history(800, end='2024-10-04'))
+        ticker_indicator(ticker, 'sma:20')
+        StockDataframe.objects.ingest_dataframe(ticker, synthetic_history(30, seed=1, end='2024-06-28'), upsert=True)
+        ticker.refresh_from_db()
+        full = pd.DataFrame(compute(load_history(ticker), 'sma:20'))
+        pd.testing.assert_frame_equal(ticker_indicator(ticker, 'sma:20'), full, check_freq=False)
+
+    def test_non_positive_or_fractional_windows_are_dropped(self):
+        for spec in ['sma:2.5', 'ema:0', 'rsi:-3']:
+            with self.assertRaises(ValueError):
+                parse_spec(spec)
+        self.assertEqual(parse_spec('bollinger:20:2.5'), ('bollinger', (20, 2.5)))
+        ticker = CompanyTicker.objects.create(stock_ticker='amd')
+        StockDataframe.objects.ingest_dataframe(ticker, synthetic_history(30, end='2024-10-04'))
+        user = User.objects.create_user('alice', password='pw')
+        self.client.force_login(user)
+        with self.settings(CHART_WORKER_THREADS=0):
+            response = self.client.get(reverse('series', args=['amd']), {'indicators': 'sma:2.5,ema:0,sma:5'})
+        self.assertEqual(list(response.json()['indicators']), ['sma:5'])
+
+
+class PortfolioTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='pw')
+        self.portfolio = Portfolio.objects.create(user=self.user)
+        self.amd = CompanyTicker.objects.create(stock_ticker='amd')
+        self.msft = CompanyTicker.objects.create(stock_ticker='msft')
+        StockDataframe.objects.ingest_dataframe(self.amd, synthetic_history(30, end='2024-10-04'))
+        StockDataframe.objects.ingest_dataframe(self.msft, synthetic_history(30, seed=1, end='2024-10-04'))
+        Transaction.objects.record(self.portfolio, self.amd, date(2024, 9, 2), 10, 100)
+        Transaction.objects.record(self.portfolio, self.amd, date(2024, 9, 9), 10, 120)
+        Transaction.objects.record(self.portfolio, self.amd, date(2024, 9, 16), -5, 130)
+        Transaction.objects.record(self.portfolio, self.msft, date(2024, 9, 20), 4, 90)
+
+    def test_average_cost_realized_and_unrealized_pnl(self):
+        self.portfolio.refresh_from_db()
+        valuation = value_portfolio(self.portfolio)
+        amd, msft = valuation['holdings']
+        self.assertEqual(amd['quantity'], 15)
+        self.assertAlmostEqual(amd['cost_basis'], 15 * 110)
+        self.assertAlmostEqual(amd['realized_pnl'], 5 * (130 - 110))
+        close = float(load_history(self.amd, fields=['close']).close.iloc[-1])
+        self.assertAlmostEqual(amd['unrealized_pnl'], 15 * close - 15 * 110)
+        self.assertAlmostEqual(valuation['totals']['value'], amd['value'] + msft['value'])
+
+    def test_equity_curve_ends_at_total_pnl(self):
+        self.portfolio.refresh_from_db()
+        valuation = value_portfolio(self.portfolio)
+        curve, totals = valuation['curve'], valuation['totals']
+        self.assertEqual(curve.index[0].date(), date(2024, 9, 2))
+        self.assertEqual(curve.invested.iloc[0], 1000)
+        self.assertAlmostEqual(curve.value.iloc[-1], totals['value'])
+        self.assertAlmostEqual(curve.pnl.iloc[-1], totals['unrealized_pnl'] + totals['realized_pnl'])
+
+    def test_valuation_is_cached_until_prices_change(self):
+        self.portfolio.refresh_from_db()
+        value_portfolio(self.portfolio)
+        with self.assertNumQueries(1):
+            value_portfolio(self.portfolio)
+        StockDataframe.objects.ingest_dataframe(self.amd, synthetic_history(1, seed=2, end='2024-10-07'))
+        self.assertEqual(value_portfolio(self.portfolio)['curve'].index[-1].date(), date(2024, 10, 7))
+
+    @override_settings(CHART_WORKER_THREADS=0)
+    def test_invalid_transaction_errors_are_shown_on_the_hub(self):
+        self.amd.users.add(self.user)
+        self.client.force_login(self.user)
+        data = {'stock_ticker': self.amd.pk, 'date': '2024-10-01', 'quantity': 0, 'price': 100}
+        response = self.client.post(reverse('add_transaction'), data, follow=True)
+        self.assertRedirects(response, reverse('hub'))
+        self.assertContains(response, "Quantity: Quantity can&#x27;t be zero.")
+        self.assertEqual(Transaction.objects.count(), 4)
+
+
+@override_settings(CHART_WORKER_THREADS=0)
+class CompareTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='pw')
+        self.client.force_login(self.user)
+        self.tickers = []
+        for seed, symbol in enumerate(['amd', 'msft', 'nvda']):
+            ticker = CompanyTicker.objects.create(stock_ticker=symbol)
+            ticker.users.add(self.user)
+            StockDataframe.objects.ingest_dataframe(ticker, synthetic_history(60 - 10 * seed, seed=seed, end='2024-10-04'))
+            self.tickers.append(ticker)
+
+    def test_tickers_load_in_one_query_and_rebase_to_100(self):
+        with self.assertNumQueries(1):
+            comparison = compare_tickers(self.tickers)
+        series = comparison['series']
+        self.assertEqual(list(series.columns), ['AMD', 'MSFT', 'NVDA'])
+        self.assertEqual(len(series), 60)
+        self.assertEqual([series[symbol].dropna().iloc[0] for symbol in series.columns], [100, 100, 100])
+        self.assertEqual(list(comparison['correlation'].to_numpy().diagonal().round(6)), [1, 1, 1])
+        self.assertAlmostEqual(comparison['performance'].relative_return.sum(), 0)
+
+    def test_compare_view_renders_tables_and_series_url(self):
+        response = self.client.post(reverse('compare_select'), {'tickers': [ticker.id for ticker in self.tickers], 'normalize': 'return'})
+        self.assertContains(response, 'Correlation of Daily Returns')
+        series = self.client.get(response.context['series_url']).json()
+        self.assertEqual(series['normalize'], 'return')
+        self.assertEqual(series['AMD'][0], 0)
+
+    def test_series_without_known_tickers_is_a_bad_request(self):
+        for params in [{}, {'tickers': 'nope,zzz'}]:
+            response = self.client.get(reverse('compare_series'), params)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('tickers', response.json()['errors'])
+
+    def test_compare_needs_two_tickers(self):
+        response = self.client.post(reverse('compare_select'), {'tickers': [self.tickers[0].id]})
+        self.assertFormError(response.context['form'], 'tickers', "Pick at least two tickers to compare.")
+
+
+class TickerRegistryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='pw')
+        self.client.force_login(self.user)
+
+    def add_existing_ticker_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('get_stock'), {'stock_ticker': ' AMD'})
+        return len(queries)
+
+    def test_adding_a_stored_ticker_costs_the_same_queries_at_any_table_size(self):
+        CompanyTicker.objects.create(stock_ticker='AMD')
+        few = self.add_existing_ticker_queries()
+        CompanyTicker.objects.bulk_create(CompanyTicker(stock_ticker=f't{i}') for i in range(500))
+        self.assertEqual(self.add_existing_ticker_queries(), few)
+        self.assertEqual(list(self.user.tickers.values_list('stock_ticker', flat=True)), ['amd'])
+        self.assertFalse(IngestJob.objects.exists())
+
+    def test_symbols_are_normalized_and_unique(self):
+        ticker, created = CompanyTicker.objects.get_or_create_symbol(' Msft ')
+        self.assertTrue(created)
+        self.assertEqual(CompanyTicker.objects.get_or_create_symbol('MSFT'), (ticker, False))
+        self.assertEqual(CompanyTicker.objects.get_by_symbol('msft'), ticker)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            CompanyTicker.objects.create(stock_ticker='MSFT')
+        ticker.delete()
+        self.assertFalse(CompanyTicker.objects.has_symbol('msft'))
+
+    def test_committed_lookups_are_served_from_the_cache(self):
+        self.addCleanup(forget_symbol)
+        ticker = CompanyTicker.objects.create(stock_ticker='nvda')
+        with self.captureOnCommitCallbacks(execute=True):
+            CompanyTicker.objects.symbol_id('NVDA')
+        with self.assertNumQueries(0):
+            self.assertEqual(CompanyTicker.objects.symbol_id('nvda'), ticker.id)
+        ticker.delete()
+        self.assertIsNone(CompanyTicker.objects.symbol_id('nvda'))
+
+    @override_settings(INGEST_WORKER_THREADS=0)
+    def test_ticker_deleted_by_another_process_is_fetched_again(self):
+        self.addCleanup(forget_symbol)
+        ticker = CompanyTicker.objects.create(stock_ticker='nvda')
+        with self.captureOnCommitCallbacks(execute=True):
+            CompanyTicker.objects.symbol_id('nvda')
+        CompanyTicker.objects.filter(pk=ticker.pk)._raw_delete(connection.alias) # No signal, the cached id stays.
+        response = self.client.post(reverse('get_stock'), {'stock_ticker': 'nvda'})
+        self.assertRedirects(response, reverse('hub'), fetch_redirect_response=False)
+        self.assertEqual(IngestJob.objects.get().stock_ticker, 'nvda')
+
+
+@override_settings(CHART_WORKER_THREADS=0, METRICS_TOKEN='scrape')
+class RequestTimingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='pw')
+        self.client.force_login(self.user)
+        ticker = CompanyTicker.objects.create(stock_ticker='amd')
+        StockDataframe.objects.ingest_dataframe(ticker, synthetic_history(30, end='2024-10-04'))
+
+    def test_server_timing_has_stages_and_queries(self):
+        timing = self.client.get(reverse('series', args=['amd'])).headers['Server-Timing']
+        self.assertIn('load;dur=', timing)
+        self.assertRegex(timing, r'db;dur=[\d.]+;desc="\d+ queries"')
+        self.assertIn('total;dur=', timing)
+
+    def test_metrics_need_staff_or_the_token(self):
+        self.client.get(reverse('hub'))
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        response = self.client.get(reverse('metrics'), headers={'authorization': 'Bearer scrape'})
+        self.assertContains(response, 'stock_requests_total{view="hub",status="200"}')
+        self.assertContains(response, 'stock_chart_cache_requests_total{result="hit"}')
+
+    def test_staff_can_profile_a_request(self):
+        self.assertNotIn('cumulative', self.client.get(reverse('hub'), {'profile': '1'}).content.decode())
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(reverse('hub'), {'profile': '1'})
+        self.assertEqual(response.headers['Content-Type'], 'text/plain')
+        self.assertContains(response, 'function calls')
+
+
+class BenchTests(TestCase):
+    def test_paths_benchmark_writes_json(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'bench.json')
+        call_command('bench', 'paths', scales=[1, 3], rows=300, repeat=1, json=path, stdout=io.StringIO())
+        with open(path) as f:
+            report = json.load(f)
+        self.assertIn('database', report)
+        self.assertEqual(list(report['results']['paths']), ['1', '3'])
+        self.assertGreater(report['results']['paths']['3']['view_series_ms'], 0)
+        self.assertFalse(CompanyTicker.objects.exists())
+
+    def test_concurrency_benchmark_only_runs_when_named(self):
+        self.assertIn('concurrency', BENCHMARKS)
+        self.assertNotIn('concurrency', DEFAULT_BENCHMARKS)
+
+
+def minute_bars(periods, start, freq='1min'):
+    df = synthetic_history(periods)
+    df.index = pd.date_range(start, periods=periods, freq=freq, tz='UTC', name='Datetime')
+    return df
+
+
+@override_settings(CHART_WORKER_THREADS=0, INTRADAY_RETENTION={'1m': 7, '5m': 60, '1h': 730})
+class IntradayTests(TestCase):
+    def setUp(self):
+        self.ticker = CompanyTicker.objects.create(stock_ticker='amd')
+        StockDataframe.objects.ingest_dataframe(self.ticker, synthetic_history(30, end='2024-10-04'))
+
+    def test_bars_are_partitioned_by_month_and_reads_only_load_their_months(self):
+        store_intraday(self.ticker, '1h', minute_bars(48, '2024-09-30 00:00', '1h'))
+        self.assertEqual(list(IntradayBlock.objects.order_by('month').values_list('month', 'rows')), [(date(2024, 9, 1), 24), (date(2024, 10, 1), 24)])
+        start = datetime(2024, 10, 1, 6, tzinfo=timezone.utc)
+        with CaptureQueriesContext(connection) as queries:
+            df = load_intraday(self.ticker, '1h', start=start)
+        self.assertEqual(len(df), 18)
+        self.assertIn('"month" >=', queries[0]['sql'])
+
+    def test_old_minute_bars_are_compacted_into_five_minute_bars(self):
+        bars = minute_bars(600, '2024-10-10 13:30')
+        store_intraday(self.ticker, '1m', bars)
+        compacted = compact_intraday(now=datetime(2024, 10, 18, 12, tzinfo=timezone.utc)) # 1m cutoff: 2024-10-11 00:00
+        self.assertEqual(compacted, {'1m': 600})
+        self.assertFalse(IntradayBlock.objects.filter(interval='1m').exists())
+        five = load_intraday(self.ticker, '5m')
+        self.assertEqual(len(five), 120)
+        self.assertEqual(five.volume.sum(), bars.Volume.sum())
+        self.assertEqual(five.high.iloc[0], bars.High.iloc[:5].max())
+
+    def test_refresh_fetches_from_the_last_stored_bar(self):
+        calls = []
+
+        def fetcher(symbols, start, end, interval):
+            calls.append((interval, start))
+            return {'amd': minute_bars(10, start or '2024-10-03 13:30', '5min')}
+
+        refresh_intraday(intervals=['5m'], fetcher=fetcher)
+        refresh_intraday(intervals=['5m'], fetcher=fetcher)
+        self.assertEqual(calls[1], ('5m', datetime(2024, 10, 3, 14, 15, tzinfo=timezone.utc)))
+        self.assertEqual(len(load_intraday(self.ticker, '5m')), 19)
+
+    def test_refresh_batches_tickers_and_skips_failed_fetches(self):
+        CompanyTicker.objects.create(stock_ticker='msft')
+        calls = []
+
+        def fetcher(symbols, start, end, interval):
+            calls.append((interval, sorted(symbols)))
+            if interval == '1m':
+                raise OSError('rate limited')
+            return {symbol: minute_bars(10, '2024-10-03 13:30', '5min') for symbol in symbols}
+
+        with self.assertLogs('stock_analyzer.intraday', 'WARNING') as logs:
+            written = refresh_intraday(intervals=['1m', '5m'], fetcher=fetcher)
+        self.assertEqual(sorted(calls), [('1m', ['amd', 'msft']), ('5m', ['amd', 'msft'])])
+        self.assertEqual(written, {('amd', '5m'): 10, ('msft', '5m'): 10})
+        self.assertIn('rate limited', logs.output[0])
+
+    def test_series_picks_the_interval_from_the_span(self):
+        self.client.force_login(User.objects.create_user('alice', password='pw'))
+        store_intraday(self.ticker, '5m', minute_bars(20, '2024-10-03 13:30', '5min'))
+        url = reverse('series', args=['amd'])
+        series = self.client.get(url, {'start': '2024-10-02', 'end': '2024-10-04'}).json()
+        self.assertEqual(series['interval'], '5m')
+        self.assertEqual(series['dates'][0], '2024-10-03T13:30:00Z')
+        self.assertEqual(self.client.get(url, {'start': '2024-09-01'}).json()['interval'], '1d')
+
+
+@override_settings(CHART_WORKER_THREADS=0)
+class ScreenerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='pw')
+        index = pd.bdate_range(end='2024-10-04', periods=300, tz='UTC')
+        for symbol, closes in (('up', range(100, 400)), ('down', range(400, 100, -1)), ('other', range(200, 500))):
+            ticker = CompanyTicker.objects.create(stock_ticker=symbol)
+            StockDataframe.objects.ingest_dataframe(ticker, pd.DataFrame({'Close': [float(close) for close in closes], 'Volume': 1000}, index=index))
+            if symbol != 'other':
+                ticker.users.add(self.user)
+
+    def test_filters_are_validated_before_evaluating(self):
+        for expression in ("__import__('os')", "close.real > 1", "close > 'a'", "price > 1", "close", "close > 1 if 1 else 2", "close > 1/0", "close > 2 / (1 - 1)"):
+            with self.subTest(expression), self.assertRaises(ValueError):
+                parse_filter(expression)
+
+    def test_screen_filters_and_sorts_every_ticker(self):
+        self.assertEqual(list(screen('close > sma_200 and not return_1y < 0').index), ['other', 'up'])
+        self.assertEqual(list(screen('-1 < return_1m < 0', symbols=['up', 'down']).index), ['down'])
+        table = screen(sort='-return_1y', limit=2)
+        self.assertEqual(list(table.index), ['up', 'other'])
+        self.assertAlmostEqual(table.return_1y['up'], 399 / 147 - 1)
+        with self.assertNumQueries(1):
+            screen('rsi_14 > 50')
+
+    def test_views_screen_the_users_tickers(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('screener'), {'filter': 'from_high == 0'})
+        self.assertEqual([symbol for symbol, values in response.context['rows']], ['UP'])
+        rows = self.client.get(reverse('screener_json'), {'sort': 'close'}).json()['rows']
+        self.assertEqual([row['symbol'] for row in rows], ['DOWN', 'UP'])
+        self.assertEqual(self.client.get(reverse('screener_json'), {'filter': 'open('}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('screener_json'), {'filter': 'close > 1/0'}).status_code, 400)
+        self.assertContains(self.client.get(reverse('screener'), {'filter': 'close > 1/0'}), 'division by zero')
+
+
+class BulkPriceFileTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        for seed, symbol in enumerate(['amd', 'msft']):
+            ticker = CompanyTicker.objects.create(stock_ticker=symbol)
+            StockDataframe.objects.ingest_dataframe(ticker, synthetic_history(120, seed=seed))
+        self.stored = {ticker.stock_ticker: load_rows(ticker) for ticker in CompanyTicker.objects.all()}
+
+    def round_trip(self, name):
+        path = os.path.join(self.directory.name, name)
+        self.assertEqual(export_prices(path, chunk_rows=100)['rows'], 240)
+        CompanyTicker.objects.all().delete()
+        stats = import_prices(path, chunk_rows=50) # Chunks split tickers.
+        self.assertEqual((stats['rows'], stats['tickers']), (240, 2))
+        for symbol, stored in self.stored.items():
+            ticker = CompanyTicker.objects.get_by_symbol(symbol)
+            pd.testing.assert_frame_equal(load_rows(ticker), stored)
+            self.assertEqual(check_rollups(ticker), [])
+        return path
+
+    def test_csv_round_trip_and_reimport_upserts(self):
+        path = self.round_trip('prices.csv.gz')
+        import_prices(path)
+        self.assertEqual(StockDataframe.objects.count(), 240)
+
+    @skipUnless(importlib.util.find_spec('pyarrow'), "pyarrow is not installed")
+    def test_parquet_round_trip(self):
+        self.round_trip('prices.parquet')
+
+
+@override_settings(CHART_WORKER_THREADS=0, CHART_WARM_WIDTHS=[1200])
+class WarmCacheTests(TestCase):
+    def setUp(self):
+        caches[settings.CHART_CACHE_ALIAS].clear()
+        self.user = User.objects.create_user('alice', password='pw')
+        self.client.force_login(self.user)
+        self.ticker = CompanyTicker.objects.create(stock_ticker='amd')
+        StockDataframe.objects.ingest_dataframe(self.ticker, synthetic_history(300, end='2024-10-04'))
+        self.ticker.add_user(self.user)
+
+    def test_pages_hit_the_warmed_series(self):
+        output = io.StringIO()
+        call_command('warm_cache', stdout=output)
+        self.assertIn('Warmed 2 series of 1 tickers', output.getvalue())
+        before = chart_cache_stats()
+        url = reverse('series', args=['amd'])
+        self.client.get(url, {'width': 1150})
+        self.client.get(url, {'period': 'year'})
+        after = chart_cache_stats()
+        self.assertEqual((after['hits'] - before['hits'], after['misses'] - before['misses']), (2, 0))
+
+    @override_settings(INGEST_WORKER_THREADS=1)
+    def test_refresh_warms_after_commit(self):
+        fetcher = lambda stock_tickers, start: {symbol: synthetic_history(3, end='2024-10-08') for symbol in stock_tickers}
+        with self.captureOnCommitCallbacks() as callbacks:
+            refresh_prices(fetcher=fetcher)
+        self.assertEqual(len(callbacks), 1)
+
+    def test_login_signup_and_hub_import_neither_pandas_nor_plotly(self):
+        code = (
+            "import sys, django; django.setup(); from django.db import connection; "
+            "connection.creation.create_test_db(verbosity=0); "
+            "from django.contrib.auth.models import User; from django.test import Client; client = Client(); "
+            f"assert client.get('{reverse('login')}').status_code == 200; "
+            f"assert client.get('{reverse('signup')}').status_code == 200; "
+            "client.force_login(User.objects.create_user('alice')); "
+            f"assert client.get('{reverse('hub')}').status_code == 200; "
+            "print(sorted({'pandas', 'plotly', 'yfinance'} & set(sys.modules)))"
+        )
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'stock_project.settings', 'SECRET_KEY': 'x'}
+        result = subprocess.run([sys.executable, '-c', code], cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.strip(), '[]')
+
+
+@override_settings(CHART_WORKER_THREADS=0)
+class HubQuoteTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice', password='pw')
+        self.client.force_login(self.user)
+        for i, symbol in enumerate(['amd', 'msft', 'nvda']):
+            ticker = CompanyTicker.objects.create(stock_ticker=symbol)
+            StockDataframe.objects.ingest_dataframe(ticker, synthetic_history(300, seed=i, end='2024-10-04'))
+            update_rollups(ticker)
+
+    def test_quote_follows_the_daily_rows(self):
+        ticker = CompanyTicker.objects.get_by_symbol('amd')
+        closes = load_rows(ticker).close
+        quote = LatestQuote.objects.get(stock_ticker=ticker)
+        self.assertEqual(quote.close, closes.iloc[-1])
+        self.assertAlmostEqual(quote.day_change, (closes.iloc[-1] / closes.iloc[-2] - 1) * 100, places=3)
+        self.assertAlmostEqual(quote.year_change, (closes.iloc[-1] / closes.iloc[-253] - 1) * 100, places=3)
+        self.assertEqual(len(quote.sparkline), 60)
+        refresh_prices(['amd'], fetcher=lambda stock_tickers, start: {'amd': synthetic_history(3, seed=5, end='2024-10-08')})
+        quote.refresh_from_db()
+        self.assertEqual(quote.date.date(), date(2024, 10, 8))
+        self.assertEqual(check_rollups(ticker), [])
+
+    def test_hub_queries_dont_grow_with_tickers(self):
+        CompanyTicker.objects.get_by_symbol('amd').add_user(self.user)
+        with CaptureQueriesContext(connection) as one:
+            self.client.get(reverse('hub'))
+        for symbol in ['msft', 'nvda']:
+            CompanyTicker.objects.get_by_symbol(symbol).add_user(self.user)
+        with CaptureQueriesContext(connection) as three:
+            response = self.client.get(reverse('hub'))
+        self.assertEqual(len(three), len(one))
+        self.assertContains(response, '<polyline', count=3)
+
+    def test_hub_of_a_user_who_never_traded_writes_nothing(self):
+        self.client.get(reverse('hub'))
+        self.assertFalse(Portfolio.objects.exists())
+        self.assertEqual(self.client.get(reverse('portfolio_equity')).json(), {'dates': [], 'value': [], 'invested': [], 'pnl': []})
@@ -0,0 +1,204 @@
+"""Per request timings: stages, database queries, the Server-Timing header and Prometheus metrics.
+
+TimingMiddleware starts a RequestTimings for every request in a context variable. Code marks
+stages with `with stage('figure'):`, every query run while a request is active is added to the
+'db' stage, so stages may overlap (a 'load' includes its queries). Context variables follow
+the request into sync_to_async and run_blocking threads.
+
+Staff users can add ?profile=1 to any URL to get a cProfile report instead of the page, or
+?profile=raw for a pstats file to open with snakeviz or pstats.
+"""
+import cProfile
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+import io
+import marshal
+import pstats
+from threading import Lock
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.http import HttpResponse
+
+from .chart_cache import chart_cache_stats
+
+# Request duration histogram bounds in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+PROFILE_MODES = ('1', 'raw')
+PROFILE_LINES = 60
+
+_current = ContextVar('request_timings', default=None)
+_metrics_lock = Lock()
+_requests = defaultdict(int) # (view, status) -> count
+_durations = defaultdict(lambda: [0.0, 0, [0] * len(BUCKETS)]) # view -> [sum, count, bucket counts]
+_stages = defaultdict(float) # (view, stage) -> seconds
+_queries = defaultdict(int) # view -> count
+
+
+class RequestTimings:
+    """Accumulates one request's stage durations and query count, safe to update from several threads."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = defaultdict(float)
+        self.queries = 0
+        self._lock = Lock()
+
+    def add(self, name, seconds, queries=0):
+        with self._lock:
+            self.stages[name] += seconds
+            self.queries += queries
+
+    def server_timing(self, total):
+        """Server-Timing header value, durations in milliseconds."""
+        entries = [f'{name};dur={seconds * 1000:.1f}' for name, seconds in self.stages.items()]
+        if 'db' in self.stages:
+            entries[list(self.stages).index('db')] += f';desc="{self.queries} queries"'
+        return ', '.join([*entries, f'total;dur={total * 1000:.1f}'])
+
+
+@contextmanager
+def stage(name):
+    """Adds the time spent in the block to the current request's stage name, a no-op outside a request."""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - start)
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper, times every query run for a request."""
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.add('db', time.perf_counter() - start, queries=1)
+
+def install_query_timer(sender, connection, **kwargs):
+    """connection_created receiver, adds record_query to every new connection."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class TimingMiddleware:
+    """Times every request, adds the Server-Timing header and records the metrics served by metrics_text."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        timings = RequestTimings()
+        token = _current.set(timings)
+        try:
+            if request.GET.get('profile') in PROFILE_MODES and request.user.is_staff:
+                profiler = cProfile.Profile()
+                response = profiler.runcall(self.get_response, request)
+                response = profile_response(profiler, request)
+            else:
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return finish(request, response, timings)
+
+    async def __acall__(self, request):
+        timings = RequestTimings()
+        token = _current.set(timings)
+        try:
+            if request.GET.get('profile') in PROFILE_MODES and (await request.auser()).is_staff:
+                # Profiles the event loop thread, work handed to run_blocking threads shows up as waiting.
+                profiler = cProfile.Profile()
+                profiler.enable()
+                try:
+                    response = await self.get_response(request)
+                finally:
+                    profiler.disable()
+                response = profile_response(profiler, request)
+            else:
+                response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return finish(request, response, timings)
+
+
+def finish(request, response, timings):
+    """Adds the Server-Timing header and records the request in the metrics."""
+    total = time.perf_counter() - timings.start
+    response.headers['Server-Timing'] = timings.server_timing(total)
+    match = request.resolver_match
+    view = match.view_name if match is not None else 'unmatched'
+    with _metrics_lock:
+        _requests[view, response.status_code] += 1
+        duration = _durations[view]
+        duration[0] += total
+        duration[1] += 1
+        for i, bound in enumerate(BUCKETS):
+            if total <= bound:
+                duration[2][i] += 1
+        for name, seconds in timings.stages.items():
+            _stages[view, name] += seconds
+        _queries[view] += timings.queries
+    return response
+
+def profile_response(profiler, request):
+    """The profiler's report as text, or the raw pstats data with ?profile=raw."""
+    if request.GET.get('profile') == 'raw':
+        profiler.create_stats()
+        response = HttpResponse(marshal.dumps(profiler.stats), content_type='application/octet-stream')
+        response.headers['Content-Disposition'] = 'attachment; filename="request.prof"'
+        return response
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(PROFILE_LINES)
+    return HttpResponse(stream.getvalue(), content_type='text/plain')
+
+def metrics_text():
+    """This process's request metrics and chart cache counters in the Prometheus text format."""
+    lines = [
+        '# HELP stock_requests_total Requests served by view and status.',
+        '# TYPE stock_requests_total counter',
+    ]
+    with _metrics_lock:
+        lines += [f'stock_requests_total{{view="{view}",status="{status}"}} {count}' for (view, status), count in sorted(_requests.items())]
+        lines += [
+            '# HELP stock_request_duration_seconds Request duration by view.',
+            '# TYPE stock_request_duration_seconds histogram',
+        ]
+        for view, (total, count, buckets) in sorted(_durations.items()):
+            lines += [f'stock_request_duration_seconds_bucket{{view="{view}",le="{bound}"}} {hits}' for bound, hits in zip(BUCKETS, buckets)]
+            lines += [
+                f'stock_request_duration_seconds_bucket{{view="{view}",le="+Inf"}} {count}',
+                f'stock_request_duration_seconds_sum{{view="{view}"}} {total:.6f}',
+                f'stock_request_duration_seconds_count{{view="{view}"}} {count}',
+            ]
+        lines += [
+            '# HELP stock_stage_seconds_total Time spent per request stage by view, db includes every query.',
+            '# TYPE stock_stage_seconds_total counter',
+        ]
+        lines += [f'stock_stage_seconds_total{{view="{view}",stage="{name}"}} {total:.6f}' for (view, name), total in sorted(_stages.items())]
+        lines += [
+            '# HELP stock_db_queries_total Database queries by view.',
+            '# TYPE stock_db_queries_total counter',
+        ]
+        lines += [f'stock_db_queries_total{{view="{view}"}} {count}' for view, count in sorted(_queries.items())]
+    cache = chart_cache_stats()
+    lines += [
+        '# HELP stock_chart_cache_requests_total Chart cache lookups by result.',
+        '# TYPE stock_chart_cache_requests_total counter',
+        f'stock_chart_cache_requests_total{{result="hit"}} {cache["hits"]}',
+        f'stock_chart_cache_requests_total{{result="miss"}} {cache["misses"]}',
+    ]
+    return '\n'.join(lines) + '\n'
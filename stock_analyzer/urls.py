@@ -11,5 +11,12 @@ urlpatterns = [
         path('tickers/', views.TickerListView.as_view(), name='tickers'),
         path('tickers/<str:stock_ticker>/five_year/', views.individual_fiveyear_view, name='five_year'),
         path('tickers/<str:stock_ticker>/five_year_split/', views.individual_split_view, name='five_year_split'),
+        path('tickers/<str:stock_ticker>/series.json', views.series_view, name='series'),
+        path('portfolio/transaction/', views.add_transaction_view, name='add_transaction'),
+        path('portfolio/equity.json', views.portfolio_equity_view, name='portfolio_equity'),
         path("compare/", views.compare_tickers_view, name='compare_select'),
+        path('compare/series.json', views.compare_series_view, name='compare_series'),
+        path('screener/', views.screener_view, name='screener'),
+        path('screener.json', views.screener_json_view, name='screener_json'),
+        path('metrics', views.metrics_view, name='metrics'),
         ]
\ No newline at end of file
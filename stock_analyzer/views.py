@@ -1,5 +1,10 @@
+import asyncio
+from datetime import datetime, time, timedelta
 from django.db.models.query import QuerySet
-from django.shortcuts import render, redirect
+import json
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
+from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
 from django.views.generic import ListView
 from django.views.generic.edit import CreateView, UpdateView, DeleteView
@@ -7,67 +12,196 @@ from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.models import User
-from django.http import HttpResponseRedirect
-from django.urls import reverse_lazy
-from .models import CompanyTicker, StockDataframe
-from .forms import TickerInputForm, TickerCompareForm
+from django.http import HttpResponseRedirect, HttpResponse
+from django.urls import reverse, reverse_lazy
+from django.utils.http import urlencode
+from django.conf import settings
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.views.decorators.gzip import gzip_page
+from django.utils.dateparse import parse_date
+from .models import CompanyTicker, StockDataframe, IngestJob, PriceRollup, YearlyStat, Portfolio, Transaction, normalize_symbol
+from .ingest import enqueue
+from .columnar import PRICE_FIELDS
+from .storage import load_history
+from .chart_cache import cached_chart
+from .downsample import METHODS, downsample, target_points
+from .indicators import INDICATORS, parse_spec, ticker_indicator
+from .rollups import load_rollup
+from .intraday import INTRADAY_INTERVALS, choose_interval, load_intraday
+from .portfolio import CURVE_FIELDS, empty_valuation, value_portfolio
+from .compare import NORMALIZATIONS, compare_tickers
+from .screener import METRICS, screen
+from .workers import run_blocking
+from .timing import metrics_text, stage
+from .forms import TickerInputForm, TickerCompareForm, TransactionForm, ScreenerForm
 
 
-import yfinance as yf
-import pandas as pd
-import plotly.express as px
+# Calendar periods a chart can be split by -> pandas period frequency
+PERIODS = {'year': 'Y', 'quarter': 'Q', 'month': 'M', 'week': 'W'}
+# Series bar intervals -> PriceRollup period, None reads the daily rows (see INTRADAY_INTERVALS for the rest)
+INTERVALS = {'1d': None, '1wk': PriceRollup.WEEK, '1mo': PriceRollup.MONTH}
 
 
 # Functions for Views
 
 def check_company_tickers(stock_ticker):
     """Checks if the ticker is already stored in the database."""
-    tickers = CompanyTicker.objects.values('stock_ticker')
-    ticker_list = [tickers[x]['stock_ticker'] for x in range(len(tickers))] # Ensures Ticker is not already in database.
-    if stock_ticker in ticker_list: # If so returns a new blank form
-        return True
-    else:
-        return False
+    return CompanyTicker.objects.has_symbol(stock_ticker)
 
-def get_stock_df(stock_ticker):
-    """Creates the dataframe based off the stock ticker input."""
-    ticker = CompanyTicker.objects.get(stock_ticker=str(stock_ticker).lower())
-    stocks = StockDataframe.objects.filter(stock_ticker_id=ticker.id).values()
-    df = pd.DataFrame(stocks)
+def get_stock_df(stock_ticker, start=None, end=None, fields=PRICE_FIELDS):
+    """Creates the date indexed dataframe of fields for the stock ticker, optionally limited to dates in [start, end)."""
+    ticker = CompanyTicker.objects.get_by_symbol(stock_ticker)
+    df = load_history(ticker, start, end, fields)
     return df
 
-def get_stock_df_yearly(stock_ticker):
-    """Create dataframes by year for a specific stock."""
-    df = get_stock_df(stock_ticker)
-    df['year'] = df.date.apply(lambda x: x.strftime('%Y'))
-    year_list = list(df.year.unique())
-    yearly_dataframes = [df.close.max()]
-    for year in year_list:
-        year_df = df[df.year == year]
-        yearly_dataframes.append(year_df)
-    return yearly_dataframes
-
-def create_five_year_graph(stock_ticker):
-    """Plots five years worth of data onto a single graph for a single stock."""
-    title = f'Five Year Data for {str(stock_ticker).upper()}'
-    df = get_stock_df(stock_ticker)
-    plot = px.line(df, x='date', y='close', title=title)
-    return plot.to_html(full_html=False)
-
-def create_five_year_split(stock_ticker, yearly_dataframes):
-    """Plots the yearly dataframes onto a graph, takes get_stock_df_yearly function as an arg."""
-    graphs = []
-    for x in range(1, len(yearly_dataframes)):
-        title = f"{yearly_dataframes[x].year.iloc[0]} Data for {stock_ticker}"
-        plot = px.line(yearly_dataframes[x], x='date', y='close', title=title, height=425,width=750)
-        plot.update_layout(yaxis_range=[0, yearly_dataframes[0]])
-        graphs.append(plot.to_html(full_html=False))
-    return graphs
+def split_by_period(df, period='year'):
+    """Splits a date indexed frame into (label, frame) pairs per calendar period in one groupby pass."""
+    periods = df.index.tz_localize(None).to_period(PERIODS[period])
+    return [(str(label), group) for label, group in df.groupby(periods, sort=True)]
+
+def get_date_range(request):
+    """Reads optional ?start=YYYY-MM-DD&end=YYYY-MM-DD query params, invalid dates are ignored."""
+    dates = []
+    for key in ('start', 'end'):
+        try:
+            day = parse_date(request.GET.get(key, ''))
+        except ValueError:
+            day = None
+        dates.append(timezone.make_aware(datetime.combine(day, time.min)) if day else None)
+    return dates
+
+def get_series_fields(request):
+    """Reads the ?fields=close,open query param, unknown fields are dropped and close is the default."""
+    fields = [field for field in request.GET.get('fields', '').split(',') if field in PRICE_FIELDS]
+    return fields or ['close']
+
+def get_downsampling(request):
+    """Reads ?points=N or ?width=<chart px> and ?method=lttb|ohlc, no points means full resolution."""
+    method = request.GET.get('method') if request.GET.get('method') in METHODS else 'lttb'
+    for key, to_points in (('points', int), ('width', target_points)):
+        value = request.GET.get(key, '')
+        if value.isdigit():
+            return max(to_points(int(value)), 3), method
+    return None, method
+
+def get_interval(request):
+    """Reads ?interval=1m|5m|1h|1d|1wk|1mo, 'auto' (picked from the date range) by default."""
+    interval = request.GET.get('interval')
+    return interval if interval in INTERVALS or interval in INTRADAY_INTERVALS else 'auto'
+
+def get_period(request):
+    """Reads ?period=year|quarter|month|week, None when absent or unknown."""
+    period = request.GET.get('period')
+    return period if period in PERIODS else None
+
+def get_indicator_specs(request):
+    """Reads ?indicators=sma:50,rsi:14, invalid specs are dropped."""
+    specs = []
+    for spec in request.GET.get('indicators', '').split(','):
+        try:
+            parse_spec(spec)
+        except ValueError:
+            continue
+        specs.append(spec)
+    return specs
+
+def get_compare_symbols(request):
+    """Reads ?tickers=amd,msft as normalized symbols."""
+    return [normalize_symbol(symbol) for symbol in request.GET.get('tickers', '').split(',') if symbol.strip()]
+
+def get_normalize(request):
+    """Reads ?normalize=rebase|return, rebase when absent or unknown."""
+    normalize = request.GET.get('normalize', 'rebase')
+    return normalize if normalize in NORMALIZATIONS else 'rebase'
+
+def get_portfolio_value(user):
+    """Valuation of the user's portfolio, see portfolio.value_portfolio. Only reads, the first trade creates the portfolio."""
+    portfolio = Portfolio.objects.filter(user=user).first()
+    return empty_valuation() if portfolio is None else value_portfolio(portfolio)
+
+def get_screen(user, form):
+    """The user's tickers matching a valid ScreenerForm, see screener.screen."""
+    symbols = list(user.tickers.values_list('stock_ticker', flat=True))
+    return screen(form.cleaned_data['filter'], form.cleaned_data['sort'], form.cleaned_data['limit'], symbols)
+
+def series_values(column):
+    """List of a numeric column rounded for JSON, NaN becomes null."""
+    column = column.round(4)
+    return column.astype(object).where(column.notna(), None).tolist()
+
+def series_columns(df, fields, date_format='%Y-%m-%d'):
+    """Columnar dict of a date indexed frame, one array of dates plus one per field."""
+    series = {'dates': df.index.strftime(date_format).tolist()}
+    for field in fields:
+        series[field] = series_values(df[field].astype('Int64') if field == 'volume' else df[field])
+    return series
+
+def build_series(ticker, start=None, end=None, fields=('close',), points=None, method='lttb', period=None, indicators=(), interval='1d'):
+    """Serializes the ticker's bars as compact columnar JSON.
+
+    Weekly and monthly intervals read the PriceRollup bars instead of the daily rows, intraday
+    ones the IntradayBlocks, and 'auto' picks one from the span of start and end.
+    With a period the bars are split into one group per calendar period, plus the top close
+    so every panel can share a y range. Otherwise indicators of daily bars are added, computed
+    over the whole history and aligned to the returned dates.
+    """
+    if interval == 'auto':
+        interval = choose_interval(ticker, start, end)
+    date_format = '%Y-%m-%dT%H:%M:%SZ' if interval in INTRADAY_INTERVALS else '%Y-%m-%d'
+    with stage('load'):
+        if interval in INTRADAY_INTERVALS:
+            df = load_intraday(ticker, interval, start, end, fields)
+            indicators = ()
+        elif INTERVALS[interval] is None:
+            df = load_history(ticker, start, end, fields)
+        else:
+            df = load_rollup(ticker, INTERVALS[interval], start, end, fields)
+            indicators = ()
+    with stage('downsample'):
+        df = downsample(df, points, method)
+    series = {'ticker': ticker.stock_ticker.upper(), 'interval': interval}
+    if period is None:
+        series.update(series_columns(df, fields, date_format))
+        series['indicators'] = {}
+        for spec in indicators:
+            with stage('indicators'):
+                values = ticker_indicator(ticker, spec).reindex(df.index)
+            series['indicators'][spec] = {
+                'axis': INDICATORS[parse_spec(spec)[0]].axis,
+                'outputs': {output: series_values(values[output]) for output in values.columns},
+            }
+    else:
+        series['period'] = period
+        series['top'] = None if df.empty else round(float(df[fields[0]].max()), 4)
+        series['groups'] = [{'label': label, **series_columns(group, fields, date_format)} for label, group in split_by_period(df, period)]
+    with stage('serialize'):
+        return json.dumps(series, separators=(',', ':'))
+
+def get_series(ticker, start=None, end=None, fields=('close',), points=None, method='lttb', period=None, indicators=(), interval='auto'):
+    """build_series through the chart cache, keyed by every parameter so warm.warm_ticker fills the same entries."""
+    return cached_chart(
+        ticker, 'series', lambda: build_series(ticker, start, end, fields, points, method, period, indicators, interval),
+        start, end, ','.join(fields), points, method, period, ','.join(indicators), interval,
+    )
+
+def render_page(request, template_name, context=None):
+    """render() with the time spent in the template recorded as the request's render stage."""
+    with stage('render'):
+        return render(request, template_name, context)
+
+def get_series_url(stock_ticker, request, **defaults):
+    """Series endpoint URL for the ticker carrying over the page's query params, defaults fill in missing ones."""
+    url = reverse('series', args=[stock_ticker])
+    params = request.GET.copy()
+    for key, value in defaults.items():
+        params.setdefault(key, value)
+    return f"{url}?{params.urlencode()}" if params else url
 
 # Views
 
 def homepage(request):
-    return render(request, 'stock_analyzer/home.html')
+    return render_page(request, 'stock_analyzer/home.html')
 
 class SignUp(CreateView):
     """Create a new user form."""
@@ -76,14 +210,24 @@ class SignUp(CreateView):
     success_url = reverse_lazy('login')
 
 @login_required
-def hub_view(request):
-    """Displays the users tracked stocks and portfolio."""
-    user = request.user
-    user_stocks = list(CompanyTicker.objects.filter(users=user))
+async def hub_view(request):
+    """Displays the users tracked stocks with their latest quotes and the portfolio, loading them concurrently."""
+    user = await request.auser()
+    recent = timezone.now() - timedelta(days=1)
+    jobs = IngestJob.objects.filter(users=user, updated__gte=recent).exclude(status=IngestJob.DONE).order_by('created')
+    user_stocks, jobs, portfolio = await asyncio.gather(
+        run_blocking(list, CompanyTicker.objects.filter(users=user).select_related('quote')), # One query however many tickers.
+        run_blocking(list, jobs),
+        run_blocking(get_portfolio_value, user),
+    )
     context = {
             'user_stocks': user_stocks,
+            'jobs': jobs,
+            'jobs_active': any(job.status in IngestJob.ACTIVE for job in jobs),
+            'portfolio': portfolio,
+            'transaction_form': TransactionForm(user),
             }
-    return render(request, 'stock_analyzer/hub.html', context=context)
+    return await sync_to_async(render_page)(request, 'stock_analyzer/hub.html', context=context)
 
 class TickerListView(LoginRequiredMixin, ListView):
     """View list of all available stock tickers."""
@@ -94,63 +238,163 @@ class TickerListView(LoginRequiredMixin, ListView):
         user = self.request.user
         return CompanyTicker.objects.filter(users=user)
 
-@login_required #This still needs to be cleaned up more.
+@login_required
 def get_stock_view(request):
-    """Builds 52 week data into StockDatabase, creates graph and adds graph path to CompanyTicker object"""
+    """Adds a stored ticker to the user, or queues a background job to fetch five years of data for it."""
     if request.method == "POST":
         form = TickerInputForm(request.POST)
         if form.is_valid():
-            stock_ticker = str(form.cleaned_data['stock_ticker']).lower()
+            stock_ticker = normalize_symbol(form.cleaned_data['stock_ticker'])
             user = request.user
-            if check_company_tickers(request, stock_ticker):
-                ct = CompanyTicker()
-                ct.add_user(stock_ticker, user)
-                return redirect('tickers')
-            stock = yf.Ticker(stock_ticker)
-            df = stock.history('5y', '1d')
-            if len(df) == 0:
-                return render(request, 'stock_analyzer/add_stock.html', {'form': TickerInputForm()})
-            ct = CompanyTicker()
-            ct.stock_ticker = stock_ticker
-            ct.save()
-            ct.users.add(user)
-            for x in range(len(df)):
-                sdf = StockDataframe()
-                sdf.build_database(stock_ticker, df, x)
+            if check_company_tickers(stock_ticker):
+                try:
+                    CompanyTicker.objects.get_by_symbol(stock_ticker).add_user(user)
+                    return redirect('tickers')
+                except CompanyTicker.DoesNotExist:
+                    pass # Deleted by another process since its id was cached, fetch it again.
+            enqueue(stock_ticker, user) # Hub shows the job as pending until the worker stores the data.
+            return redirect('hub')
         return redirect('tickers')              
     else:
         form = TickerInputForm()
-    return render(request, 'stock_analyzer/add_stock.html', {'form': form})
+    return render_page(request, 'stock_analyzer/add_stock.html', {'form': form})
 
 @login_required
 def individual_fiveyear_view(request, stock_ticker):
     """Sends single stock five year graph to template"""
-    context = {'graph': create_five_year_graph(stock_ticker)}
-    return render(request, 'stock_analyzer/stock_graph.html', context)
+    ticker = get_object_or_404(CompanyTicker, stock_ticker=normalize_symbol(stock_ticker))
+    context = {'ticker': ticker, 'series_url': get_series_url(ticker.stock_ticker, request)}
+    return render_page(request, 'stock_analyzer/stock_graph.html', context)
 
 @login_required 
 def individual_split_view(request, stock_ticker):
-    """Sends five year data split graphs to template."""
-    context = {'graphs': create_five_year_split(stock_ticker, get_stock_df_yearly(stock_ticker))}
-    return render(request, 'stock_analyzer/split_graph.html', context=context)
+    """Sends five year data split by ?period= (year by default) to template."""
+    ticker = get_object_or_404(CompanyTicker, stock_ticker=normalize_symbol(stock_ticker))
+    start, end = get_date_range(request)
+    stats = YearlyStat.objects.filter(stock_ticker=ticker)
+    if start is not None:
+        stats = stats.filter(year__gte=start.year)
+    if end is not None:
+        stats = stats.filter(year__lte=end.year)
+    context = {
+        'ticker': ticker,
+        'series_url': get_series_url(ticker.stock_ticker, request, period='year'),
+        'yearly_stats': stats,
+    }
+    return render_page(request, 'stock_analyzer/split_graph.html', context)
+
+@login_required
+@gzip_page
+async def series_view(request, stock_ticker):
+    """Returns the ticker's price series as columnar JSON, 304 when the client's ETag is current."""
+    ticker = await aget_object_or_404(CompanyTicker, stock_ticker=normalize_symbol(stock_ticker))
+    etag = f'"{ticker.stock_ticker}-{ticker.data_version}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        start, end = get_date_range(request)
+        fields = get_series_fields(request)
+        points, method = get_downsampling(request)
+        period = get_period(request)
+        indicators = get_indicator_specs(request)
+        interval = get_interval(request)
+        series = await run_blocking(get_series, ticker, start, end, fields, points, method, period, indicators, interval)
+        response = HttpResponse(series, content_type='application/json')
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = 'private, no-cache' # Revalidate every time, the ETag makes that cheap.
+    return response
 
 @login_required
-def compare_tickers_view(request):
-    """Accepts user form input for stocks to compare, creates five year graph, and redirects to compare page."""
-    user = request.user
+def add_transaction_view(request):
+    """Records a buy or sell in the user's portfolio from the hub's form, its errors are shown on the hub."""
     if request.method == "POST":
-        form = TickerCompareForm(request.POST)
+        form = TransactionForm(request.user, request.POST)
         if form.is_valid():
-            ticker_list=[form.cleaned_data['ticker1'], form.cleaned_data['ticker2']]
-            graphs = []
-            for x in range(len(ticker_list)):
-                graphs.append(create_five_year_graph(ticker_list[x]))
-            return render(request, "stock_analyzer/compare.html", {'graphs': graphs})
+            portfolio, _ = Portfolio.objects.get_or_create(user=request.user)
+            Transaction.objects.record(portfolio, **form.cleaned_data)
+        for field, errors in form.errors.items():
+            label = form[field].label if field in form.fields else 'Transaction'
+            for error in errors:
+                messages.error(request, f"{label}: {error}")
+    return redirect('hub')
+
+@login_required
+@gzip_page
+async def portfolio_equity_view(request):
+    """Returns the user's daily portfolio value, net invested cash and P&L as columnar JSON."""
+    curve = (await run_blocking(get_portfolio_value, await request.auser()))['curve']
+    series = {'dates': [], **dict.fromkeys(CURVE_FIELDS, [])} if curve is None else series_columns(curve, curve.columns)
+    return HttpResponse(json.dumps(series, separators=(',', ':')), content_type='application/json')
+
+@login_required
+async def compare_tickers_view(request):
+    """Accepts user form input for stocks to compare, renders their performance and correlation tables and an overlaid chart."""
+    user = await request.auser()
+    if request.method == "POST":
+        form = TickerCompareForm(user, request.POST)
+        if await run_blocking(form.is_valid):
+            tickers = await run_blocking(list, form.cleaned_data['tickers'])
+            normalize = form.cleaned_data['normalize']
+            comparison = await run_blocking(compare_tickers, tickers, how=normalize)
+            correlation = comparison['correlation']
+            params = {'tickers': ','.join(ticker.stock_ticker for ticker in tickers), 'normalize': normalize}
+            context = {
+                'symbols': list(correlation.columns),
+                'correlation': list(zip(correlation.index, correlation.to_numpy().tolist())),
+                'performance': comparison['performance'].reset_index(names='symbol').to_dict('records'),
+                'series_url': f"{reverse('compare_series')}?{urlencode(params)}",
+                'title': NORMALIZATIONS[normalize],
+            }
+            return await sync_to_async(render_page)(request, "stock_analyzer/compare.html", context)
     else:
-        form = TickerCompareForm()
-        form.fields['ticker1'].queryset = CompanyTicker.objects.filter(users=user)
-        form.fields['ticker2'].queryset = CompanyTicker.objects.filter(users=user)
-        return render(request, "stock_analyzer/choose_compare.html", {'form': form})
+        form = TickerCompareForm(user)
+    return await sync_to_async(render_page)(request, "stock_analyzer/choose_compare.html", {'form': form})
+
+@login_required
+@gzip_page
+async def compare_series_view(request):
+    """Returns the normalized closes of ?tickers= aligned on date as columnar JSON, one array per symbol, 400 if none are the user's."""
+    start, end = get_date_range(request)
+    normalize = get_normalize(request)
+    tickers = CompanyTicker.objects.filter(users=await request.auser(), stock_ticker__in=get_compare_symbols(request))
+    tickers = [ticker async for ticker in tickers]
+    if not tickers:
+        errors = {'tickers': ["None of ?tickers= are stored tickers you follow."]}
+        return HttpResponse(json.dumps({'errors': errors}), content_type='application/json', status=400)
+    series = (await run_blocking(compare_tickers, tickers, start, end, normalize))['series']
+    payload = {'normalize': normalize, **series_columns(series, series.columns)}
+    return HttpResponse(json.dumps(payload, separators=(',', ':')), content_type='application/json')
+
+@login_required
+async def screener_view(request):
+    """Screens the user's tickers with the form's filter expression, renders the matching rows with every metric."""
+    user = await request.auser()
+    form = ScreenerForm(request.GET or None)
+    rows = None
+    if form.is_valid():
+        table = await run_blocking(get_screen, user, form)
+        rows = [(symbol.upper(), values) for symbol, values in zip(table.index, table.to_numpy().tolist())]
+    context = {'form': form, 'metrics': METRICS, 'rows': rows, 'json_url': f"{reverse('screener_json')}?{request.GET.urlencode()}"}
+    return await sync_to_async(render_page)(request, 'stock_analyzer/screener.html', context)
+
+@login_required
+async def screener_json_view(request):
+    """Returns the screen of ?filter=&sort=&limit= as JSON rows, 400 with the form errors for an invalid filter."""
+    form = ScreenerForm(request.GET)
+    if not form.is_valid():
+        return HttpResponse(json.dumps({'errors': form.errors}), content_type='application/json', status=400)
+    table = await run_blocking(get_screen, await request.auser(), form)
+    rows = [
+        {'symbol': symbol.upper(), **{metric: series_values(table[metric])[i] for metric in METRICS}}
+        for i, symbol in enumerate(table.index)
+    ]
+    return HttpResponse(json.dumps({'metrics': list(METRICS), 'rows': rows}, separators=(',', ':')), content_type='application/json')
+
+def metrics_view(request):
+    """Serves this process's request and chart cache metrics to Prometheus, or to a staff user."""
+    token = settings.METRICS_TOKEN
+    if not (request.user.is_staff or token and request.headers.get('Authorization') == f'Bearer {token}'):
+        return HttpResponse(status=403)
+    return HttpResponse(metrics_text(), content_type='text/plain; version=0.0.4')
 
 @login_required
 def logout_request(request): 
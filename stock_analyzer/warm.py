@@ -0,0 +1,44 @@
+"""Fills the caches with what pages ask for first, so the first visit after a refresh is a cache hit.
+
+For every ticker that's the series of the five year page (at each settings.CHART_WARM_WIDTHS)
+and of the split page, then the screener table and the valuations of portfolios holding the
+tickers. Ingest workers warm the tickers they stored once the data is committed, `manage.py
+warm_cache` warms every followed ticker after a deploy. Warming only helps the processes that
+read the same cache: the web process itself with the local memory backend, or every process
+with a shared one.
+"""
+import time
+
+from django.conf import settings
+
+from .downsample import target_points
+from .models import CompanyTicker, Portfolio
+from .portfolio import value_portfolio
+from .screener import screener_metrics
+from .views import get_series
+
+
+def warm_ticker(ticker, widths=None):
+    """Builds the CompanyTicker's default five year and split page series into the chart cache, returns how many."""
+    widths = settings.CHART_WARM_WIDTHS if widths is None else widths
+    for width in widths:
+        get_series(ticker, points=target_points(width))
+    get_series(ticker, period='year')
+    return len(widths) + 1
+
+def warm_tickers(tickers=None, widths=None):
+    """Warms the CompanyTickers (default every ticker a user follows), the screener and their portfolios' valuations.
+
+    Returns the tickers, series and portfolios warmed and the seconds it took.
+    """
+    start = time.perf_counter()
+    if tickers is None:
+        tickers = CompanyTicker.objects.filter(users__isnull=False).distinct()
+    tickers = list(tickers)
+    series = sum(warm_ticker(ticker, widths) for ticker in tickers)
+    portfolios = list(Portfolio.objects.filter(holdings__stock_ticker__in=tickers).distinct())
+    for portfolio in portfolios:
+        value_portfolio(portfolio)
+    if tickers:
+        screener_metrics()
+    return {'tickers': len(tickers), 'series': series, 'portfolios': len(portfolios), 'seconds': round(time.perf_counter() - start, 2)}
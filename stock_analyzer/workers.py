@@ -0,0 +1,59 @@
+"""Runs blocking work for async views and fans out provider fetches without blocking the event loop.
+
+Database loads, pandas and Plotly all block, async views hand them to a pool of
+settings.CHART_WORKER_THREADS threads so a slow chart can't stall other requests.
+With 0 threads they go to Django's thread sensitive sync_to_async executor instead,
+which is what tests use so they see the test transaction.
+"""
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from threading import Lock
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+_executor = None
+_executor_lock = Lock()
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Awaits func(*args, **kwargs) run on the chart worker pool."""
+    if settings.CHART_WORKER_THREADS <= 0:
+        return await sync_to_async(func)(*args, **kwargs)
+    loop = asyncio.get_running_loop()
+    # Unlike sync_to_async, run_in_executor doesn't carry context variables (request timings) over.
+    call = partial(contextvars.copy_context().run, _with_connections, func, *args, **kwargs)
+    return await loop.run_in_executor(chart_executor(), call)
+
+def chart_executor():
+    """The process wide pool for run_blocking, created on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.CHART_WORKER_THREADS, thread_name_prefix='charts')
+    return _executor
+
+def gather_blocking(calls, limit):
+    """Runs (func, *args) calls on threads, at most limit at once, returns results or raised exceptions in order.
+
+    For network bound provider fetches from sync code, the calls must not touch the database.
+    """
+    async def run_all():
+        semaphore = asyncio.Semaphore(max(limit, 1))
+
+        async def run(func, *args):
+            async with semaphore:
+                return await asyncio.to_thread(func, *args)
+        return await asyncio.gather(*(run(*call) for call in calls), return_exceptions=True)
+    return asyncio.run(run_all())
+
+def _with_connections(func, *args, **kwargs):
+    # Pool threads live outside the request cycle, close connections past CONN_MAX_AGE like it does.
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
@@ -10,7 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -51,6 +51,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'stock_analyzer.timing.TimingMiddleware', # After auth, ?profile=1 is for staff only.
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -79,12 +80,73 @@ WSGI_APPLICATION = 'stock_project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DATABASE_ENGINE picks 'sqlite' (the default) or 'postgres'. SQLite connections get the
+# SQLITE_PRAGMAS below, WAL lets chart reads carry on while an ingest is writing.
+# PostgreSQL keeps connections open for DATABASE_CONN_MAX_AGE seconds, or with
+# DATABASE_POOL_SIZE > 0 shares a psycopg connection pool of that size instead.
+DATABASE_ENGINE = config('DATABASE_ENGINE', default='sqlite')
+# Seconds a SQLite connection waits on a lock before 'database is locked', sets both the
+# driver's timeout and the busy_timeout pragma.
+SQLITE_TIMEOUT = config('SQLITE_TIMEOUT', default=20, cast=int)
+
+if DATABASE_ENGINE == 'postgres':
+    DATABASE_POOL_SIZE = config('DATABASE_POOL_SIZE', default=0, cast=int)
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': config('DATABASE_NAME', default='stock_project'),
+            'USER': config('DATABASE_USER', default=''),
+            'PASSWORD': config('DATABASE_PASSWORD', default=''),
+            'HOST': config('DATABASE_HOST', default='localhost'),
+            'PORT': config('DATABASE_PORT', default='5432'),
+            # Django's pool and persistent connections are mutually exclusive.
+            'CONN_MAX_AGE': 0 if DATABASE_POOL_SIZE else config('DATABASE_CONN_MAX_AGE', default=60, cast=int),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {'pool': {'min_size': 1, 'max_size': DATABASE_POOL_SIZE}} if DATABASE_POOL_SIZE else {},
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': config('DATABASE_NAME', default=str(BASE_DIR / 'db.sqlite3')),
+            'OPTIONS': {
+                'timeout': SQLITE_TIMEOUT,
+                'transaction_mode': 'IMMEDIATE', # Take the write lock up front, a read lock can't fail to upgrade.
+            },
+        }
     }
+
+# Applied to every new SQLite connection by stock_analyzer.db.tune_sqlite.
+SQLITE_PRAGMAS = {
+    'journal_mode': config('SQLITE_JOURNAL_MODE', default='wal'),
+    'synchronous': config('SQLITE_SYNCHRONOUS', default='normal'),
+    'busy_timeout': SQLITE_TIMEOUT * 1000, # ms
+    'mmap_size': config('SQLITE_MMAP_SIZE', default=256 * 1024 * 1024, cast=int),
+    'cache_size': -20000, # KiB
+}
+
+
+# Caches
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+# Rendered charts go to their own size bounded cache, the local memory backend evicts
+# the least recently used entries once MAX_ENTRIES is reached.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'charts': {
+        'BACKEND': config('CHART_CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CHART_CACHE_LOCATION', default='charts'),
+        'TIMEOUT': 60 * 60 * 24,
+        'OPTIONS': {
+            'MAX_ENTRIES': config('CHART_CACHE_ENTRIES', default=200, cast=int),
+            'CULL_FREQUENCY': 10,
+        },
+    },
 }
+CHART_CACHE_ALIAS = 'charts'
 
 
 # Password validation
@@ -131,6 +193,45 @@ LOGIN_REDIRECT_URL = '/hub' # will redirect users to stock input from login view
 # Clear the session after a user closes the browser window.
 SESSION_EXPIRE_AT_BROWSER_CLOSE = True
 
+# Market data source for ingestion and refresh. FixtureProvider reads <symbol>.csv or
+# <symbol>.parquet history files from STOCK_FIXTURE_DIR and needs no network.
+STOCK_DATA_PROVIDER = config('STOCK_DATA_PROVIDER', default='stock_analyzer.providers.YahooProvider')
+STOCK_FIXTURE_DIR = config('STOCK_FIXTURE_DIR', default=str(BASE_DIR / 'price_fixtures'))
+
+# Where chart data is read from: 'orm' reads StockDataframe rows, 'blob' reads the packed
+# per ticker copy in PriceHistoryBlob (build it for existing data with `manage.py pack_prices`).
+STOCK_PRICE_STORAGE = config('STOCK_PRICE_STORAGE', default='orm')
+
+# Days intraday bars are kept at each interval before `manage.py refresh_intraday` compacts
+# them into the next coarser one (1m -> 5m -> 1h), 1h bars past theirs are dropped.
+INTRADAY_RETENTION = {
+    '1m': config('INTRADAY_RETENTION_1M', default=7, cast=int),
+    '5m': config('INTRADAY_RETENTION_5M', default=60, cast=int),
+    '1h': config('INTRADAY_RETENTION_1H', default=730, cast=int),
+}
+
+# Threads that run ticker ingestion jobs inside the web process, set to 0 to leave
+# the queue to `manage.py run_ingest_worker`.
+INGEST_WORKER_THREADS = config('INGEST_WORKER_THREADS', default=2, cast=int)
+
+# Provider fetches an ingest worker or price refresh runs at once.
+INGEST_FETCH_CONCURRENCY = config('INGEST_FETCH_CONCURRENCY', default=4, cast=int)
+
+# Seconds a job may stay running before a worker takes it over, e.g. after the process
+# running it crashed or restarted.
+INGEST_JOB_TIMEOUT = config('INGEST_JOB_TIMEOUT', default=600, cast=int)
+
+# Bearer token Prometheus sends to scrape /metrics, staff users can always open it.
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# Threads async views run database loads, pandas and Plotly on (see stock_analyzer.workers),
+# 0 runs them on Django's sync_to_async thread instead.
+CHART_WORKER_THREADS = config('CHART_WORKER_THREADS', default=4, cast=int)
+
+# Chart widths in pixels the five year page's series is precomputed for after an ingest or
+# refresh and by `manage.py warm_cache`, pages ask for their width rounded up to 100.
+CHART_WARM_WIDTHS = config('CHART_WARM_WIDTHS', default='1200', cast=Csv(int))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 